@@ -45,8 +45,12 @@ def create_app(test_config=None):
     from .routes import main
     app.register_blueprint(main)
 
+    from .commands import register_commands
+    register_commands(app)
+
     # Context Processor untuk Site Settings dan User
     from .models import SiteSetting, User
+    from .cache import get_settings
     from datetime import datetime, timedelta
     from flask import session
 
@@ -61,8 +65,8 @@ def create_app(test_config=None):
     def date_with_day_filter(date_str):
         if not date_str: return ""
         try:
-            # Parse 'YYYY-MM-DD'
-            dt = datetime.strptime(date_str, '%Y-%m-%d')
+            # Parse 'YYYY-MM-DD' (date/datetime objects, e.g. created_at, dipakai langsung)
+            dt = date_str if hasattr(date_str, 'weekday') else datetime.strptime(date_str, '%Y-%m-%d')
             # Indonesian day names
             days = ['Senin', 'Selasa', 'Rabu', 'Kamis', 'Jumat', 'Sabtu', 'Minggu']
             months = ['Januari', 'Februari', 'Maret', 'April', 'Mei', 'Juni', 'Juli', 'Agustus', 'September', 'Oktober', 'November', 'Desember']
@@ -74,9 +78,7 @@ def create_app(test_config=None):
 
     @app.context_processor
     def inject_global_context():
-        settings = SiteSetting.query.first()
-        if not settings:
-            settings = SiteSetting()
+        settings = get_settings()
             
         current_user = None
         if session.get('user_id'):
@@ -87,6 +89,10 @@ def create_app(test_config=None):
     with app.app_context():
         db.create_all() # Buat tabel jika belum ada
         
+        # Upgrade tabel lama (index baru, dst.) yang tidak ditangani create_all
+        from .migrations import upgrade_schema
+        upgrade_schema()
+        
         # Ensure default settings exist
         if not SiteSetting.query.first():
             db.session.add(SiteSetting())
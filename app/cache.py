@@ -0,0 +1,168 @@
+import os
+import threading
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from flask import current_app
+from .models import SiteSetting, SpecialDate, Ticket, Addon
+
+# Cache per worker (per proses Gunicorn). Invalidasi antar worker memakai
+# file versi di folder instance: setiap perubahan menulis ulang file lewat
+# os.replace sehingga inode/mtime berubah, dan worker lain cukup melakukan
+# os.stat() untuk tahu cache-nya basi (tanpa query ke database).
+
+_lock = threading.RLock()
+
+SettingsSnapshot = namedtuple(
+    'SettingsSnapshot',
+    [c.name for c in SiteSetting.__table__.columns]
+)
+
+def _version_dir():
+    path = os.path.join(current_app.instance_path, 'cache_versions')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def get_version(name):
+    """Returns a token that changes every time bump_version(name) is called."""
+    try:
+        st = os.stat(os.path.join(_version_dir(), name))
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def bump_version(name):
+    """Marks every worker's cache for `name` as stale. Call after commit."""
+    folder = _version_dir()
+    tmp_path = os.path.join(folder, f".{name}.{uuid.uuid4().hex}")
+    with open(tmp_path, 'w') as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(tmp_path, os.path.join(folder, name))
+
+def _store():
+    return current_app.extensions.setdefault('tiket_cache', {})
+
+def cached(name, loader, key=None):
+    """Returns loader() result, rebuilt only when the version of `name` (or `key`) changes."""
+    version = (get_version(name), key)
+    store = _store()
+    entry = store.get(name)
+    if entry and entry[0] == version:
+        return entry[1]
+
+    with _lock:
+        entry = store.get(name)
+        if entry and entry[0] == version:
+            return entry[1]
+        value = loader()
+        store[name] = (version, value)
+        return value
+
+def _load_settings():
+    settings = SiteSetting.query.first()
+    if not settings:
+        settings = SiteSetting()
+    return SettingsSnapshot(**{f: getattr(settings, f) for f in SettingsSnapshot._fields})
+
+def get_settings():
+    """Immutable snapshot of SiteSetting, shared by all requests in this worker."""
+    return cached('settings', _load_settings)
+
+def invalidate_settings():
+    bump_version('settings')
+
+# --- CALENDAR INDEX ---
+
+CALENDAR_WINDOW_DAYS = 400
+
+def parse_closed_days(value):
+    return {int(d) for d in (value or '').split(',') if d.strip()}
+
+def compute_date_status(date_obj, special_type=None, closed_days=()):
+    if special_type:
+        return special_type
+    if date_obj.weekday() in closed_days:
+        return 'closed'
+    if date_obj.weekday() >= 5: # 5=Sat, 6=Sun
+        return 'weekend'
+    return 'regular'
+
+def _load_calendar(start, closed_days_str):
+    end = start + timedelta(days=CALENDAR_WINDOW_DAYS)
+    closed_days = parse_closed_days(closed_days_str)
+    specials = dict(
+        SpecialDate.query.with_entities(SpecialDate.date, SpecialDate.type)
+        .filter(SpecialDate.date >= start, SpecialDate.date < end)
+        .all()
+    )
+
+    index = {}
+    day = start
+    while day < end:
+        index[day] = compute_date_status(day, specials.get(day), closed_days)
+        day += timedelta(days=1)
+    return index
+
+def get_calendar_index():
+    """Map of date -> 'closed' / 'high_season' / 'weekend' / 'regular' for the next 400 days."""
+    # Mulai dari kemarin supaya pergantian hari antar zona waktu tetap tercakup
+    start = datetime.now().date() - timedelta(days=1)
+    closed_days_str = get_settings().weekly_closed_days or ''
+    return cached('calendar', lambda: _load_calendar(start, closed_days_str), key=(start, closed_days_str))
+
+def invalidate_calendar():
+    bump_version('calendar')
+
+# --- PRICE TABLE ---
+
+DATE_TYPES = ('regular', 'weekend', 'high_season')
+VARIANTS = ('adult', 'child', 'umum')
+PRICE_ROLES = ('public', 'reseller')
+
+CatalogItem = namedtuple('CatalogItem', ['slug', 'name', 'category', 'is_active'])
+
+def price_role(role):
+    """Only resellers get their own price list; every other role pays the public price."""
+    return 'reseller' if role == 'reseller' else 'public'
+
+class PriceTable:
+    """Every (ticket slug, date_type, variant, role) resolved to an integer once per catalog version."""
+
+    def __init__(self, tickets, addons):
+        self.tickets = {}
+        self.addons = {}
+        self.ticket_prices = {}
+        self.addon_prices = {}
+
+        for t in tickets:
+            self.tickets[t.slug] = CatalogItem(t.slug, t.name, t.category or 'personal', bool(t.is_active))
+            for date_type in DATE_TYPES:
+                for variant in VARIANTS:
+                    for role in PRICE_ROLES:
+                        self.ticket_prices[(t.slug, date_type, variant, role)] = t.get_price(date_type, variant, role=role)
+
+        for a in addons:
+            self.addons[a.slug] = CatalogItem(a.slug, a.name, a.category or 'personal', bool(a.is_active))
+            for role in PRICE_ROLES:
+                self.addon_prices[(a.slug, role)] = a.get_price(role=role)
+
+    def ticket_price(self, slug, date_type, variant, role='public'):
+        # Seperti Ticket.get_price: tipe tanggal lain (mis. 'closed') memakai harga dasar
+        if date_type not in DATE_TYPES:
+            date_type = 'regular'
+        return self.ticket_prices.get((slug, date_type, variant, price_role(role)), 0)
+
+    def addon_price(self, slug, role='public'):
+        return self.addon_prices.get((slug, price_role(role)), 0)
+
+    def active_tickets(self):
+        return [t for t in self.tickets.values() if t.is_active]
+
+def _load_price_table():
+    return PriceTable(Ticket.query.all(), Addon.query.all())
+
+def get_price_table():
+    return cached('catalog', _load_price_table)
+
+def invalidate_catalog():
+    bump_version('catalog')
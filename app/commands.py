@@ -0,0 +1,64 @@
+import click
+from .reporting import rebuild_rollups
+from .migrations import backfill_order_items
+from .jobs import run_worker
+from .utils import prune_qr_files
+from .pdf import prune_pdf_cache
+from .ledger import backfill_balances, reconcile_deposits
+
+def register_commands(app):
+    """CLI maintenance commands, e.g. `flask --app wsgi backfill-rollups`."""
+
+    @app.cli.command('backfill-rollups')
+    def backfill_rollups_command():
+        """Rebuild the daily sales rollup from all paid orders."""
+        count = rebuild_rollups()
+        click.echo(f"Rollup rebuilt from {count} paid orders")
+
+    @app.cli.command('backfill-order-items')
+    def backfill_order_items_command():
+        """Create OrderItem/OrderAddon rows from the details JSON of older orders."""
+        count = backfill_order_items()
+        click.echo(f"Order items created for {count} orders")
+
+    @app.cli.command('run-worker')
+    @click.option('--concurrency', default=4, show_default=True, help='Maximum number of jobs running at the same time.')
+    @click.option('--poll-interval', default=2.0, show_default=True, help='Seconds to wait when the queue is empty.')
+    @click.option('--once', is_flag=True, help='Exit when no due jobs are left (for cron).')
+    def run_worker_command(concurrency, poll_interval, once):
+        """Process queued background jobs (outgoing email)."""
+        click.echo(f"Worker started with concurrency {concurrency}")
+        count = run_worker(app, concurrency=concurrency, poll_interval=poll_interval, once=once)
+        click.echo(f"Worker stopped after {count} jobs")
+
+    @app.cli.command('prune-qrcodes')
+    @click.option('--keep-days', default=30, show_default=True, help='Keep QR files of visits within this many days.')
+    def prune_qrcodes_command(keep_days):
+        """Delete cached QR images of orders whose visit date has passed."""
+        count = prune_qr_files(keep_days)
+        click.echo(f"Deleted {count} QR files")
+
+    @app.cli.command('prune-pdf-cache')
+    @click.option('--keep-days', default=30, show_default=True, help='Keep cached PDFs downloaded within this many days.')
+    def prune_pdf_cache_command(keep_days):
+        """Delete cached invoice/e-ticket PDFs that were not downloaded recently (e.g. old versions after a settings change)."""
+        count = prune_pdf_cache(keep_days)
+        click.echo(f"Deleted {count} cached PDFs")
+
+    @app.cli.command('backfill-deposit-ledger')
+    def backfill_deposit_ledger_command():
+        """Fill the running balance (balance_after) of older completed deposit transactions."""
+        count = backfill_balances()
+        click.echo(f"Running balance filled for {count} deposit transactions")
+
+    @app.cli.command('reconcile-deposits')
+    def reconcile_deposits_command():
+        """Compare each reseller's deposit balance with the sum of their completed transactions."""
+        drift = reconcile_deposits()
+        for row in drift:
+            click.echo(f"User #{row['user_id']} {row['name']}: saldo {row['deposit_balance']:,}, ledger {row['ledger_sum']:,} "
+                       f"(selisih {row['difference']:+,}, {row['transactions']} transaksi)")
+        if drift:
+            click.echo(f"{len(drift)} reseller balances do not match the ledger", err=True)
+            raise SystemExit(1)
+        click.echo("All reseller balances match the ledger")
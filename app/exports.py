@@ -0,0 +1,317 @@
+import csv
+import json
+import os
+import time
+import zipfile
+from datetime import datetime
+from io import StringIO, TextIOWrapper
+import xlsxwriter
+from flask import current_app
+from sqlalchemy import func, literal
+from sqlalchemy.orm import selectinload
+from . import db
+from .models import Order, OrderItem, OrderAddon, DepositTransaction, User
+from .cache import get_settings
+from .pdf import eticket_pdf, render_etickets
+from .utils import filter_date_range, iter_keyset
+
+# Export file besar (mis. e-ticket satu rombongan). Pilihan kecil dibuat
+# langsung di request; pilihan besar dibuat oleh worker job queue ke
+# instance/exports lalu di-download lewat URL status job.
+
+EXPORT_SYNC_LIMIT = 50 # lebih dari ini order: dibuat di background job
+EXPORT_KEEP_HOURS = 24
+ORDER_BATCH_SIZE = 100
+
+def export_dir():
+    path = os.path.join(current_app.instance_path, 'exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def prune_exports(keep_hours=EXPORT_KEEP_HOURS):
+    """Deletes export files older than keep_hours. Returns the number deleted."""
+    folder = export_dir()
+    cutoff = time.time() - keep_hours * 3600
+    deleted = 0
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                deleted += 1
+        except FileNotFoundError:
+            pass
+    return deleted
+
+def header_text():
+    settings = get_settings()
+    return settings.park_name if settings else "Tiket Wahana"
+
+def iter_orders(order_ids, batch_size=ORDER_BATCH_SIZE):
+    """Yields the orders in order_ids order, loading batch_size rows at a time."""
+    for start in range(0, len(order_ids), batch_size):
+        chunk = order_ids[start:start + batch_size]
+        # get_details() membaca item/addon; dimuat sekaligus per batch, bukan per order
+        batch = Order.query.filter(Order.id.in_(chunk))\
+            .options(selectinload(Order.order_items), selectinload(Order.order_addons))
+        by_id = {o.id: o for o in batch}
+        for order_id in chunk:
+            if order_id in by_id:
+                yield by_id[order_id]
+
+def eticket_filename(order):
+    return f"Eticket_{order.uuid}.pdf"
+
+# --- CSV ---
+
+def stream_csv(header, rows, flush_every=500):
+    """
+    Generator of CSV text for a streaming response: the header first, then rows
+    in chunks of flush_every, so memory use does not depend on the number of rows.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    # Header langsung dikirim supaya download dimulai sebelum query selesai
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % flush_every == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+# --- E-TICKET EXPORT ---
+
+class _ZipStream:
+    """Write-only file object for zipfile; pop() returns what was written since the last call."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_eticket_zip(order_ids):
+    """
+    Generator of ZIP bytes with one e-ticket PDF per order, for a streaming response.
+    Only one PDF is held in memory at a time; PDFs come from the PDF cache when possible.
+    """
+    header = header_text()
+    buffer = _ZipStream()
+    # PDF sudah terkompresi: ZIP_STORED, tanpa kompresi ulang
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zf:
+        for order in iter_orders(order_ids):
+            zf.writestr(eticket_filename(order), eticket_pdf(order, header))
+            yield buffer.pop()
+    yield buffer.pop()
+
+def write_eticket_export(name, order_ids, fmt, progress=None):
+    """
+    Writes an e-ticket export ('zip' or 'pdf') to export_dir()/name.
+    progress(done) is called while the export is built. Returns the file path.
+    """
+    prune_exports()
+    header = header_text()
+    path = os.path.join(export_dir(), name)
+    tmp_path = f"{path}.tmp"
+    report = progress or (lambda done: None)
+
+    if fmt == 'pdf':
+        with open(tmp_path, 'wb') as f:
+            render_etickets(iter_orders(order_ids), header, f,
+                            on_page=lambda page: page % 25 == 0 and report(page))
+    else:
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as zf:
+            for done, order in enumerate(iter_orders(order_ids), start=1):
+                zf.writestr(eticket_filename(order), eticket_pdf(order, header))
+                if done % 25 == 0:
+                    report(done)
+    os.replace(tmp_path, path)
+    return path
+
+# --- REPORT EXPORT (finance) ---
+
+# Data mentah untuk finance: order, item per order, deposit reseller dan
+# check-in. Semua dataset dibaca per batch (iter_keyset) dan ditulis baris per
+# baris ke file di instance/exports (XLSX dengan constant_memory, atau ZIP
+# berisi satu CSV per dataset), jadi ukuran data tidak mempengaruhi memori
+# worker. Kolom kunci batch ada di akhir baris dan tidak ikut ditulis.
+
+REPORT_FORMATS = ['xlsx', 'zip']
+REPORT_PROGRESS_EVERY = 1000 # baris
+XLSX_MAX_ROWS = 1048576 # batas baris per worksheet di Excel
+BATCH_SIZE = 1000
+
+def _reseller_name():
+    return func.coalesce(User.agency_name, User.name)
+
+def _orders_dataset(start_date, end_date):
+    header = ['No Invoice', 'Kode Tiket', 'Tanggal Order', 'Tanggal Kunjungan', 'Tipe Kunjungan', 'Nama Customer',
+              'Email', 'Telepon', 'Domisili', 'Total', 'Diskon', 'Kode Promo', 'Status', 'Metode Bayar', 'Reseller', 'Check-in']
+    query = filter_date_range(Order.query, Order.created_at, start_date, end_date)
+    rows = query.outerjoin(User, Order.user_id == User.id).with_entities(
+        Order.invoice_number, Order.uuid, Order.created_at, Order.visit_date, Order.visit_type, Order.customer_name,
+        Order.customer_email, Order.customer_phone, Order.customer_domicile, Order.total_price, Order.discount_amount,
+        Order.promo_code, Order.payment_status, Order.payment_method, _reseller_name(), Order.checkin_at, Order.id
+    )
+    return header, iter_keyset(rows, [Order.created_at, Order.id], BATCH_SIZE), query.count()
+
+def _legacy_line_rows(orders):
+    """Line rows of orders created before OrderItem/OrderAddon existed, parsed from the details JSON."""
+    for invoice_number, created_at, details, _ in orders:
+        try:
+            details = json.loads(details) if details else {}
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(details, dict):
+            continue
+        for item in details.get('items', []) or details.get('tickets', []):
+            if isinstance(item, dict):
+                qty = item.get('qty', 0) or item.get('quantity', 0)
+                price = item.get('price', 0) or 0
+                yield (invoice_number, created_at, 'tiket', item.get('name'), item.get('slug'), item.get('variant'),
+                       item.get('category') or 'personal', qty, price, item.get('subtotal', 0) or price * qty)
+        for addon in details.get('addons', []):
+            if isinstance(addon, dict):
+                price = addon.get('price', 0) or 0
+                yield (invoice_number, created_at, 'addon', addon.get('name'), addon.get('slug'), None,
+                       addon.get('category') or 'personal', 1, price, price)
+
+def _order_items_dataset(start_date, end_date):
+    header = ['No Invoice', 'Tanggal Order', 'Jenis', 'Nama Item', 'Slug', 'Varian', 'Kategori', 'Qty', 'Harga', 'Subtotal']
+    items = filter_date_range(db.session.query(
+        Order.invoice_number, Order.created_at, literal('tiket'), OrderItem.name, OrderItem.slug, OrderItem.variant,
+        OrderItem.category, OrderItem.qty, OrderItem.price, OrderItem.subtotal, OrderItem.id
+    ).join(Order, OrderItem.order_id == Order.id), Order.created_at, start_date, end_date)
+    addons = filter_date_range(db.session.query(
+        Order.invoice_number, Order.created_at, literal('addon'), OrderAddon.name, OrderAddon.slug, literal(None),
+        OrderAddon.category, OrderAddon.qty, OrderAddon.price, OrderAddon.price * OrderAddon.qty, OrderAddon.id
+    ).join(Order, OrderAddon.order_id == Order.id), Order.created_at, start_date, end_date)
+    # Order lama yang belum di-backfill ke OrderItem/OrderAddon
+    has_rows = db.or_(
+        db.session.query(OrderItem.id).filter(OrderItem.order_id == Order.id).exists(),
+        db.session.query(OrderAddon.id).filter(OrderAddon.order_id == Order.id).exists()
+    )
+    legacy = filter_date_range(db.session.query(Order.invoice_number, Order.created_at, Order.details, Order.id)
+                               .filter(~has_rows, Order.details != None), Order.created_at, start_date, end_date)
+
+    def rows():
+        # Urut id baris (= urutan order dibuat)
+        yield from iter_keyset(items, [OrderItem.id], BATCH_SIZE)
+        yield from iter_keyset(addons, [OrderAddon.id], BATCH_SIZE)
+        yield from _legacy_line_rows(iter_keyset(legacy, [Order.created_at, Order.id], BATCH_SIZE))
+    return header, rows(), items.count() + addons.count()
+
+def _deposits_dataset(start_date, end_date):
+    header = ['ID', 'Tanggal', 'Reseller', 'Jenis', 'Jumlah', 'Status', 'Keterangan', 'External ID']
+    query = filter_date_range(DepositTransaction.query, DepositTransaction.created_at, start_date, end_date)
+    rows = query.outerjoin(User, DepositTransaction.user_id == User.id).with_entities(
+            DepositTransaction.id, DepositTransaction.created_at, _reseller_name(), DepositTransaction.transaction_type,
+            DepositTransaction.amount, DepositTransaction.status, DepositTransaction.description, DepositTransaction.external_id
+        )
+    return header, iter_keyset(rows, [DepositTransaction.created_at, DepositTransaction.id], BATCH_SIZE), query.count()
+
+def _checkins_dataset(start_date, end_date):
+    header = ['No Invoice', 'Kode Tiket', 'Tanggal Kunjungan', 'Tipe Kunjungan', 'Nama Customer', 'Check-in', 'Gate', 'Gelang']
+    query = filter_date_range(Order.query.filter(Order.checkin_at != None), Order.checkin_at, start_date, end_date)
+    rows = query.with_entities(
+        Order.invoice_number, Order.uuid, Order.visit_date, Order.visit_type, Order.customer_name,
+        Order.checkin_at, Order.checkin_gate, Order.wristband_at, Order.id
+    )
+    return header, iter_keyset(rows, [Order.checkin_at, Order.id], BATCH_SIZE), query.count()
+
+REPORT_DATASETS = [
+    ('orders', _orders_dataset),
+    ('order_items', _order_items_dataset),
+    ('deposits', _deposits_dataset),
+    ('checkins', _checkins_dataset),
+]
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+def _write_xlsx(path, datasets, on_row):
+    # constant_memory: setiap baris langsung ditulis ke file sementara, bukan disimpan di memori
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+    bold = workbook.add_format({'bold': True})
+    try:
+        for title, header, rows in datasets:
+            sheet_number = 1
+            worksheet = None
+            row_index = XLSX_MAX_ROWS
+            for row in rows:
+                if row_index >= XLSX_MAX_ROWS:
+                    # Lebih dari batas Excel: lanjut di worksheet berikutnya
+                    worksheet = workbook.add_worksheet(title if sheet_number == 1 else f"{title}_{sheet_number}")
+                    worksheet.set_column(0, len(header) - 1, 18)
+                    worksheet.write_row(0, 0, header, bold)
+                    row_index = 1
+                    sheet_number += 1
+                worksheet.write_row(row_index, 0, tuple(row[:len(header)]))
+                row_index += 1
+                on_row()
+            if worksheet is None:
+                worksheet = workbook.add_worksheet(title)
+                worksheet.write_row(0, 0, header, bold)
+    finally:
+        workbook.close()
+
+def _write_csv_zip(path, datasets, on_row):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for title, header, rows in datasets:
+            with TextIOWrapper(zf.open(f"{title}.csv", 'w', force_zip64=True), encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                for row in rows:
+                    writer.writerow([_csv_value(value) for value in row[:len(header)]])
+                    on_row()
+
+def write_report_export(name, fmt, start_date=None, end_date=None, progress=None):
+    """
+    Writes the finance export ('xlsx': one worksheet per dataset, 'zip': one CSV per dataset)
+    to export_dir()/name. progress(done, total) is called every REPORT_PROGRESS_EVERY rows.
+    Returns the file path.
+    """
+    prune_exports()
+    datasets = []
+    total = 0
+    for title, build in REPORT_DATASETS:
+        header, rows, count = build(start_date, end_date)
+        datasets.append((title, header, rows))
+        total += count
+
+    report = progress or (lambda done, total: None)
+    report(0, total)
+    done = 0
+    def on_row():
+        nonlocal done
+        done += 1
+        if done % REPORT_PROGRESS_EVERY == 0:
+            report(done, max(total, done))
+
+    path = os.path.join(export_dir(), name)
+    tmp_path = f"{path}.tmp"
+    if fmt == 'xlsx':
+        _write_xlsx(tmp_path, datasets, on_row)
+    else:
+        _write_csv_zip(tmp_path, datasets, on_row)
+    os.replace(tmp_path, path)
+    report(done, max(total, done))
+    return path
@@ -0,0 +1,262 @@
+import json
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+from sqlalchemy import update, select
+from . import db
+from .models import Job, Order
+from .utils import send_invoice_email, send_eticket_email, send_expired_email, render_expired_email, send_email_batch
+from .exports import write_eticket_export, write_report_export
+
+# Antrian job berbasis tabel `job` (SQLite). Request hanya menambah baris job
+# di transaksi yang sama dengan perubahan order; proses worker terpisah
+# (`flask --app wsgi run-worker`) yang mengirim email dengan jumlah thread
+# terbatas, retry dengan backoff, dan status 'dead' jika selalu gagal.
+
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+STALE_AFTER = timedelta(minutes=15) # job 'running' tanpa heartbeat (locked_at) selama ini dianggap worker-nya mati
+
+HANDLERS = {}
+_current = threading.local() # job yang sedang dijalankan thread ini
+
+def job_handler(kind):
+    """Registers fn(payload) as the handler for jobs of `kind`. Returning False counts as a failure."""
+    def decorator(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+def enqueue(kind, payload, run_at=None, max_attempts=5):
+    """Adds a job to the current session; it becomes visible to the worker when the caller commits."""
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        status='pending',
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=run_at or datetime.utcnow()
+    )
+    db.session.add(job)
+    return job
+
+def current_job_id():
+    return getattr(_current, 'job_id', None)
+
+def update_job_progress(done=None, total=None, result_path=None):
+    """
+    Records progress of the running job (committed right away, so status pages see it).
+    Also refreshes locked_at as a heartbeat, so long exports are not recovered as stale.
+    """
+    job_id = current_job_id()
+    if job_id is None:
+        return
+    values = {'locked_at': datetime.utcnow()}
+    if done is not None:
+        values['progress'] = done
+    if total is not None:
+        values['total'] = total
+    if result_path is not None:
+        values['result_path'] = result_path
+    db.session.execute(update(Job).where(Job.id == job_id).values(**values))
+    db.session.commit()
+
+# --- EMAIL JOBS ---
+
+EMAIL_SENDERS = {
+    'invoice': send_invoice_email,
+    'eticket': send_eticket_email,
+    'expired': send_expired_email,
+}
+
+def enqueue_order_email(template, order_id, base_url):
+    """template: 'invoice', 'eticket' or 'expired'. base_url is needed for the links in the email."""
+    return enqueue('email', {'template': template, 'order_id': order_id, 'base_url': base_url})
+
+@job_handler('email')
+def _run_order_email(payload):
+    from flask import current_app
+    sender = EMAIL_SENDERS.get(payload.get('template'))
+    if not sender:
+        raise ValueError(f"Unknown email template: {payload.get('template')}")
+
+    with current_app.test_request_context(base_url=payload.get('base_url') or '/'):
+        order = Order.query.get(payload.get('order_id'))
+        if not order:
+            # Tidak ada yang bisa di-retry
+            print(f"Order {payload.get('order_id')} not found for email job")
+            return True
+        return sender(order)
+
+EMAIL_BATCH_SIZE = 100 # satu job = satu request bulk ke provider
+
+def enqueue_expired_emails(order_ids, base_url):
+    """Queues expired-order emails as batch jobs of EMAIL_BATCH_SIZE orders each."""
+    jobs = []
+    for start in range(0, len(order_ids), EMAIL_BATCH_SIZE):
+        chunk = order_ids[start:start + EMAIL_BATCH_SIZE]
+        jobs.append(enqueue('email_batch', {'template': 'expired', 'order_ids': chunk, 'base_url': base_url}))
+    return jobs
+
+@job_handler('email_batch')
+def _run_expired_email_batch(payload):
+    from flask import current_app
+    if payload.get('template') != 'expired':
+        raise ValueError(f"Unknown batch email template: {payload.get('template')}")
+
+    with current_app.test_request_context(base_url=payload.get('base_url') or '/'):
+        orders = Order.query.filter(Order.id.in_(payload.get('order_ids') or [])).all()
+        results = send_email_batch([render_expired_email(order) for order in orders])
+
+    # Job tidak di-retry utuh (email yang sudah terkirim akan terkirim dua kali);
+    # hanya order yang gagal masuk antrian lagi sebagai job email per order
+    failed = [order.id for order, ok in zip(orders, results) if not ok]
+    if failed:
+        run_at = datetime.utcnow() + retry_delay(1)
+        for order_id in failed:
+            enqueue('email', {'template': 'expired', 'order_id': order_id, 'base_url': payload.get('base_url')}, run_at=run_at)
+        db.session.commit()
+        print(f"{len(failed)} of {len(orders)} expired emails failed, queued again per order")
+    return True
+
+# --- EXPORT JOBS ---
+
+def enqueue_eticket_export(order_ids, fmt, user_id):
+    """fmt: 'zip' or 'pdf'. user_id is the user allowed to download the result."""
+    return enqueue('export_etickets', {'order_ids': order_ids, 'format': fmt, 'user_id': user_id}, max_attempts=2)
+
+@job_handler('export_etickets')
+def _run_eticket_export(payload):
+    order_ids = payload.get('order_ids') or []
+    fmt = 'pdf' if payload.get('format') == 'pdf' else 'zip'
+    update_job_progress(0, total=len(order_ids))
+    path = write_eticket_export(f"etickets-{current_job_id()}.{fmt}", order_ids, fmt, progress=update_job_progress)
+    update_job_progress(len(order_ids), result_path=os.path.basename(path))
+
+def enqueue_report_export(fmt, start_date, end_date, user_id):
+    """Finance export of orders, order items, deposits and check-ins. fmt: 'xlsx' or 'zip' (CSV per dataset)."""
+    return enqueue('export_report', {'format': fmt, 'start_date': start_date, 'end_date': end_date, 'user_id': user_id}, max_attempts=2)
+
+@job_handler('export_report')
+def _run_report_export(payload):
+    fmt = 'xlsx' if payload.get('format') == 'xlsx' else 'zip'
+    path = write_report_export(f"report-{current_job_id()}.{fmt}", fmt, payload.get('start_date'), payload.get('end_date'),
+                               progress=update_job_progress)
+    update_job_progress(result_path=os.path.basename(path))
+
+# --- WORKER ---
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), RETRY_MAX_SECONDS))
+
+def recover_stale_jobs():
+    """Puts 'running' jobs whose heartbeat (locked_at) is older than STALE_AFTER back in the queue. Returns how many."""
+    cutoff = datetime.utcnow() - STALE_AFTER
+    result = db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.locked_at < cutoff)
+        .values(status='pending', locked_at=None, run_at=datetime.utcnow())
+    )
+    db.session.commit()
+    return result.rowcount
+
+def claim_jobs(limit):
+    """Atomically marks up to `limit` due jobs as running and returns their ids."""
+    now = datetime.utcnow()
+    due = select(Job.id).where(Job.status == 'pending', Job.run_at <= now)\
+        .order_by(Job.run_at, Job.id).limit(limit)
+    ids = db.session.execute(
+        update(Job)
+        .where(Job.id.in_(due), Job.status == 'pending')
+        .values(status='running', locked_at=now, attempts=Job.attempts + 1)
+        .returning(Job.id)
+    ).scalars().all()
+    db.session.commit()
+    return ids
+
+def run_job(app, job_id):
+    """Runs one claimed job in its own app context and records the outcome."""
+    with app.app_context():
+        job = Job.query.get(job_id)
+        if not job:
+            return
+
+        error = None
+        _current.job_id = job_id
+        try:
+            handler = HANDLERS.get(job.kind)
+            if not handler:
+                raise ValueError(f"No handler for job kind '{job.kind}'")
+            if handler(job.get_payload()) is False:
+                error = "Handler returned False"
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            _current.job_id = None
+
+        # Handler bisa saja meninggalkan transaksi yang gagal
+        db.session.rollback()
+        job = Job.query.get(job_id)
+        now = datetime.utcnow()
+        job.locked_at = None
+        if error is None:
+            job.status = 'done'
+            job.finished_at = now
+            job.last_error = None
+        elif job.attempts >= job.max_attempts:
+            job.status = 'dead'
+            job.finished_at = now
+            job.last_error = error
+            print(f"Job {job.id} ({job.kind}) dead after {job.attempts} attempts: {error}")
+        else:
+            job.status = 'pending'
+            job.run_at = now + retry_delay(job.attempts)
+            job.last_error = error
+            print(f"Job {job.id} ({job.kind}) failed, retry #{job.attempts} at {job.run_at}: {error}")
+        db.session.commit()
+
+def run_worker(app, concurrency=4, poll_interval=2.0, once=False):
+    """
+    Processes jobs with at most `concurrency` threads until SIGTERM/SIGINT.
+    With once=True, returns after the queue has no due jobs left.
+    """
+    stop = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: stop.set())
+
+    in_flight = set()
+    processed = 0
+    last_recovery = None
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while not stop.is_set():
+            if last_recovery is None or time.monotonic() - last_recovery > 60:
+                with app.app_context():
+                    recovered = recover_stale_jobs()
+                if recovered:
+                    print(f"Worker: {recovered} stale jobs returned to the queue")
+                last_recovery = time.monotonic()
+
+            in_flight = {f for f in in_flight if not f.done()}
+            free = concurrency - len(in_flight)
+            if free <= 0:
+                # Semua thread sibuk: tunggu sampai ada yang selesai
+                wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                continue
+
+            with app.app_context():
+                ids = claim_jobs(free)
+            for job_id in ids:
+                in_flight.add(pool.submit(run_job, app, job_id))
+            processed += len(ids)
+
+            if not ids:
+                if once and not in_flight:
+                    break
+                stop.wait(poll_interval)
+    return processed
@@ -0,0 +1,129 @@
+from sqlalchemy import func, update, select
+from . import db
+from .models import User, DepositTransaction
+
+# Buku besar saldo deposit reseller. Setiap perubahan User.deposit_balance
+# dilakukan dengan satu UPDATE ... RETURNING (atomik, tidak baca-lalu-tulis)
+# dan saldo hasilnya disimpan di DepositTransaction.balance_after pada
+# transaksi database yang sama. Riwayat saldo tidak perlu dihitung ulang dari
+# awal, dan reconcile_deposits() mencocokkan saldo dengan total ledger.
+
+def adjust_balance(user_id, amount, require_funds=False):
+    """
+    Adds `amount` to the user's deposit_balance in one UPDATE ... RETURNING and returns the new balance.
+    With require_funds=True the update only happens if the balance stays >= 0.
+    Returns None if the user does not exist or has insufficient funds. The caller commits.
+    """
+    stmt = update(User).where(User.id == user_id)
+    if require_funds:
+        stmt = stmt.where(func.coalesce(User.deposit_balance, 0) + amount >= 0)
+    stmt = stmt.values(deposit_balance=func.coalesce(User.deposit_balance, 0) + amount)\
+        .returning(User.deposit_balance)\
+        .execution_options(synchronize_session='fetch')
+    return db.session.execute(stmt).scalar_one_or_none()
+
+def post_deposit_transaction(user_id, amount, transaction_type, description=None, require_funds=False, **fields):
+    """
+    Applies a completed balance change and records it with its running balance.
+    Returns the DepositTransaction (added to the session, not committed) or None if adjust_balance() refused.
+    """
+    balance = adjust_balance(user_id, amount, require_funds=require_funds)
+    if balance is None:
+        return None
+    tx = DepositTransaction(
+        user_id=user_id,
+        amount=amount,
+        transaction_type=transaction_type,
+        description=description,
+        status='completed',
+        balance_after=balance,
+        **fields
+    )
+    db.session.add(tx)
+    return tx
+
+def complete_deposit_transaction(tx):
+    """
+    Marks a pending top-up as completed and credits it, in the caller's database transaction.
+    The status change is a conditional UPDATE, so of two concurrent (or retried) webhooks only
+    one credits the balance. Returns the new balance, or None if the top-up was already completed.
+    """
+    claimed = db.session.execute(
+        update(DepositTransaction)
+        .where(DepositTransaction.id == tx.id, DepositTransaction.status != 'completed')
+        .values(status='completed')
+        .returning(DepositTransaction.id)
+        .execution_options(synchronize_session='fetch')
+    ).scalar_one_or_none()
+    if claimed is None:
+        return None
+    balance = adjust_balance(tx.user_id, tx.amount)
+    if balance is None:
+        raise ValueError(f"User {tx.user_id} not found for deposit {tx.id}")
+    tx.balance_after = balance
+    return balance
+
+# --- BACKFILL & RECONCILIATION ---
+
+def backfill_balances(batch_size=1000):
+    """
+    Fills balance_after for completed transactions that do not have it yet, replaying each
+    reseller's history once in (created_at, id) order. Returns the number of rows updated.
+    """
+    user_ids = db.session.execute(
+        select(DepositTransaction.user_id).where(
+            DepositTransaction.status == 'completed', DepositTransaction.balance_after == None
+        ).distinct()
+    ).scalars().all()
+
+    updated = 0
+    for user_id in user_ids:
+        balance = 0
+        pending = []
+        rows = db.session.execute(
+            select(DepositTransaction.id, DepositTransaction.amount, DepositTransaction.balance_after)
+            .where(DepositTransaction.user_id == user_id, DepositTransaction.status == 'completed')
+            .order_by(DepositTransaction.created_at, DepositTransaction.id)
+        ).all()
+        for tx_id, amount, balance_after in rows:
+            balance += amount or 0
+            if balance_after is None:
+                pending.append({'id': tx_id, 'balance_after': balance})
+        for start in range(0, len(pending), batch_size):
+            db.session.execute(update(DepositTransaction), pending[start:start + batch_size])
+        db.session.commit()
+        updated += len(pending)
+    return updated
+
+def reconcile_deposits():
+    """
+    Compares every reseller's deposit_balance with the ledger (the sum of their completed
+    transactions) in one grouped query. Returns a list of dicts for the users that drift.
+    """
+    ledger = select(
+        DepositTransaction.user_id.label('user_id'),
+        func.sum(DepositTransaction.amount).label('ledger_sum'),
+        func.count(DepositTransaction.id).label('tx_count')
+    ).where(DepositTransaction.status == 'completed').group_by(DepositTransaction.user_id).subquery()
+
+    rows = db.session.execute(
+        select(User.id, User.username, User.agency_name, User.deposit_balance, ledger.c.ledger_sum, ledger.c.tx_count)
+        .outerjoin(ledger, ledger.c.user_id == User.id)
+        .where(db.or_(User.role == 'reseller', ledger.c.user_id != None))
+        .order_by(User.id)
+    ).all()
+
+    drift = []
+    for user_id, username, agency_name, balance, ledger_sum, tx_count in rows:
+        balance = balance or 0
+        ledger_sum = ledger_sum or 0
+        if balance != ledger_sum:
+            drift.append({
+                'user_id': user_id,
+                'name': agency_name or username,
+                'deposit_balance': balance,
+                'ledger_sum': ledger_sum,
+                'difference': balance - ledger_sum,
+                'transactions': tx_count or 0,
+            })
+    return drift
@@ -0,0 +1,286 @@
+import smtplib
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Transport email yang dipakai ulang antar pengiriman (per proses). Dengan
+# worker job queue, beberapa thread mengirim email bersamaan, jadi semua
+# transport di sini harus thread-safe.
+
+# --- SMTP ---
+
+class SMTPConnectionPool:
+    """
+    Thread-safe pool of logged-in SMTP connections.
+    Idle connections are reused (checked with NOOP when they have been idle a while),
+    closed after `idle_timeout` seconds, and re-opened when the server drops them.
+    """
+
+    def __init__(self, host, port, user=None, password=None, starttls=True,
+                 max_size=4, idle_timeout=60, keepalive_after=10, timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.keepalive_after = keepalive_after
+        self.timeout = timeout
+
+        self._idle = [] # [(server, last_used)], paling baru di akhir
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.connects = 0 # jumlah koneksi baru yang dibuka (untuk monitoring)
+
+    def _connect(self):
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                server.starttls()
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        self.connects += 1
+        return server
+
+    @staticmethod
+    def _close(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _is_alive(self, server):
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _evict_idle(self, now):
+        """Closes connections idle longer than idle_timeout. Caller holds the lock."""
+        expired = [s for s, last_used in self._idle if now - last_used > self.idle_timeout]
+        self._idle = [(s, t) for s, t in self._idle if now - t <= self.idle_timeout]
+        return expired
+
+    def _acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = self._evict_idle(now)
+            entry = self._idle.pop() if self._idle else None
+        for server in expired:
+            self._close(server)
+
+        if entry:
+            server, last_used = entry
+            if now - last_used < self.keepalive_after or self._is_alive(server):
+                return server
+            self._close(server)
+        return self._connect()
+
+    def _release(self, server):
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+
+    def sendmail(self, from_addr, to_addrs, message):
+        """Sends one message, reconnecting once if the pooled connection turns out to be dead."""
+        self._slots.acquire()
+        try:
+            for attempt in range(2):
+                # Percobaan kedua selalu memakai koneksi baru
+                server = self._acquire() if attempt == 0 else self._connect()
+                try:
+                    result = server.sendmail(from_addr, to_addrs, message)
+                except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                    self._close(server)
+                    if attempt == 1:
+                        raise
+                    print(f"SMTP connection lost ({e}), reconnecting")
+                    continue
+                except smtplib.SMTPException:
+                    # Error dari server (mis. penerima ditolak): koneksi masih bisa dipakai.
+                    # Harus sebelum OSError karena SMTPException adalah subclass OSError
+                    self._release(server)
+                    raise
+                except OSError:
+                    # Timeout/socket error di tengah pengiriman: status pesan tidak pasti, jangan kirim ulang
+                    self._close(server)
+                    raise
+                self._release(server)
+                return result
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+_smtp_pools = {}
+_smtp_pools_lock = threading.Lock()
+
+def get_smtp_pool(host, port, user=None, password=None):
+    """One pool per SMTP account; pools for old settings are closed when the settings change."""
+    key = (host, port, user, password)
+    with _smtp_pools_lock:
+        pool = _smtp_pools.get(key)
+        if pool is None:
+            for old in _smtp_pools.values():
+                old.close()
+            _smtp_pools.clear()
+            pool = _smtp_pools[key] = SMTPConnectionPool(host, port, user, password)
+        return pool
+
+# --- HTTP API (Brevo, Postal) ---
+
+HTTP_TIMEOUT = (5, 30) # (connect, read) detik
+
+def _http_session(pool_size=10):
+    """requests.Session with keep-alive pooling. Only connection errors and 429 are retried, so an email is never sent twice."""
+    session = requests.Session()
+    retry = Retry(total=3, connect=3, read=0, status=3, status_forcelist=(429,),
+                  allowed_methods=None, backoff_factor=0.5, respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+class BrevoClient:
+    """Transactional email through the Brevo API, with a shared connection pool."""
+
+    DEFAULT_BASE_URL = 'https://api.brevo.com/v3'
+    BATCH_SIZE = 100 # messageVersions per request
+
+    def __init__(self, api_key, base_url=None, timeout=HTTP_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = (base_url or self.DEFAULT_BASE_URL).rstrip('/')
+        self.timeout = timeout
+        self.session = _http_session()
+        self.session.headers.update({
+            'accept': 'application/json',
+            'api-key': api_key,
+            'content-type': 'application/json'
+        })
+
+    def _post(self, payload):
+        response = self.session.post(f"{self.base_url}/smtp/email", json=payload, timeout=self.timeout)
+        if response.status_code in [200, 201, 202]:
+            return response.json() if response.content else {}
+        print(f"Brevo Error: {response.text}")
+        raise Exception(f"Brevo API Error: {response.status_code}")
+
+    def send(self, sender_email, sender_name, to_email, subject, html_content):
+        return self._post({
+            "sender": {"name": sender_name, "email": sender_email},
+            "to": [{"email": to_email}],
+            "subject": subject,
+            "htmlContent": html_content
+        })
+
+    def send_batch(self, sender_email, sender_name, messages):
+        """
+        messages: [(to_email, subject, html_content)]. Sent as messageVersions, BATCH_SIZE per request.
+        Returns one bool per message; a rejected request marks its whole chunk as failed
+        and the remaining chunks are still sent.
+        """
+        results = []
+        for start in range(0, len(messages), self.BATCH_SIZE):
+            chunk = messages[start:start + self.BATCH_SIZE]
+            first_subject, first_html = chunk[0][1], chunk[0][2]
+            try:
+                self._post({
+                    "sender": {"name": sender_name, "email": sender_email},
+                    "subject": first_subject,
+                    "htmlContent": first_html,
+                    "messageVersions": [
+                        {"to": [{"email": to_email}], "subject": subject, "htmlContent": html_content}
+                        for to_email, subject, html_content in chunk
+                    ]
+                })
+                results.extend([True] * len(chunk))
+            except Exception as e:
+                print(f"Brevo: batch of {len(chunk)} messages failed: {e}")
+                results.extend([False] * len(chunk))
+        return results
+
+class PostalClient:
+    """Postal HTTP API (/api/v1/send/message) with a shared connection pool."""
+
+    MAX_CONCURRENCY = 4 # request paralel saat send_batch
+
+    def __init__(self, base_url, server_key, timeout=HTTP_TIMEOUT, max_concurrency=MAX_CONCURRENCY):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.session = _http_session(pool_size=max_concurrency)
+        self.session.headers.update({
+            'accept': 'application/json',
+            'content-type': 'application/json',
+            'X-Server-API-Key': server_key
+        })
+
+    def send(self, sender_email, sender_name, to_email, subject, html_content):
+        """Returns Postal's message data; raises if Postal does not accept the message."""
+        payload = {
+            "to": [to_email],
+            "from": f"{sender_name} <{sender_email}>" if sender_name else sender_email,
+            "subject": subject,
+            "html_body": html_content
+        }
+        response = self.session.post(f"{self.base_url}/api/v1/send/message", json=payload, timeout=self.timeout)
+        try:
+            result = response.json()
+        except ValueError:
+            result = {}
+        # Postal menjawab HTTP 200 juga untuk error; status ada di body
+        if response.status_code == 200 and result.get('status') == 'success':
+            return result.get('data', {})
+        print(f"Postal Error: {response.status_code} {response.text}")
+        error = (result.get('data') or {}).get('message') if isinstance(result.get('data'), dict) else None
+        raise Exception(f"Postal API Error: {error or response.status_code}")
+
+    def send_batch(self, sender_email, sender_name, messages):
+        """
+        messages: [(to_email, subject, html_content)]. Postal has no bulk endpoint, so messages are
+        sent over the pooled session with at most max_concurrency requests in flight.
+        Returns one bool per message (True = accepted by Postal); never raises for a single failure,
+        so a retry can skip the messages Postal already accepted.
+        """
+        def _send(message):
+            to_email, subject, html_content = message
+            try:
+                self.send(sender_email, sender_name, to_email, subject, html_content)
+                return True
+            except Exception as e:
+                print(f"Postal: failed to send to {to_email}: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            return list(pool.map(_send, messages))
+
+_http_clients = {}
+_http_clients_lock = threading.Lock()
+
+def get_brevo_client(api_key, base_url=None):
+    key = ('brevo', api_key, base_url)
+    with _http_clients_lock:
+        client = _http_clients.get(key)
+        if client is None:
+            client = _http_clients[key] = BrevoClient(api_key, base_url)
+        return client
+
+def get_postal_client(base_url, server_key):
+    key = ('postal', base_url, server_key)
+    with _http_clients_lock:
+        client = _http_clients.get(key)
+        if client is None:
+            client = _http_clients[key] = PostalClient(base_url, server_key)
+        return client
@@ -0,0 +1,101 @@
+from sqlalchemy import inspect, text, literal
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateIndex
+from . import db
+
+# db.create_all() hanya membuat tabel yang belum ada. Perubahan skema pada
+# tabel yang sudah ada (index baru, dst.) diterapkan di sini supaya database
+# lama (instance/wahana.db) ikut ter-upgrade saat aplikasi start.
+
+def upgrade_schema():
+    """Brings an existing database up to date with the models. Safe to run repeatedly."""
+    add_missing_columns()
+    create_missing_indexes()
+
+def _column_default_sql(column):
+    """SQL literal for the DEFAULT clause of an added column, or None. Scalar Python defaults count too."""
+    if column.server_default is not None:
+        arg = column.server_default.arg
+        if isinstance(arg, str):
+            return literal(arg).compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}).string
+        return str(arg.compile(dialect=db.engine.dialect))
+    if column.default is not None and column.default.is_scalar:
+        return literal(column.default.arg, column.type).compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}).string
+    return None
+
+def add_missing_columns():
+    """
+    ALTER TABLE ... ADD COLUMN for model columns that the database does not have yet.
+    Existing rows get the column's server_default or scalar default. NOT NULL columns
+    without such a default cannot be added this way and are skipped with a warning.
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {col['name'] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=db.engine.dialect)
+            default = _column_default_sql(column)
+            ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'
+            if default is not None:
+                ddl += f' DEFAULT {default}'
+            if not column.nullable:
+                if default is None:
+                    print(f"Migration WARNING: {table.name}.{column.name} is NOT NULL without a default, add it manually")
+                    continue
+                ddl += ' NOT NULL'
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(text(ddl))
+                print(f"Migration: added column {table.name}.{column.name}")
+            except OperationalError as e:
+                # Worker lain sudah menambahkan kolom yang sama
+                if 'duplicate column' not in str(e):
+                    raise
+
+def create_missing_indexes():
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not table.indexes:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                # IF NOT EXISTS: beberapa worker Gunicorn bisa start bersamaan
+                with db.engine.begin() as conn:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+                print(f"Migration: created index {index.name} on {table.name}")
+
+# --- DATA MIGRATIONS ---
+
+def backfill_order_items(batch_size=500):
+    """
+    Creates OrderItem/OrderAddon rows for orders that only have the details JSON.
+    Returns the number of orders converted. Safe to run repeatedly.
+    """
+    from .models import Order, OrderItem, OrderAddon
+
+    has_rows = db.or_(
+        db.session.query(OrderItem.id).filter(OrderItem.order_id == Order.id).exists(),
+        db.session.query(OrderAddon.id).filter(OrderAddon.order_id == Order.id).exists()
+    )
+    converted = 0
+    last_id = 0
+    while True:
+        orders = Order.query.filter(Order.id > last_id, ~has_rows)\
+            .order_by(Order.id).limit(batch_size).all()
+        if not orders:
+            break
+        for order in orders:
+            details = order.get_details()
+            items = details.get('items', []) or details.get('tickets', [])
+            addons = details.get('addons', [])
+            if not items and not addons:
+                continue
+            order.add_line_items(items, addons)
+            converted += 1
+        last_id = orders[-1].id
+        db.session.commit()
+        print(f"Migration: order items backfilled up to order #{last_id}")
+    return converted
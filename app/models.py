@@ -1,4 +1,5 @@
 from . import db
+import json
 from datetime import datetime, timedelta
 
 class Ticket(db.Model):
@@ -92,7 +93,17 @@ class SpecialDate(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Order(db.Model):
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Index untuk filter yang sering dipakai di dashboard
+        db.Index('ix_order_status_expires', 'payment_status', 'expires_at'), # lazy cleanup pesanan kedaluwarsa
+        db.Index('ix_order_status_created', 'payment_status', 'created_at'), # laporan penjualan
+        db.Index('ix_order_user_created', 'user_id', 'created_at'), # dashboard & riwayat reseller
+        db.Index('ix_order_created_at', 'created_at'), # daftar transaksi & export
+        db.Index('ix_order_checkin_at', 'checkin_at'),
+        db.Index('ix_order_gate_checkin', 'checkin_gate', 'checkin_at'),
+        db.Index('ix_order_wristband_at', 'wristband_at'),
+        {'extend_existing': True}
+    )
     id = db.Column(db.Integer, primary_key=True)
     uuid = db.Column(db.String(36), unique=True, nullable=False) # UUID4
     invoice_number = db.Column(db.String(50), unique=True) # INV-YYYYMMDD-XXXX
@@ -130,6 +141,115 @@ class Order(db.Model):
     checkin_at = db.Column(db.DateTime)
     checkin_gate = db.Column(db.String(50))
 
+    def get_details(self):
+        """
+        Parsed details dict. Items and addons come from OrderItem/OrderAddon rows;
+        orders created before those tables existed fall back to the JSON in `details`.
+        """
+        try:
+            details = json.loads(self.details) if self.details else {}
+        except (TypeError, ValueError):
+            details = {}
+        if not isinstance(details, dict):
+            details = {}
+
+        if self.order_items:
+            details['items'] = [item.to_dict() for item in self.order_items]
+        if self.order_addons:
+            details['addons'] = [addon.to_dict() for addon in self.order_addons]
+        return details
+
+    def add_line_items(self, items, addons):
+        """Creates OrderItem/OrderAddon rows from checkout summary (or legacy details JSON) entries."""
+        for item in items or []:
+            if not isinstance(item, dict):
+                continue
+            qty = item.get('qty', 0) or item.get('quantity', 0)
+            price = item.get('price', 0) or 0
+            self.order_items.append(OrderItem(
+                name=item.get('name', 'Unknown'),
+                slug=item.get('slug'),
+                variant=item.get('variant'),
+                category=item.get('category') or 'personal',
+                qty=qty,
+                price=price,
+                subtotal=item.get('subtotal', 0) or item.get('total', 0) or price * qty
+            ))
+        for addon in addons or []:
+            if not isinstance(addon, dict):
+                continue
+            self.order_addons.append(OrderAddon(
+                name=addon.get('name', 'Unknown'),
+                slug=addon.get('slug'),
+                category=addon.get('category') or 'personal',
+                qty=1,
+                price=addon.get('price', 0) or 0
+            ))
+
+class OrderItem(db.Model):
+    __table_args__ = {'extend_existing': True}
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    name = db.Column(db.String(150), nullable=False) # e.g. "Reguler (Dewasa)"
+    slug = db.Column(db.String(50))
+    variant = db.Column(db.String(10)) # adult, child, umum
+    category = db.Column(db.String(50), default='personal')
+    qty = db.Column(db.Integer, nullable=False, default=0)
+    price = db.Column(db.Integer, nullable=False, default=0)
+    subtotal = db.Column(db.Integer, nullable=False, default=0)
+
+    order = db.relationship('Order', backref=db.backref('order_items', lazy=True, order_by='OrderItem.id'))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'qty': self.qty,
+            'price': self.price,
+            'subtotal': self.subtotal,
+            'category': self.category,
+            'slug': self.slug,
+            'variant': self.variant
+        }
+
+class OrderAddon(db.Model):
+    __table_args__ = {'extend_existing': True}
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    slug = db.Column(db.String(50))
+    category = db.Column(db.String(50), default='personal')
+    qty = db.Column(db.Integer, nullable=False, default=1) # Satu baris per addon yang dipilih
+    price = db.Column(db.Integer, nullable=False, default=0)
+
+    order = db.relationship('Order', backref=db.backref('order_addons', lazy=True, order_by='OrderAddon.id'))
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'price': self.price,
+            'category': self.category
+        }
+
+class InvoiceSequence(db.Model):
+    __table_args__ = {'extend_existing': True}
+    # Counter per hari untuk nomor invoice INV-YYYYMMDD-XXXX
+    day = db.Column(db.String(8), primary_key=True) # YYYYMMDD
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+class DailySalesRollup(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('date', 'item_type', 'name', name='uq_rollup_date_item'),
+        {'extend_existing': True}
+    )
+    # Rekap penjualan harian (order lunas), diperbarui saat order berubah jadi 'paid'
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False) # Tanggal order dibuat (WIB)
+    item_type = db.Column(db.String(10), nullable=False) # order (total harian), ticket, addon
+    name = db.Column(db.String(100), nullable=False, default='')
+    qty = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
 class Gate(db.Model):
     __table_args__ = {'extend_existing': True}
     id = db.Column(db.Integer, primary_key=True)
@@ -165,6 +285,7 @@ class SiteSetting(db.Model):
     smtp_user = db.Column(db.String(100))
     smtp_password = db.Column(db.String(100))
     postal_server_key = db.Column(db.String(100))
+    postal_api_url = db.Column(db.String(200)) # e.g. https://postal.example.com
     brevo_api_key = db.Column(db.String(100))
     email_from_address = db.Column(db.String(100), default='noreply@example.com')
     email_from_name = db.Column(db.String(100), default='Tiket Wahana')
@@ -207,6 +328,10 @@ class User(db.Model):
     deposit_expires_at = db.Column(db.DateTime)
 
 class DepositTransaction(db.Model):
+    __table_args__ = (
+        db.Index('ix_deposit_user_created', 'user_id', 'created_at'),
+        db.Index('ix_deposit_created_at', 'created_at'), # filter tanggal di daftar transaksi admin
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     amount = db.Column(db.Integer, nullable=False)  # Positive for top-up, negative for purchase
@@ -216,6 +341,7 @@ class DepositTransaction(db.Model):
     # Xendit integration for top-ups
     external_id = db.Column(db.String(100), unique=True) # Unique ID for Xendit
     status = db.Column(db.String(20), default='completed') # 'pending', 'completed', 'failed', 'expired'
+    balance_after = db.Column(db.Integer) # saldo deposit setelah transaksi ini diterapkan (hanya 'completed')
     xendit_invoice_id = db.Column(db.String(100))
     xendit_invoice_url = db.Column(db.String(255))
     
@@ -232,3 +358,31 @@ class Partner(db.Model):
     fee_percentage = db.Column(db.Integer, default=0)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(db.Model):
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'), # worker mengambil job yang sudah jatuh tempo
+        {'extend_existing': True}
+    )
+    # Antrian background job (email, dsb.), dijalankan oleh `flask --app wsgi run-worker`
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False) # e.g. 'email'
+    payload = db.Column(db.Text) # JSON string
+    status = db.Column(db.String(20), default='pending') # pending, running, done, dead
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=5)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow) # jadwal (berikutnya) dijalankan
+    locked_at = db.Column(db.DateTime) # kapan worker mengambil job ini
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    # Untuk job yang menghasilkan file (export): progres dan nama file hasil di instance/exports
+    progress = db.Column(db.Integer)
+    total = db.Column(db.Integer)
+    result_path = db.Column(db.String(255))
+
+    def get_payload(self):
+        try:
+            return json.loads(self.payload) if self.payload else {}
+        except (TypeError, ValueError):
+            return {}
@@ -0,0 +1,483 @@
+import glob
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from itertools import islice
+from io import BytesIO
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import SimpleDocTemplate, Frame, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from flask import current_app
+from .qr import qr_flowable
+from .utils import write_atomic, qr_version_for
+
+# Semua PDF (invoice, e-ticket) dibuat lewat modul ini. Style paragraf dan
+# tabel tidak pernah diubah setelah dibuat, jadi cukup dibuat sekali per
+# proses dan dipakai bersama oleh semua request.
+
+PdfStyles = namedtuple('PdfStyles', [
+    'normal', 'heading', 'center', 'right',
+    'invoice_info', 'invoice_items', 'invoice_total',
+    'eticket_info', 'eticket_items',
+])
+
+_styles = None
+_styles_lock = threading.Lock()
+
+def build_styles():
+    styles = getSampleStyleSheet()
+    return PdfStyles(
+        normal=styles["Normal"],
+        heading=styles["Heading1"],
+        center=ParagraphStyle(name='Center', parent=styles['Normal'], alignment=TA_CENTER),
+        right=ParagraphStyle(name='Right', parent=styles['Normal'], alignment=TA_RIGHT),
+        invoice_info=TableStyle([
+            ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
+            ('FONTSIZE', (0,0), (-1,-1), 10),
+            ('VALIGN', (0,0), (-1,-1), 'TOP'),
+        ]),
+        invoice_items=TableStyle([
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+            ('GRID', (0,0), (-1,-1), 1, colors.black),
+            ('PADDING', (0,0), (-1,-1), 6),
+        ]),
+        invoice_total=TableStyle([
+            ('FONTNAME', (0,0), (-1,-1), 'Helvetica-Bold'),
+            ('ALIGN', (0,0), (-1,-1), 'RIGHT'),
+            ('LINEABOVE', (0,-1), (-1,-1), 1, colors.black),
+        ]),
+        eticket_info=TableStyle([
+            ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
+            ('FONTSIZE', (0,0), (-1,-1), 12),
+            ('VALIGN', (0,0), (-1,-1), 'TOP'),
+        ]),
+        eticket_items=TableStyle([
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('GRID', (0,0), (-1,-1), 1, colors.black),
+            ('PADDING', (0,0), (-1,-1), 6),
+            ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+        ]),
+    )
+
+def get_styles():
+    global _styles
+    if _styles is None:
+        with _styles_lock:
+            if _styles is None:
+                _styles = build_styles()
+    return _styles
+
+def new_document(fileobj):
+    return SimpleDocTemplate(fileobj, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
+
+def _group_info(details):
+    group_info = details.get('group_details') or details.get('group')
+    return group_info if isinstance(group_info, dict) else None
+
+# --- INVOICE ---
+
+def invoice_flowables(order, details, header_text, styles=None):
+    styles = styles or get_styles()
+    elements = []
+
+    elements.append(Paragraph(f"<b>{header_text}</b>", styles.heading))
+    elements.append(Spacer(1, 12))
+    elements.append(Paragraph("INVOICE / BUKTI PEMBAYARAN", styles.heading))
+    elements.append(Spacer(1, 24))
+
+    # Order Info
+    data_info = [
+        ["No. Invoice", f": {order.invoice_number}"],
+        ["Tanggal", f": {order.created_at.strftime('%d %B %Y %H:%M') if order.created_at else '-'}"],
+        ["Status", f": {(order.payment_status or '').upper()}"],
+        ["Pelanggan", f": {order.customer_name}"],
+        ["Email", f": {order.customer_email}"],
+        ["Tipe Kunjungan", f": {(order.visit_type or '-').title()}"]
+    ]
+
+    group_info = _group_info(details)
+    if order.visit_type == 'group' and group_info:
+        data_info.append(["Nama Group", f": {group_info.get('name', '-')}"])
+        data_info.append(["Jumlah Peserta", f": {group_info.get('size', '-')} Pax"])
+
+    t_info = Table(data_info, colWidths=[2*inch, 4*inch])
+    t_info.setStyle(styles.invoice_info)
+    elements.append(t_info)
+    elements.append(Spacer(1, 24))
+
+    # Items Table
+    data_items = [["Deskripsi Item", "Qty", "Harga", "Total"]]
+
+    for item in details.get('items', []):
+        data_items.append([
+            f"Tiket - {item['name']}",
+            str(item.get('qty', 0)),
+            f"Rp {item.get('price', 0):,}",
+            f"Rp {item.get('subtotal', 0):,}"
+        ])
+
+    for item in details.get('addons', []):
+        data_items.append([
+            f"Addon - {item['name']}",
+            "1", # Addons in checkout summary are counted as 1 per list entry
+            f"Rp {item.get('price', 0):,}",
+            f"Rp {item.get('price', 0):,}"
+        ])
+
+    t_items = Table(data_items, colWidths=[3.5*inch, 1*inch, 1.5*inch, 1.5*inch])
+    t_items.setStyle(styles.invoice_items)
+    elements.append(t_items)
+    elements.append(Spacer(1, 12))
+
+    # Totals
+    total_price = order.total_price or 0
+    discount = order.discount_amount or 0
+    data_total = []
+    data_total.append(["Subtotal", f"Rp {total_price + discount:,}"])
+    if discount > 0:
+        data_total.append(["Diskon", f"- Rp {discount:,}"])
+    data_total.append(["TOTAL", f"Rp {total_price:,}"])
+
+    t_total = Table(data_total, colWidths=[6*inch, 1.5*inch])
+    t_total.setStyle(styles.invoice_total)
+    elements.append(t_total)
+
+    elements.append(Spacer(1, 36))
+    elements.append(Paragraph("Terima kasih atas kunjungan Anda!", styles.center))
+    return elements
+
+# --- E-TICKET ---
+
+def eticket_flowables(order, details, header_text, styles=None, qr_version=None):
+    styles = styles or get_styles()
+    elements = []
+
+    elements.append(Paragraph(f"<b>{header_text}</b>", styles.center))
+    elements.append(Spacer(1, 12))
+    elements.append(Paragraph("E-TICKET", styles.center))
+    elements.append(Spacer(1, 12))
+
+    # QR Code
+    try:
+        # Vector drawing langsung di PDF: tanpa file PNG dan tanpa PIL, tetap tajam saat dicetak
+        elements.append(qr_flowable(order.uuid, 2*inch, version=qr_version))
+    except Exception as e:
+        print(f"Failed to draw QR code: {e}")
+        elements.append(Paragraph(f"[QR CODE: {order.uuid}]", styles.center))
+
+    elements.append(Spacer(1, 6))
+    elements.append(Paragraph(f"CODE: {order.uuid}", styles.center))
+    elements.append(Spacer(1, 24))
+
+    # Info
+    data_info = [
+        ["No. Invoice", f": {order.invoice_number}"],
+        ["Tanggal Kunjungan", f": {order.visit_date}"],
+        ["Nama Pengunjung", f": {order.customer_name}"],
+        ["Status", f": {(order.payment_status or '').upper()}"]
+    ]
+
+    group_info = _group_info(details)
+    if group_info and group_info.get('name'):
+        data_info.append(["Nama Group", f": {group_info.get('name')}"])
+        if group_info.get('size'):
+             data_info.append(["Jumlah Peserta", f": {group_info.get('size')} Pax"])
+
+    t_info = Table(data_info, colWidths=[2*inch, 4*inch])
+    t_info.setStyle(styles.eticket_info)
+    elements.append(t_info)
+    elements.append(Spacer(1, 24))
+
+    # Items
+    data_items = [["Tiket / Item", "Qty"]]
+    for item in details.get('items', []):
+        data_items.append([item['name'], f"{item['qty']} Pax"])
+
+    for item in details.get('addons', []):
+        data_items.append([f"Addon - {item['name']}", "1"])
+
+    t_items = Table(data_items, colWidths=[4*inch, 2*inch])
+    t_items.setStyle(styles.eticket_items)
+    elements.append(t_items)
+
+    elements.append(Spacer(1, 36))
+    elements.append(Paragraph("Harap tunjukkan E-Ticket ini di loket masuk.", styles.center))
+    return elements
+
+# --- RENDER ---
+
+def _render(elements):
+    buffer = BytesIO()
+    new_document(buffer).build(elements)
+    return buffer.getvalue()
+
+def render_invoice(order, header_text, styles=None):
+    """Invoice PDF bytes."""
+    return _render(invoice_flowables(order, order.get_details(), header_text, styles))
+
+def render_eticket(order, header_text, styles=None, qr_version=None):
+    """E-ticket PDF bytes."""
+    return _render(eticket_flowables(order, order.get_details(), header_text, styles, qr_version))
+
+def _eticket_frame():
+    # Frame yang sama dengan SimpleDocTemplate di new_document()
+    width, height = A4
+    return Frame(30, 18, width - 60, height - 48)
+
+def _render_eticket_pages(orders, header_text, styles):
+    """One small PDF document with a page per order, drawn straight on the canvas. Returns (pdf bytes, pages)."""
+    buffer = BytesIO()
+    c = Canvas(buffer, pagesize=A4, pageCompression=1)
+    pages = 0
+    for order in orders:
+        elements = eticket_flowables(order, order.get_details(), header_text, styles, qr_version_for(order.uuid))
+        while elements:
+            remaining = len(elements)
+            _eticket_frame().addFromList(elements, c)
+            if len(elements) == remaining:
+                raise ValueError(f"E-ticket {order.uuid} does not fit on a page")
+            c.showPage()
+            pages += 1
+    c.save()
+    return buffer.getvalue(), pages
+
+_REF = re.compile(rb'(\d+) 0 R')
+_STREAM = re.compile(rb'>>\s*stream\r?\n')
+
+def _dict_head(body):
+    """Splits an object body into (dictionary part, stream data). Stream data is never touched."""
+    match = _STREAM.search(body)
+    return (body[:match.end()], body[match.end():]) if match else (body, b'')
+
+def parse_pdf(data):
+    """
+    Objects {number: body} and the trailer of a PDF with a classic xref table, as ReportLab writes it.
+    Raises ValueError for anything else (xref streams, object streams, broken offsets).
+    """
+    start = data.rfind(b'startxref')
+    if start < 0:
+        raise ValueError("PDF has no startxref")
+    xref_at = int(data[start + 9:].split()[0])
+    match = re.match(rb'xref\s+0 (\d+)\s+', data[xref_at:])
+    if not match:
+        raise ValueError("PDF has no classic xref table")
+    count = int(match.group(1))
+    entries = re.findall(rb'(\d{10}) (\d{5}) ([nf])', data[xref_at + match.end():xref_at + match.end() + count * 20])
+    if len(entries) != count:
+        raise ValueError("PDF xref table is incomplete")
+    offsets = sorted((int(offset), num) for num, (offset, _, kind) in enumerate(entries) if kind == b'n')
+
+    objects = {}
+    for i, (offset, num) in enumerate(offsets):
+        end = offsets[i + 1][0] if i + 1 < len(offsets) else xref_at
+        obj = data[offset:end]
+        if not obj.startswith(b'%d 0 obj' % num):
+            raise ValueError(f"PDF xref entry {num} does not point at its object")
+        objects[num] = obj[obj.index(b' obj') + 4:obj.rindex(b'endobj')].strip()
+    return objects, data[data.index(b'trailer', xref_at):start]
+
+def page_tree(objects, trailer):
+    """(page object numbers in order, page tree node numbers) of a parsed PDF."""
+    root = int(re.search(rb'/Root (\d+) 0 R', trailer).group(1))
+    pages, nodes = [], set()
+
+    def walk(num):
+        head = _dict_head(objects[num])[0]
+        if re.search(rb'/Type\s*/Pages\b', head):
+            # Atribut yang diwarisi dari node tidak ikut tersalin, jadi tidak boleh ada
+            if re.search(rb'/(Resources|MediaBox|CropBox|Rotate)\b', head):
+                raise ValueError("Page tree nodes with inherited attributes are not supported")
+            nodes.add(num)
+            for kid in _REF.findall(re.search(rb'/Kids\s*\[([^\]]*)\]', head).group(1)):
+                walk(int(kid))
+        elif re.search(rb'/Type\s*/Page\b', head):
+            pages.append(num)
+        else:
+            raise ValueError(f"Object {num} in the page tree is not a page")
+
+    walk(int(re.search(rb'/Pages (\d+) 0 R', objects[root]).group(1)))
+    return pages, nodes
+
+class PdfPageWriter:
+    """
+    Writes one PDF from several ReportLab-generated documents, page objects first and the page
+    tree last. Each added document is copied to fileobj right away, so only the current chunk
+    and the list of page object numbers stay in memory.
+    Only the pages and the objects they reference are copied (no catalog, outlines or info).
+    Input that does not look like parse_pdf() expects raises ValueError instead of being copied.
+    """
+
+    CATALOG, PAGES = 1, 2
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.offsets = {} # nomor object -> posisi byte, untuk tabel xref
+        self.kids = []
+        self.next_num = 3
+        self.position = 0
+        self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.position += len(data)
+
+    def _write_object(self, num, body):
+        self.offsets[num] = self.position
+        self._write(b'%d 0 obj\n' % num + body + b'\nendobj\n')
+
+    def add_document(self, data):
+        objects, trailer = parse_pdf(data)
+        pages, nodes = page_tree(objects, trailer)
+
+        # Object yang dipakai halaman (font, content stream, ...); /Parent menunjuk ke page tree
+        used, stack = set(pages), list(pages)
+        while stack:
+            for ref in _REF.findall(_dict_head(objects[stack.pop()])[0]):
+                ref = int(ref)
+                if ref in nodes or ref in used:
+                    continue
+                if ref not in objects:
+                    raise ValueError(f"PDF references missing object {ref}")
+                used.add(ref)
+                stack.append(ref)
+
+        numbers = dict.fromkeys(nodes, self.PAGES)
+        for num in sorted(used):
+            numbers[num] = self.next_num
+            self.next_num += 1
+
+        def renumber(match):
+            return b'%d 0 R' % numbers[int(match.group(1))]
+
+        for num in sorted(used):
+            head, stream = _dict_head(objects[num])
+            self._write_object(numbers[num], _REF.sub(renumber, head) + stream)
+        self.kids.extend(numbers[num] for num in pages)
+
+    def close(self):
+        kids = b' '.join(b'%d 0 R' % num for num in self.kids)
+        self._write_object(self.PAGES, b'<< /Type /Pages /Count %d /Kids [ %s ] >>' % (len(self.kids), kids))
+        self._write_object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+        xref_at = self.position
+        lines = [b'xref', b'0 %d' % self.next_num, b'0000000000 65535 f ']
+        lines += [b'%010d 00000 n ' % self.offsets[num] for num in range(1, self.next_num)]
+        self._write(b'\n'.join(lines) + b'\n')
+        self._write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (self.next_num, self.CATALOG, xref_at))
+
+def _check_pdf_page_writer():
+    """Merges two small ReportLab documents once at import, so an incompatible ReportLab fails loudly."""
+    buffer = BytesIO()
+    c = Canvas(buffer, pagesize=A4, pageCompression=1)
+    for text in ('1', '2'):
+        c.drawString(100, 100, text)
+        c.showPage()
+    c.save()
+    merged = BytesIO()
+    writer = PdfPageWriter(merged)
+    try:
+        writer.add_document(buffer.getvalue())
+        writer.add_document(buffer.getvalue())
+        writer.close()
+        pages, _ = page_tree(*parse_pdf(merged.getvalue()))
+    except (ValueError, AttributeError, KeyError) as e:
+        raise RuntimeError(f"ReportLab output is not supported by PdfPageWriter: {e}")
+    if len(pages) != 4:
+        raise RuntimeError(f"PdfPageWriter self-check produced {len(pages)} pages instead of 4")
+
+_check_pdf_page_writer()
+
+ETICKET_CHUNK_SIZE = 50
+
+def render_etickets(orders, header_text, fileobj, on_page=None, chunk_size=ETICKET_CHUNK_SIZE):
+    """
+    Writes the e-tickets of `orders` as one PDF, one ticket per page, into fileobj.
+    Tickets are rendered chunk_size orders at a time and each chunk is written out before the
+    next orders are read, so memory use does not grow with the number of orders.
+    on_page(page_number) is called after each finished page (for progress reporting).
+    """
+    styles = get_styles()
+    writer = PdfPageWriter(fileobj)
+    orders = iter(orders)
+    page = 0
+    while True:
+        chunk = list(islice(orders, chunk_size))
+        if not chunk:
+            break
+        data, pages = _render_eticket_pages(chunk, header_text, styles)
+        writer.add_document(data)
+        if on_page:
+            for page in range(page + 1, page + pages + 1):
+                on_page(page)
+    writer.close()
+
+# --- PDF CACHE ---
+
+# PDF order yang sudah lunas tidak berubah lagi, jadi disimpan di
+# instance/pdf_cache dan download berikutnya tidak perlu ReportLab sama sekali.
+# Nama file memuat versi konten: status pembayaran, header (nama wahana dari
+# settings) dan versi layout. Naikkan PDF_LAYOUT_VERSION setiap layout diubah.
+PDF_LAYOUT_VERSION = 1
+
+def pdf_cache_dir():
+    path = os.path.join(current_app.instance_path, 'pdf_cache')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def pdf_content_version(kind, order, header_text):
+    raw = f"{PDF_LAYOUT_VERSION}|{kind}|{order.uuid}|{order.payment_status}|{header_text}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+def cached_pdf(kind, order, header_text, render):
+    """
+    Path and ETag of the cached PDF for a paid order, calling render() only on a cache miss.
+    kind: 'invoice' or 'eticket'.
+    """
+    version = pdf_content_version(kind, order, header_text)
+    path = os.path.join(pdf_cache_dir(), f"{kind}-{order.uuid}-{version}.pdf")
+    try:
+        # mtime = terakhir dipakai, supaya prune_pdf_cache() hanya menghapus file yang tidak dipakai lagi
+        os.utime(path)
+    except FileNotFoundError:
+        write_atomic(path, render())
+    return path, version
+
+def invalidate_order_pdfs(order):
+    """Deletes every cached PDF of the order (call after changing it)."""
+    for path in glob.glob(os.path.join(pdf_cache_dir(), f"*-{glob.escape(order.uuid)}-*.pdf")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def prune_pdf_cache(keep_days=30):
+    """
+    Deletes cached PDFs not downloaded within keep_days: versions left behind by a settings
+    or layout change, and orders nobody opens anymore. Returns the number deleted.
+    """
+    cutoff = time.time() - keep_days * 86400
+    deleted = 0
+    with os.scandir(pdf_cache_dir()) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    deleted += 1
+            except FileNotFoundError:
+                pass
+    return deleted
+
+def eticket_pdf(order, header_text):
+    """E-ticket PDF bytes of a paid order, from the cache when it was rendered before."""
+    path, _ = cached_pdf('eticket', order, header_text,
+                         lambda: render_eticket(order, header_text, qr_version=qr_version_for(order.uuid)))
+    with open(path, 'rb') as f:
+        return f.read()
@@ -0,0 +1,111 @@
+import struct
+import zlib
+from functools import lru_cache
+import qrcode
+from qrcode.constants import ERROR_CORRECT_M
+from reportlab.lib import colors
+from reportlab.platypus import Flowable
+
+# Encoder QR ringan untuk kode tiket. Kode TIX-YYYYMMDD-XXXXXX (19 karakter,
+# semua huruf besar/angka/'-') muat di mode alphanumeric QR versi 1 (21x21)
+# dengan error correction M, jadi tidak perlu mencari versi (fit) dan hasilnya
+# langsung ditulis sebagai PNG 1-bit atau SVG tanpa lewat PIL.
+
+TICKET_QR_VERSION = 1
+BORDER = 4 # quiet zone minimum menurut spesifikasi QR
+
+@lru_cache(maxsize=1024)
+def qr_matrix(data, version=None, border=BORDER):
+    """Module matrix (tuple of rows of bools, True = dark) including the quiet zone. Cached per process."""
+    qr = qrcode.QRCode(version=version, error_correction=ERROR_CORRECT_M, border=border)
+    qr.add_data(data)
+    qr.make(fit=version is None)
+    return tuple(tuple(row) for row in qr.get_matrix())
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+def matrix_to_png(matrix, box_size=10):
+    """Encodes the matrix as a 1-bit grayscale PNG, each module box_size x box_size pixels."""
+    size = len(matrix) * box_size
+    row_bytes = (size + 7) // 8
+    raw = bytearray()
+    for row in matrix:
+        # Grayscale 1-bit: 0 = hitam, 1 = putih. Bangun satu baris pixel sebagai integer
+        bits = 0
+        for dark in row:
+            bits = (bits << box_size) | (0 if dark else (1 << box_size) - 1)
+        bits <<= row_bytes * 8 - size
+        line = b'\x00' + bits.to_bytes(row_bytes, 'big') # filter type 0 (None)
+        raw += line * box_size
+
+    header = struct.pack('>IIBBBBB', size, size, 1, 0, 0, 0, 0) # bit depth 1, grayscale
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', header),
+        _png_chunk(b'IDAT', zlib.compress(bytes(raw), 9)),
+        _png_chunk(b'IEND', b''),
+    ])
+
+def _dark_runs(matrix):
+    """Yields (x, y, length) for each horizontal run of dark modules."""
+    n = len(matrix)
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < n:
+            if row[x]:
+                start = x
+                while x < n and row[x]:
+                    x += 1
+                yield start, y, x - start
+            else:
+                x += 1
+
+class QRFlowable(Flowable):
+    """
+    Vector QR for ReportLab documents: all dark modules go into one filled path,
+    drawn straight on the canvas (much cheaper than a Drawing of Rect shapes).
+    """
+
+    def __init__(self, matrix, size):
+        Flowable.__init__(self)
+        self.matrix = matrix
+        self.size = size
+        self.width = self.height = size
+        self.hAlign = 'CENTER'
+
+    def wrap(self, availWidth, availHeight):
+        return self.size, self.size
+
+    def draw(self):
+        canvas = self.canv
+        module = self.size / len(self.matrix)
+        canvas.saveState()
+        canvas.setFillColor(colors.white)
+        canvas.rect(0, 0, self.size, self.size, stroke=0, fill=1)
+        path = canvas.beginPath()
+        for x, y, length in _dark_runs(self.matrix):
+            # Koordinat PDF dimulai dari bawah, matrix dari atas
+            path.rect(x * module, self.size - (y + 1) * module, length * module, module)
+        canvas.setFillColor(colors.black)
+        canvas.drawPath(path, stroke=0, fill=1)
+        canvas.restoreState()
+
+def matrix_to_svg(matrix, size_px=None):
+    """SVG with one path for all dark modules; scales without blurring."""
+    n = len(matrix)
+    parts = [f"M{x} {y}h{length}v1h-{length}z" for x, y, length in _dark_runs(matrix)]
+    size_attr = f' width="{size_px}" height="{size_px}"' if size_px else ''
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {n} {n}"{size_attr} shape-rendering="crispEdges">'
+        f'<rect width="{n}" height="{n}" fill="#fff"/><path d="{"".join(parts)}" fill="#000"/></svg>'
+    )
+
+def qr_png(data, version=None, box_size=10):
+    return matrix_to_png(qr_matrix(data, version), box_size)
+
+def qr_svg(data, version=None, size_px=None):
+    return matrix_to_svg(qr_matrix(data, version), size_px)
+
+def qr_flowable(data, size, version=None):
+    return QRFlowable(qr_matrix(data, version), size)
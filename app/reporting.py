@@ -0,0 +1,149 @@
+import json
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import db
+from .models import Order, OrderItem, DailySalesRollup
+from .utils import WIB_OFFSET
+
+def _rollup_rows(order):
+    """Rollup contributions of one paid order: {(date, item_type, name): [qty, revenue, order_count]}."""
+    created_at = order.created_at or datetime.utcnow()
+    day = (created_at + WIB_OFFSET).date()
+    rows = {(day, 'order', ''): [0, order.total_price or 0, 1]}
+
+    if order.order_items or order.order_addons:
+        items = [(i.name, i.qty, i.subtotal) for i in order.order_items]
+        addons = [(a.name, a.qty, a.price * a.qty) for a in order.order_addons]
+    else:
+        # Order lama: item hanya ada di details JSON
+        try:
+            details = json.loads(order.details) if order.details else {}
+        except (TypeError, ValueError):
+            print(f"Rollup: cannot parse details of order {order.id}")
+            details = {}
+        if not isinstance(details, dict):
+            details = {}
+        items = [
+            (item.get('name', 'Unknown'), item.get('qty', 0) or item.get('quantity', 0), item.get('subtotal', 0) or item.get('total', 0))
+            for item in details.get('items', []) or details.get('tickets', [])
+        ]
+        # Addon di checkout summary: satu entry = satu unit
+        addons = [(item.get('name', 'Unknown'), 1, item.get('price', 0)) for item in details.get('addons', [])]
+
+    seen = set()
+    for item_type, entries in (('ticket', items), ('addon', addons)):
+        for name, qty, revenue in entries:
+            key = (day, item_type, name)
+            row = rows.setdefault(key, [0, 0, 0])
+            row[0] += qty
+            row[1] += revenue
+            if key not in seen:
+                row[2] += 1
+                seen.add(key)
+
+    return rows
+
+def _upsert_rows(rows, sign=1):
+    for (day, item_type, name), (qty, revenue, order_count) in rows.items():
+        stmt = sqlite_insert(DailySalesRollup).values(
+            date=day, item_type=item_type, name=name,
+            qty=sign * qty, revenue=sign * revenue, order_count=sign * order_count
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['date', 'item_type', 'name'],
+            set_={
+                'qty': DailySalesRollup.qty + stmt.excluded.qty,
+                'revenue': DailySalesRollup.revenue + stmt.excluded.revenue,
+                'order_count': DailySalesRollup.order_count + stmt.excluded.order_count,
+            }
+        )
+        db.session.execute(stmt)
+
+def set_payment_status(order, new_status):
+    """
+    Changes order.payment_status and keeps DailySalesRollup in sync in the same transaction.
+    Call this instead of assigning payment_status directly; the caller commits.
+    """
+    old_status = order.payment_status
+    order.payment_status = new_status
+    if old_status != 'paid' and new_status == 'paid':
+        _upsert_rows(_rollup_rows(order), sign=1)
+    elif old_status == 'paid' and new_status != 'paid':
+        _upsert_rows(_rollup_rows(order), sign=-1)
+
+def record_paid_order(order):
+    """For orders created directly as 'paid' (deposit purchase)."""
+    _upsert_rows(_rollup_rows(order), sign=1)
+
+def rebuild_rollups():
+    """Recomputes DailySalesRollup from all paid orders. Returns the number of orders processed."""
+    totals = defaultdict(lambda: [0, 0, 0])
+    count = 0
+    # Item/addon dimuat per batch (selectin), bukan satu query per order
+    paid_orders = Order.query.filter(Order.payment_status == 'paid')\
+        .options(selectinload(Order.order_items), selectinload(Order.order_addons))\
+        .yield_per(500)
+    for order in paid_orders:
+        for key, values in _rollup_rows(order).items():
+            row = totals[key]
+            for i in range(3):
+                row[i] += values[i]
+        count += 1
+
+    DailySalesRollup.query.delete()
+    _upsert_rows(totals)
+    db.session.commit()
+    return count
+
+def pax_counts(orders):
+    """
+    {order.id: number of visitors} for many orders: one GROUP BY over OrderItem, and the
+    details JSON only for older orders that have no OrderItem rows.
+    """
+    orders = list(orders)
+    counts = dict(
+        db.session.query(OrderItem.order_id, func.sum(OrderItem.qty))
+        .filter(OrderItem.order_id.in_([o.id for o in orders]))
+        .group_by(OrderItem.order_id)
+    ) if orders else {}
+    for order in orders:
+        if order.id in counts:
+            continue
+        try:
+            details = json.loads(order.details) if order.details else {}
+            counts[order.id] = sum(item.get('qty', 0) or 0 for item in details.get('items', []))
+        except (TypeError, ValueError, AttributeError):
+            counts[order.id] = 0
+    return counts
+
+def sales_report(start_date, end_date):
+    """Daily totals, per-ticket and per-addon totals for start_date..end_date, read from the rollup."""
+    in_range = (DailySalesRollup.date >= start_date, DailySalesRollup.date <= end_date)
+
+    daily_report = [
+        {'date': row.date.strftime('%Y-%m-%d'), 'count': row.order_count, 'total': row.revenue}
+        for row in DailySalesRollup.query.filter(DailySalesRollup.item_type == 'order', *in_range)
+            .order_by(DailySalesRollup.date.desc())
+        if row.order_count
+    ]
+
+    def _per_item(item_type):
+        rows = db.session.query(
+            DailySalesRollup.name,
+            func.sum(DailySalesRollup.qty),
+            func.sum(DailySalesRollup.revenue)
+        ).filter(DailySalesRollup.item_type == item_type, *in_range)\
+         .group_by(DailySalesRollup.name)\
+         .order_by(func.sum(DailySalesRollup.qty).desc())
+        return [{'name': name, 'qty': qty, 'total': total} for name, qty, total in rows if qty]
+
+    return {
+        'daily_report': daily_report,
+        'ticket_report': _per_item('ticket'),
+        'addon_report': _per_item('addon'),
+        'total_revenue': sum(d['total'] for d in daily_report),
+        'total_orders': sum(d['count'] for d in daily_report),
+    }
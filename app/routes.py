@@ -1,40 +1,107 @@
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify, session, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, session, flash, current_app, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 import json
 import uuid
-import random
-import string
 from . import db, csrf
-from .models import Ticket, Addon, Order, SiteSetting, User, PromoCode, Gate, Partner, SpecialDate, DepositTransaction
-import csv
-from io import StringIO
-from flask import make_response
+from .models import Ticket, Addon, Order, SiteSetting, User, PromoCode, Gate, Partner, SpecialDate, DepositTransaction, InvoiceSequence, OrderItem, Job
 from datetime import datetime, timedelta
-from sqlalchemy import func, or_
-from .utils import send_invoice_email, send_eticket_email, generate_random_password, send_reseller_welcome_email, send_expired_email, generate_qr_file
+from sqlalchemy import func, or_, update, select, literal, union_all, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .utils import generate_random_password, send_reseller_welcome_email, qr_version_for, generate_ticket_code, is_valid_ticket_code, TICKET_CODE_PATTERN, filter_date_range, iter_keyset, keyset_page
+from .jobs import enqueue_order_email, enqueue_expired_emails, enqueue_eticket_export, enqueue_report_export
+from .pdf import render_invoice, render_eticket, render_etickets, cached_pdf, invalidate_order_pdfs
+from .exports import EXPORT_SYNC_LIMIT, REPORT_FORMATS, export_dir, header_text, iter_orders, stream_eticket_zip, stream_csv
 from .xendit_service import XenditService
+from .reporting import set_payment_status, record_paid_order, sales_report, pax_counts
+from .ledger import post_deposit_transaction, complete_deposit_transaction
+from .cache import get_settings, invalidate_settings, get_calendar_index, invalidate_calendar, compute_date_status, parse_closed_days, get_price_table, invalidate_catalog, VARIANTS
 import threading
 from io import BytesIO
 from flask import send_file
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 
 main = Blueprint('main', __name__)
 
-def send_email_with_context(app, func, order_id, base_url):
-    with app.test_request_context(base_url=base_url):
-        from .models import Order
-        order = Order.query.get(order_id)
-        if order:
-            func(order)
-        else:
-            print(f"Order {order_id} not found for email thread")
+# --- PAGINATED ADMIN LISTS ---
+
+def _paged_response(template, rows, next_cursor, row_json, **context):
+    """
+    Renders one keyset page of an admin list with a "load more" link (next_url) that keeps
+    the current filters. ?format=json returns the rows as JSON for infinite scroll.
+    """
+    # view_args (mis. <int:id>) ikut supaya url_for bisa membangun URL route berparameter
+    args = dict(request.args.to_dict(), **(request.view_args or {}))
+    args.pop('format', None)
+    next_url = url_for(request.endpoint, **dict(args, cursor=next_cursor)) if next_cursor else None
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'items': [row_json(row) for row in rows],
+            'next_cursor': next_cursor,
+            'next_url': url_for(request.endpoint, **dict(args, cursor=next_cursor, format='json')) if next_cursor else None
+        })
+    return render_template(template, next_url=next_url, **context)
+
+def _format_dt(value):
+    return value.strftime('%Y-%m-%d %H:%M') if value else None
+
+def _transaction_json(row):
+    if isinstance(row, DepositTransaction):
+        return {
+            'type': 'deposit',
+            'id': row.id,
+            'reference': row.display_id,
+            'customer': row.display_customer,
+            'amount': row.amount,
+            'status': row.display_status,
+            'created_at': _format_dt(row.created_at),
+            'url': url_for('main.admin_transaction_deposit_detail', id=row.id)
+        }
+    return {
+        'type': row.visit_type or 'personal',
+        'id': row.id,
+        'reference': row.invoice_number,
+        'customer': row.display_customer,
+        'amount': row.total_price,
+        'status': row.payment_status,
+        'payment_method': row.payment_method,
+        'created_at': _format_dt(row.created_at),
+        'url': url_for('main.admin_transaction_order_detail', id=row.id)
+    }
+
+def _scan_json(order):
+    return {
+        'id': order.id,
+        'invoice': order.invoice_number,
+        'code': order.uuid,
+        'customer': order.customer_name,
+        'visit_date': order.visit_date,
+        'checkin_at': _format_dt(order.checkin_at),
+        'checkin_gate': order.checkin_gate,
+        'wristband_at': _format_dt(order.wristband_at)
+    }
+
+def _user_json(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'name': user.name,
+        'email': user.email,
+        'role': user.role,
+        'is_active': user.is_active,
+        'agency_name': user.agency_name,
+        'deposit_balance': user.deposit_balance
+    }
+
+def _promo_json(promo):
+    return {
+        'id': promo.id,
+        'code': promo.code,
+        'discount_type': promo.discount_type,
+        'discount_value': promo.discount_value,
+        'is_active': promo.is_active,
+        'created_at': _format_dt(promo.created_at)
+    }
 
 # --- PROMO CODE ROUTES ---
 
@@ -73,8 +140,9 @@ def check_promo():
 @main.route('/dashboard/promos')
 def admin_promos():
     if not session.get('logged_in'): return redirect(url_for('main.login'))
-    promos = PromoCode.query.order_by(PromoCode.created_at.desc()).all()
-    return render_template('admin/promos.html', promos=promos)
+    # Urut id (sama dengan urutan dibuat); created_at promo lama bisa kosong
+    promos, next_cursor = keyset_page(PromoCode.query, [PromoCode.id], request.args.get('cursor'))
+    return _paged_response('admin/promos.html', promos, next_cursor, _promo_json, promos=promos)
 
 @main.route('/promo/add', methods=['POST'])
 def add_promo():
@@ -113,42 +181,52 @@ def export_transactions():
     status = request.args.get('status')
     payment_method = request.args.get('payment_method')
     
-    if start_date:
-        query = query.filter(func.date(Order.created_at) >= start_date)
-    if end_date:
-        query = query.filter(func.date(Order.created_at) <= end_date)
+    query = filter_date_range(query, Order.created_at, start_date, end_date)
     if status and status != 'all':
         query = query.filter(Order.payment_status == status)
     if payment_method and payment_method != 'all':
         query = query.filter(Order.payment_method == payment_method)
         
-    orders = query.order_by(Order.created_at.desc()).all()
-    
-    # Generate CSV
-    si = StringIO()
-    cw = csv.writer(si)
-    cw.writerow(['No Invoice', 'Tanggal Order', 'Nama Customer', 'Email', 'Telepon', 'Total', 'Status', 'Metode Bayar', 'Kode Promo', 'Diskon'])
-    
-    for order in orders:
-        cw.writerow([
-            order.invoice_number,
-            order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            order.customer_name,
-            order.customer_email,
-            order.customer_phone,
-            order.total_price,
-            order.payment_status,
-            order.payment_method,
-            order.promo_code or '',
-            order.discount_amount or 0
-        ])
-        
-    output = make_response(si.getvalue())
+    # Baris dibaca per batch dari database dan dikirim langsung (streaming),
+    # jadi memori worker tetap kecil walaupun ada ratusan ribu order
+    rows = iter_keyset(query.with_entities(
+        Order.invoice_number, Order.created_at, Order.customer_name, Order.customer_email, Order.customer_phone,
+        Order.total_price, Order.payment_status, Order.payment_method, Order.promo_code, Order.discount_amount, Order.id
+    ), [Order.created_at, Order.id], descending=True)
+
+    def csv_rows():
+        for order in rows:
+            yield [
+                order.invoice_number,
+                order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                order.customer_name,
+                order.customer_email,
+                order.customer_phone,
+                order.total_price,
+                order.payment_status,
+                order.payment_method,
+                order.promo_code or '',
+                order.discount_amount or 0
+            ]
+
+    header = ['No Invoice', 'Tanggal Order', 'Nama Customer', 'Email', 'Telepon', 'Total', 'Status', 'Metode Bayar', 'Kode Promo', 'Diskon']
+    output = Response(stream_with_context(stream_csv(header, csv_rows())), mimetype='text/csv')
     output.headers["Content-Disposition"] = "attachment; filename=transactions.csv"
-    output.headers["Content-type"] = "text/csv"
     return output
 
 
+@main.route('/dashboard/transactions/export-report')
+def export_report():
+    if not session.get('logged_in') or session.get('user_role') != 'admin': return redirect(url_for('main.login'))
+
+    # Order, item order, deposit dan check-in dalam satu file, dibuat oleh worker
+    fmt = request.args.get('format', 'xlsx')
+    if fmt not in REPORT_FORMATS:
+        return "Format tidak valid", 400
+    job = enqueue_report_export(fmt, request.args.get('start_date') or None, request.args.get('end_date') or None, session.get('user_id'))
+    db.session.commit()
+    return redirect(url_for('main.export_status', job_id=job.id))
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'svg'}
 
 def allowed_file(filename):
@@ -161,7 +239,7 @@ def index():
     tickets = Ticket.query.filter_by(is_active=True).all()
     addons = Addon.query.filter_by(is_active=True).all()
     
-    settings = SiteSetting.query.first()
+    settings = get_settings()
     min_group_order = settings.min_group_order if settings else 10
     
     js_prices = {}
@@ -177,23 +255,15 @@ def index():
     return render_template('index.html', tickets=tickets, addons=addons, js_prices=js_prices, min_group_order=min_group_order)
 
 def get_date_status(date_obj):
-    # 1. Check Special Dates
+    # 1. Fast path: precomputed calendar index (special dates, closed days, weekend)
+    status = get_calendar_index().get(date_obj)
+    if status:
+        return status
+
+    # 2. Outside the indexed window, resolve directly
     special = SpecialDate.query.filter_by(date=date_obj).first()
-    if special:
-        return special.type
-    
-    # 2. Check Weekly Closed Days
-    settings = SiteSetting.query.first()
-    if settings and settings.weekly_closed_days:
-        closed_days = [int(d) for d in settings.weekly_closed_days.split(',') if d.strip()]
-        if date_obj.weekday() in closed_days:
-            return 'closed'
-            
-    # 3. Check Weekend (if not closed)
-    if date_obj.weekday() >= 5: # 5=Sat, 6=Sun
-        return 'weekend'
-        
-    return 'regular'
+    closed_days = parse_closed_days(get_settings().weekly_closed_days)
+    return compute_date_status(date_obj, special.type if special else None, closed_days)
 
 @main.route('/api/check-date')
 def check_date():
@@ -209,11 +279,11 @@ def check_date():
     status = get_date_status(date_obj)
             
     # Get prices
-    tickets = Ticket.query.filter_by(is_active=True).all()
+    catalog = get_price_table()
     prices = {}
-    for t in tickets:
-        prices[f"{t.slug}_adult"] = t.get_price(status, 'adult')
-        prices[f"{t.slug}_child"] = t.get_price(status, 'child')
+    for t in catalog.active_tickets():
+        prices[f"{t.slug}_adult"] = catalog.ticket_price(t.slug, status, 'adult')
+        prices[f"{t.slug}_child"] = catalog.ticket_price(t.slug, status, 'child')
         
     return jsonify({
         'status': 'success',
@@ -222,6 +292,47 @@ def check_date():
         'prices': prices
     })
 
+@main.route('/api/calendar')
+def calendar_prices():
+    month_str = request.args.get('month') or datetime.now().strftime('%Y-%m')
+    try:
+        first_day = datetime.strptime(month_str, '%Y-%m').date()
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid month format'}), 400
+
+    # Price table per date type, computed once for the whole month
+    catalog = get_price_table()
+    tickets = catalog.active_tickets()
+    price_table = {}
+
+    def prices_for(date_type):
+        if date_type not in price_table:
+            price_table[date_type] = {
+                f"{t.slug}_{variant}": catalog.ticket_price(t.slug, date_type, variant)
+                for t in tickets for variant in VARIANTS
+            }
+        return price_table[date_type]
+
+    days = {}
+    day = first_day
+    while day.month == first_day.month:
+        status = get_date_status(day)
+        days[day.strftime('%Y-%m-%d')] = {
+            'type': status,
+            'prices': prices_for(status)
+        }
+        day += timedelta(days=1)
+
+    response = jsonify({
+        'status': 'success',
+        'month': first_day.strftime('%Y-%m'),
+        'days': days
+    })
+    response.add_etag()
+    # Selalu revalidasi (304 via ETag): tanggal yang baru ditutup admin harus langsung terlihat
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @main.route('/api/order', methods=['POST'])
 def create_order():
     try:
@@ -297,9 +408,7 @@ def checkout():
         }
         
         # Process Tickets
-        # Use explicit list conversion to avoid any iterable issues
-        all_tickets = Ticket.query.all()
-        tickets_map = {t.slug: t for t in all_tickets}
+        catalog = get_price_table()
         
         counts = data.get('counts', {})
         if not isinstance(counts, dict):
@@ -320,10 +429,10 @@ def checkout():
                 else:
                     continue
                 
-                ticket = tickets_map.get(slug)
+                ticket = catalog.tickets.get(slug)
                 if ticket:
                     role = session.get('user_role', 'guest')
-                    price = ticket.get_price(date_status, variant, role=role)
+                    price = catalog.ticket_price(slug, date_status, variant, role=role)
                     
                     variant_name = 'Dewasa' if variant == 'adult' else ('Anak' if variant == 'child' else 'Umum')
                     name = f"{ticket.name} ({variant_name})"
@@ -334,27 +443,27 @@ def checkout():
                         'qty': qty,
                         'price': price,
                         'subtotal': subtotal,
-                        'category': ticket.category or 'personal'
+                        'category': ticket.category,
+                        'slug': ticket.slug,
+                        'variant': variant
                     })
                     summary['total'] += subtotal
 
         # Process Addons
-        all_addons = Addon.query.all()
-        addons_map = {a.slug: a for a in all_addons}
-        
         selected_addons = data.get('addons', [])
         if not isinstance(selected_addons, list):
             selected_addons = []
             
         role = session.get('user_role', 'guest')
         for slug in selected_addons:
-            addon = addons_map.get(slug)
+            addon = catalog.addons.get(slug)
             if addon:
-                price = addon.get_price(role=role)
+                price = catalog.addon_price(slug, role=role)
                 summary['addons'].append({
                     'name': addon.name,
                     'price': price,
-                    'category': addon.category or 'personal'
+                    'category': addon.category,
+                    'slug': addon.slug
                 })
                 summary['total'] += price
 
@@ -390,12 +499,29 @@ def checkout():
         flash(f'Terjadi kesalahan: {str(e)}', 'error')
         return redirect(url_for('main.index'))
 
-def generate_ticket_code():
-    """Generates a ticket code in format TIX-YYYYMMDD-XXXXXX"""
-    date_str = datetime.now().strftime('%Y%m%d')
-    chars = string.ascii_uppercase + string.digits
-    random_str = ''.join(random.choices(chars, k=6))
-    return f"TIX-{date_str}-{random_str}"
+def next_invoice_sequence(today_str):
+    """Returns the next value of the per-day invoice counter, incremented in the current transaction."""
+    sequence = db.session.execute(
+        update(InvoiceSequence)
+        .where(InvoiceSequence.day == today_str)
+        .values(last_value=InvoiceSequence.last_value + 1)
+        .returning(InvoiceSequence.last_value)
+    ).scalar()
+    
+    if sequence is None:
+        # First invoice of the day: continue after any invoices created before the counter existed
+        existing = Order.query.filter(Order.invoice_number.like(f"INV-{today_str}-%")).count()
+        sequence = db.session.execute(
+            sqlite_insert(InvoiceSequence)
+            .values(day=today_str, last_value=existing + 1)
+            .on_conflict_do_update(
+                index_elements=[InvoiceSequence.day],
+                set_={'last_value': InvoiceSequence.last_value + 1}
+            )
+            .returning(InvoiceSequence.last_value)
+        ).scalar()
+        
+    return sequence
 
 @main.route('/api/process-payment', methods=['POST'])
 def process_payment():
@@ -461,24 +587,20 @@ def process_payment():
         }
         
         # Generate Invoice Number: INV-YYYYMMDD-XXXX
+        # The counter row is locked until commit, so concurrent workers never share a number
+        # and a rolled back order gives its number back (gap-free per day)
         today_str = datetime.now().strftime('%Y%m%d')
-        # Count orders for today to generate sequence
-        # We use a pattern matching for the invoice number for today
-        pattern = f"INV-{today_str}-%"
-        today_count = Order.query.filter(Order.invoice_number.like(pattern)).count()
-        sequence = f"{today_count + 1:04d}"
-        invoice_number = f"INV-{today_str}-{sequence}"
+        sequence = next_invoice_sequence(today_str)
+        invoice_number = f"INV-{today_str}-{sequence:04d}"
         
         # Generate Unique Ticket Code (UUID replacement)
-        while True:
-            ticket_code = generate_ticket_code()
-            if not Order.query.filter_by(uuid=ticket_code).first():
-                break
+        # Derived from the same daily sequence, so it is unique without probing the Order table
+        ticket_code = generate_ticket_code(sequence, today_str)
         
         # Create Order
         
         # Calculate Expiration Time
-        settings = SiteSetting.query.first()
+        settings = get_settings()
         timeout_minutes = settings.payment_timeout_minutes if settings else 60
         expires_at = datetime.utcnow() + timedelta(minutes=timeout_minutes)
 
@@ -504,26 +626,24 @@ def process_payment():
             expires_at=expires_at,
             user_id=session.get('user_id') if session.get('user_role') == 'reseller' else None
         )
+        # Item & addon disimpan juga sebagai baris OrderItem/OrderAddon (untuk agregasi SQL)
+        new_order.add_line_items(summary['order_items'], summary['addons'])
         
         # IF DEPOSIT, REDUCE SALDO
         if payment_method == 'deposit':
-            user = User.query.get(session.get('user_id'))
-            if not user or user.deposit_balance < final_total:
+            # Saldo dipotong atomik (UPDATE ... RETURNING) hanya jika cukup, jadi dua
+            # checkout bersamaan tidak bisa membuat saldo minus
+            purchase_tx = post_deposit_transaction(
+                session.get('user_id'), -final_total, 'purchase',
+                description=f"Pembelian Tiket: {invoice_number}", require_funds=True
+            )
+            if not purchase_tx:
+                 db.session.rollback()
                  return jsonify({'status': 'error', 'message': 'Saldo deposit tidak mencukupi'}), 400
             
-            user.deposit_balance -= final_total
-            
-            # Record Purchase Transaction
-            purchase_tx = DepositTransaction(
-                user_id=user.id,
-                amount=-final_total,
-                transaction_type='purchase',
-                description=f"Pembelian Tiket: {invoice_number}",
-                status='completed'
-            )
-            db.session.add(purchase_tx)
             # Update session balance for UI
-            session['deposit_balance'] = user.deposit_balance
+            session['deposit_balance'] = purchase_tx.balance_after
+            record_paid_order(new_order)
 
         db.session.add(new_order)
         db.session.commit()
@@ -573,18 +693,19 @@ def process_payment():
                 print(f"Xendit Error: {xe}")
                 # We continue to normal flow as fallback, or the frontend can handle the absence of xendit_url
         
-        # Send Email (Async)
+        # Send Email (via job queue)
         try:
-            app = current_app._get_current_object()
             base_url = request.url_root
             if payment_method == 'deposit':
                  # Reseller instant pay - Send E-Ticket directly
-                 threading.Thread(target=send_email_with_context, args=(app, send_eticket_email, new_order.id, base_url)).start()
+                 enqueue_order_email('eticket', new_order.id, base_url)
             else:
                  # Regular - Send Invoice
-                 threading.Thread(target=send_email_with_context, args=(app, send_invoice_email, new_order.id, base_url)).start()
+                 enqueue_order_email('invoice', new_order.id, base_url)
+            db.session.commit()
         except Exception as e:
-            print(f"Failed to start email thread: {e}")
+            db.session.rollback()
+            print(f"Failed to queue email: {e}")
         
         # Clear session
         session.pop('checkout_summary', None)
@@ -610,7 +731,7 @@ def xendit_webhook():
     print(f"Body: {request.get_data(as_text=True)}")
 
     # Verify Callback Token
-    settings = SiteSetting.query.first()
+    settings = get_settings()
     expected_token = settings.xendit_webhook_token if settings and settings.xendit_webhook_token else os.getenv('XENDIT_WEBHOOK_TOKEN')
     
     # Xendit sends x-callback-token header
@@ -639,21 +760,15 @@ def xendit_webhook():
         print(f"WEBHOOK INFO: Found Order {order.id}")
         if status in ['PAID', 'SETTLED', 'COMPLETED']:
             if order.payment_status != 'paid':
-                order.payment_status = 'paid'
+                set_payment_status(order, 'paid')
+                # Send E-Ticket Email (queued in the same transaction)
+                enqueue_order_email('eticket', order.id, request.url_root)
                 db.session.commit()
                 print(f"WEBHOOK SUCCESS: Order {order.id} marked as PAID")
-                
-                # Send E-Ticket Email (Async)
-                try:
-                    app = current_app._get_current_object()
-                    base_url = request.url_root
-                    threading.Thread(target=send_email_with_context, args=(app, send_eticket_email, order.id, base_url)).start()
-                except Exception as e:
-                    print(f"Failed to start eticket email thread: {e}")
             else:
                 print(f"WEBHOOK INFO: Order {order.id} already PAID")
         elif status == 'EXPIRED':
-            order.payment_status = 'expired'
+            set_payment_status(order, 'expired')
             db.session.commit()
             print(f"WEBHOOK INFO: Order {order.id} marked as EXPIRED")
     else:
@@ -662,26 +777,23 @@ def xendit_webhook():
         if tx:
             print(f"WEBHOOK INFO: Found DepositTransaction {tx.id}")
             if status in ['PAID', 'SETTLED', 'COMPLETED']:
-                if tx.status != 'completed':
-                    tx.status = 'completed'
+                user = User.query.get(tx.user_id)
+                if not user:
+                    print(f"WEBHOOK ERROR: User {tx.user_id} not found for deposit {tx.id}")
+                    return jsonify({'status': 'error', 'message': 'User not found'}), 500
+
+                # Status + saldo diubah atomik dalam satu transaksi: webhook ganda/retry
+                # untuk top-up yang sama hanya menambah saldo sekali
+                if complete_deposit_transaction(tx) is not None:
+                    # Extend expiration
+                    settings = get_settings()
+                    duration = settings.reseller_deposit_duration_days if settings else 365
+                    user.deposit_expires_at = datetime.utcnow() + timedelta(days=duration)
                     
-                    # Update user balance
-                    user = User.query.get(tx.user_id)
-                    if user:
-                        user.deposit_balance = (user.deposit_balance or 0) + tx.amount
-                        
-                        # Extend expiration
-                        settings = SiteSetting.query.first()
-                        duration = settings.reseller_deposit_duration_days if settings else 365
-                        user.deposit_expires_at = datetime.utcnow() + timedelta(days=duration)
-                        
-                        db.session.commit()
-                        print(f"WEBHOOK SUCCESS: Deposit {tx.id} COMPLETED. User {user.id} balance updated.")
-                    else:
-                        print(f"WEBHOOK ERROR: User {tx.user_id} not found for deposit {tx.id}")
-                        db.session.rollback() # Rollback tx status update if user not found
-                        return jsonify({'status': 'error', 'message': 'User not found'}), 500
+                    db.session.commit()
+                    print(f"WEBHOOK SUCCESS: Deposit {tx.id} COMPLETED. User {user.id} balance updated.")
                 else:
+                    db.session.rollback()
                     print(f"WEBHOOK INFO: Deposit {tx.id} already COMPLETED")
             elif status == 'EXPIRED':
                 tx.status = 'expired'
@@ -697,16 +809,10 @@ def xendit_webhook():
 def pay_dummy(order_id):
     try:
         order = Order.query.get_or_404(order_id)
-        order.payment_status = 'paid'
+        set_payment_status(order, 'paid')
+        # Send E-Ticket Email (queued in the same transaction)
+        enqueue_order_email('eticket', order.id, request.url_root)
         db.session.commit()
-        
-        # Send E-Ticket Email (Async)
-        try:
-            app = current_app._get_current_object()
-            base_url = request.url_root
-            threading.Thread(target=send_email_with_context, args=(app, send_eticket_email, order.id, base_url)).start()
-        except Exception as e:
-            print(f"Failed to start eticket email thread: {e}")
             
         return jsonify({'status': 'success'})
     except Exception as e:
@@ -722,26 +828,17 @@ def payment_page(uuid):
     if order.payment_status == 'pending' and order.expires_at:
         if datetime.utcnow() > order.expires_at:
             order.payment_status = 'expired'
+            # Send Expired Email (queued in the same transaction)
+            enqueue_order_email('expired', order.id, request.url_root)
             db.session.commit()
             is_expired = True
-            
-            # Send Expired Email (Async)
-            try:
-                app = current_app._get_current_object()
-                base_url = request.url_root
-                threading.Thread(target=send_email_with_context, args=(app, send_expired_email, order.id, base_url)).start()
-            except Exception as e:
-                print(f"Failed to start expired email thread: {e}")
 
     elif order.payment_status == 'expired':
         is_expired = True
     
     # Parse details back to object if needed, or pass raw
     # We might want to pass it as object to template
-    try:
-        order_details = json.loads(order.details)
-    except:
-        order_details = {}
+    order_details = order.get_details()
         
     return render_template('payment.html', order=order, details=order_details, is_expired=is_expired)
 
@@ -804,7 +901,7 @@ def reseller_topup():
         return redirect(url_for('main.login'))
     
     user = User.query.get(session.get('user_id'))
-    settings = SiteSetting.query.first()
+    settings = get_settings()
     
     # Check if user has ever had a deposit (renewal vs initial)
     has_existing_deposit = user.deposit_balance is not None and user.deposit_balance > 0
@@ -868,45 +965,65 @@ def reseller_history():
     if not session.get('logged_in') or session.get('user_role') != 'reseller':
         return redirect(url_for('main.login'))
         
-    user = User.query.get(session.get('user_id'))
-    orders = Order.query.filter_by(user_id=user.id).all()
-    deposits = DepositTransaction.query.filter_by(user_id=user.id).all()
-    
-    # Combine and standardize for display
-    transactions = []
-    
-    for o in orders:
-        # Avoid attribute conflict if already set
-        o.display_type = 'tiket'
-        o.display_date = o.created_at
-        o.display_amount = o.total_price
-        o.display_status = o.payment_status
-        o.display_desc = f"Order #{o.invoice_number}"
-        o.display_id = o.uuid # used for link
-        transactions.append(o)
-        
-    for d in deposits:
-        d.display_type = 'deposit'
-        d.display_date = d.created_at
-        d.display_amount = d.amount
-        d.display_status = d.status
-        d.display_desc = d.description or d.transaction_type.capitalize()
-        d.display_id = d.id # not really used for link same way
-        transactions.append(d)
-        
-    # Sort by date desc
-    transactions.sort(key=lambda x: x.display_date, reverse=True)
-    
-    return render_template('reseller/history.html', orders=transactions)
+    user_id = session.get('user_id')
+
+    # Order dan deposit digabung (UNION ALL) dengan kolom yang sama, lalu diurutkan
+    # dan dipaginasi di database: hanya satu halaman baris ringan yang dibaca
+    orders = select(
+        literal('tiket').label('type'), Order.created_at.label('date'), Order.total_price.label('amount'),
+        Order.payment_status.label('status'), Order.invoice_number.label('description'), Order.uuid.label('ref'),
+        Order.visit_date.label('visit_date'), literal(None).label('transaction_type'), Order.id.label('id')
+    ).where(Order.user_id == user_id)
+    deposits = select(
+        literal('deposit'), DepositTransaction.created_at, DepositTransaction.amount,
+        DepositTransaction.status, DepositTransaction.description, literal(None),
+        literal(None), DepositTransaction.transaction_type, DepositTransaction.id
+    ).where(DepositTransaction.user_id == user_id)
+    history = union_all(orders, deposits).subquery()
+
+    rows, next_cursor = keyset_page(db.session.query(history), [history.c.date, history.c.type, history.c.id], request.args.get('cursor'))
+
+    stats = db.session.query(
+        func.count(Order.id),
+        func.coalesce(func.sum(case((Order.payment_status == 'paid', 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Order.payment_status == 'pending', 1), else_=0)), 0)
+    ).filter(Order.user_id == user_id).one()
+
+    return _paged_response('reseller/history.html', rows, next_cursor, _history_json, transactions=rows,
+                           total_orders=stats[0], paid_orders=stats[1], pending_orders=stats[2])
+
+def _history_json(row):
+    item = dict(row._mapping)
+    item['date'] = _format_dt(item['date'])
+    return item
+
+@main.route('/reseller/history/export-etickets')
+def reseller_export_etickets():
+    if not session.get('logged_in') or session.get('user_role') != 'reseller':
+        return redirect(url_for('main.login'))
+
+    query = Order.query.filter_by(user_id=session.get('user_id'))
+    return _export_etickets(query, url_for('main.reseller_history'))
 
 @main.route('/reseller/deposit-history')
 def reseller_deposit_history():
     if not session.get('logged_in') or session.get('user_role') != 'reseller':
         return redirect(url_for('main.login'))
         
-    user = User.query.get(session.get('user_id'))
-    deposits = DepositTransaction.query.filter_by(user_id=user.id).order_by(DepositTransaction.created_at.desc()).all()
-    return render_template('reseller/deposit_history.html', deposits=deposits)
+    query = DepositTransaction.query.filter_by(user_id=session.get('user_id'))
+    deposits, next_cursor = keyset_page(query, [DepositTransaction.created_at, DepositTransaction.id], request.args.get('cursor'))
+    return _paged_response('reseller/deposit_history.html', deposits, next_cursor, _deposit_json, deposits=deposits)
+
+def _deposit_json(tx):
+    return {
+        'id': tx.id,
+        'date': _format_dt(tx.created_at),
+        'type': tx.transaction_type,
+        'description': tx.description,
+        'amount': tx.amount,
+        'status': tx.status,
+        'balance_after': tx.balance_after
+    }
 
 @main.route('/reseller/order')
 def reseller_order():
@@ -934,7 +1051,7 @@ def reseller_order():
     all_addons = Addon.query.filter_by(is_active=True).all()
     addons = [a for a in all_addons if 'reseller' in (a.category or '').lower().split(',')]
     
-    settings = SiteSetting.query.first()
+    settings = get_settings()
     
     return render_template('reseller/order.html', 
                           tickets=tickets, 
@@ -982,8 +1099,7 @@ def reseller_checkout():
         }
         
         # Process Tickets
-        all_tickets = Ticket.query.all()
-        tickets_map = {t.slug: t for t in all_tickets}
+        catalog = get_price_table()
         counts = data.get('counts', {})
         
         for key, qty in counts.items():
@@ -1002,10 +1118,10 @@ def reseller_checkout():
                 else:
                     continue
                 
-                ticket = tickets_map.get(slug)
+                ticket = catalog.tickets.get(slug)
                 if ticket:
                     # FORCE RESELLER PRICE
-                    price = ticket.get_price(date_status, variant, role='reseller')
+                    price = catalog.ticket_price(slug, date_status, variant, role='reseller')
                     
                     variant_name = 'Dewasa' if variant == 'adult' else ('Anak' if variant == 'child' else 'Umum')
                     name = f"{ticket.name} ({variant_name})"
@@ -1016,25 +1132,24 @@ def reseller_checkout():
                         'qty': qty,
                         'price': price,
                         'subtotal': subtotal,
-                        'category': ticket.category or 'personal',
+                        'category': ticket.category,
                         'slug': ticket.slug,
                         'variant': variant
                     })
                     summary['total'] += subtotal
 
         # Process Addons
-        all_addons = Addon.query.all()
-        addons_map = {a.slug: a for a in all_addons}
         selected_addons = data.get('addons', [])
         
         for slug in selected_addons:
-            addon = addons_map.get(slug)
+            addon = catalog.addons.get(slug)
             if addon:
-                price = addon.get_price(role='reseller')
+                price = catalog.addon_price(slug, role='reseller')
                 summary['addons'].append({
                     'name': addon.name,
                     'price': price,
-                    'category': addon.category or 'personal'
+                    'category': addon.category,
+                    'slug': addon.slug
                 })
                 summary['total'] += price
         
@@ -1075,7 +1190,7 @@ def dashboard():
     
     today = datetime.now().date()
     # Note: created_at is datetime, so we filter by date
-    today_orders = Order.query.filter(func.date(Order.created_at) == today).count()
+    today_orders = filter_date_range(Order.query, Order.created_at, today, today).count()
     
     # Recent Check-ins
     recent_checkins = Order.query.filter(
@@ -1112,12 +1227,10 @@ def admin_transactions():
         now = datetime.utcnow()
         expired_orders = Order.query.filter(Order.payment_status == 'pending', Order.expires_at < now).all()
         if expired_orders:
-            app = current_app._get_current_object()
-            base_url = request.url_root
             for order in expired_orders:
                 order.payment_status = 'expired'
-                # Send Email
-                threading.Thread(target=send_email_with_context, args=(app, send_expired_email, order.id, base_url)).start()
+            # Send Email (dikirim worker secara batch)
+            enqueue_expired_emails([order.id for order in expired_orders], request.url_root)
             db.session.commit()
     except Exception as e:
         print(f"Lazy cleanup error: {e}")
@@ -1128,18 +1241,17 @@ def admin_transactions():
     status = request.args.get('status')
     payment_method = request.args.get('payment_method')
     tx_type = request.args.get('type', 'all')
+    cursor = request.args.get('cursor')
     
     results = []
+    next_cursor = None
     
     # TICKET ORDERS
     if tx_type in ['all', 'personal', 'group']:
         # Filter out reseller orders
         order_query = Order.query.outerjoin(User).filter(or_(User.id == None, User.role != 'reseller'))
         
-        if start_date:
-            order_query = order_query.filter(func.date(Order.created_at) >= start_date)
-        if end_date:
-            order_query = order_query.filter(func.date(Order.created_at) <= end_date)
+        order_query = filter_date_range(order_query, Order.created_at, start_date, end_date)
         if status and status != 'all':
             order_query = order_query.filter(Order.payment_status == status)
         if payment_method and payment_method != 'all':
@@ -1147,7 +1259,7 @@ def admin_transactions():
         if tx_type in ['personal', 'group']:
             order_query = order_query.filter(Order.visit_type == tx_type)
             
-        orders = order_query.order_by(Order.created_at.desc()).all()
+        orders, next_cursor = keyset_page(order_query, [Order.created_at, Order.id], cursor)
         for o in orders:
             # Display Type: Personal or Group
             o.display_type = (o.visit_type or 'Personal').title()
@@ -1169,10 +1281,7 @@ def admin_transactions():
     if tx_type == 'deposit':
         # Only show topups and adjustments, not internal purchases (which are already in orders)
         deposit_query = DepositTransaction.query.filter(DepositTransaction.transaction_type != 'purchase')
-        if start_date:
-            deposit_query = deposit_query.filter(func.date(DepositTransaction.created_at) >= start_date)
-        if end_date:
-            deposit_query = deposit_query.filter(func.date(DepositTransaction.created_at) <= end_date)
+        deposit_query = filter_date_range(deposit_query, DepositTransaction.created_at, start_date, end_date)
         if status and status != 'all':
             # Map order status to deposit status
             # status can be: pending, paid, expired
@@ -1180,7 +1289,7 @@ def admin_transactions():
             mapped_status = 'completed' if status == 'paid' else status
             deposit_query = deposit_query.filter(DepositTransaction.status == mapped_status)
             
-        deposits = deposit_query.order_by(DepositTransaction.created_at.desc()).all()
+        deposits, next_cursor = keyset_page(deposit_query, [DepositTransaction.created_at, DepositTransaction.id], cursor)
         for d in deposits:
             d.display_type = 'Deposit'
             d.display_id = d.external_id or f"TX-{d.id}"
@@ -1189,9 +1298,8 @@ def admin_transactions():
             d.display_status = 'paid' if d.status == 'completed' else d.status
             results.append(d)
             
-    # Combine and sort
-    results.sort(key=lambda x: x.created_at, reverse=True)
-    return render_template('admin/transactions.html', orders=results)
+    # Satu halaman (order ATAU deposit, sudah urut created_at terbaru)
+    return _paged_response('admin/transactions.html', results, next_cursor, _transaction_json, orders=results)
 
 @main.route('/dashboard/transactions/reseller')
 def admin_reseller_transactions():
@@ -1210,10 +1318,7 @@ def admin_reseller_transactions():
     # Filter FOR reseller orders
     order_query = Order.query.join(User).filter(User.role == 'reseller')
     
-    if start_date:
-        order_query = order_query.filter(func.date(Order.created_at) >= start_date)
-    if end_date:
-        order_query = order_query.filter(func.date(Order.created_at) <= end_date)
+    order_query = filter_date_range(order_query, Order.created_at, start_date, end_date)
     if status and status != 'all':
         order_query = order_query.filter(Order.payment_status == status)
     if payment_method and payment_method != 'all':
@@ -1221,7 +1326,7 @@ def admin_reseller_transactions():
     if tx_type in ['personal', 'group']:
         order_query = order_query.filter(Order.visit_type == tx_type)
         
-    orders = order_query.order_by(Order.created_at.desc()).all()
+    orders, next_cursor = keyset_page(order_query, [Order.created_at, Order.id], request.args.get('cursor'))
     for o in orders:
         o.display_type = (o.visit_type or 'Personal').title()
         o.display_id = o.invoice_number
@@ -1240,7 +1345,20 @@ def admin_reseller_transactions():
         o.display_status = o.payment_status
         results.append(o)
             
-    return render_template('admin/reseller_transactions.html', orders=orders)
+    return _paged_response('admin/reseller_transactions.html', orders, next_cursor, _transaction_json, orders=orders)
+
+@main.route('/dashboard/transactions/export-etickets')
+def admin_export_etickets():
+    if not session.get('logged_in') or session.get('user_role') != 'admin': return redirect(url_for('main.login'))
+
+    query = Order.query
+    tx_type = request.args.get('type')
+    reseller_id = request.args.get('reseller_id', type=int)
+    if tx_type in ['personal', 'group']:
+        query = query.filter(Order.visit_type == tx_type)
+    if reseller_id:
+        query = query.filter(Order.user_id == reseller_id)
+    return _export_etickets(query, request.referrer or url_for('main.admin_transactions'))
 
 @main.route('/dashboard/transactions/order/<int:id>')
 def admin_transaction_order_detail(id):
@@ -1249,10 +1367,7 @@ def admin_transaction_order_detail(id):
     order = Order.query.get_or_404(id)
     
     # Parse details JSON
-    try:
-        details = json.loads(order.details)
-    except:
-        details = {}
+    details = order.get_details()
         
     # Extract group info if available
     group_info = None
@@ -1283,31 +1398,23 @@ def update_transaction_status(order_id):
     
     # Update Status
     if new_status:
-        order.payment_status = new_status
+        set_payment_status(order, new_status)
         
     # Update Payment Method
     if payment_method:
         order.payment_method = payment_method
         
-    db.session.commit()
-    
     # Send E-Ticket if status changed to paid
     if old_status != 'paid' and new_status == 'paid':
-        try:
-            app = current_app._get_current_object()
-            base_url = request.url_root
-            threading.Thread(target=send_email_with_context, args=(app, send_eticket_email, order.id, base_url)).start()
-        except Exception as e:
-            print(f"Failed to start eticket email thread: {e}")
+        enqueue_order_email('eticket', order.id, request.url_root)
             
     # Send Expired Email if status changed to expired
     if old_status != 'expired' and new_status == 'expired':
-        try:
-            app = current_app._get_current_object()
-            base_url = request.url_root
-            threading.Thread(target=send_email_with_context, args=(app, send_expired_email, order.id, base_url)).start()
-        except Exception as e:
-            print(f"Failed to start expired email thread: {e}")
+        enqueue_order_email('expired', order.id, request.url_root)
+        
+    db.session.commit()
+    # PDF lama (invoice / e-ticket) dibuat ulang saat download berikutnya
+    invalidate_order_pdfs(order)
     
     return jsonify({'status': 'success', 'new_status': new_status})
 
@@ -1315,10 +1422,7 @@ def update_transaction_status(order_id):
 def get_transaction_details(order_id):
     if not session.get('logged_in') or session.get('user_role') != 'admin': return jsonify({'error': 'Unauthorized'}), 401
     order = Order.query.get_or_404(order_id)
-    try:
-        details = json.loads(order.details)
-    except:
-        details = {}
+    details = order.get_details()
     
     # Extract group details if present
     group_info = None
@@ -1347,6 +1451,25 @@ def get_transaction_details(order_id):
         'created_at': order.created_at.strftime('%Y-%m-%d %H:%M')
     })
 
+def _pdf_response(kind, order, download_name, render):
+    """
+    Sends an invoice / e-ticket PDF. render(header_text) returns the PDF bytes.
+    PDFs of paid orders come from the on-disk cache with ETag/Last-Modified, so
+    repeat downloads are a file send (or a 304) instead of a ReportLab render.
+    """
+    settings = get_settings()
+    header_text = settings.park_name if settings else "Tiket Wahana"
+
+    if order.payment_status != 'paid':
+        return send_file(BytesIO(render(header_text)), as_attachment=True, download_name=download_name, mimetype='application/pdf')
+
+    path, etag = cached_pdf(kind, order, header_text, lambda: render(header_text))
+    response = send_file(path, as_attachment=True, download_name=download_name, mimetype='application/pdf',
+                         etag=etag, conditional=True, max_age=0)
+    # Bisa berisi data pelanggan: jangan disimpan di cache proxy bersama
+    response.cache_control.private = True
+    return response
+
 @main.route('/dashboard/transaction/<int:order_id>/invoice')
 def admin_download_invoice(order_id):
     if not session.get('logged_in') or session.get('user_role') != 'admin': return redirect(url_for('main.login'))
@@ -1355,129 +1478,20 @@ def admin_download_invoice(order_id):
     if order.payment_status != 'paid':
         return "Invoice hanya tersedia untuk transaksi lunas", 400
         
-    try:
-        details = json.loads(order.details)
-    except:
-        details = {}
-        
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
-    elements = []
-    
-    styles = getSampleStyleSheet()
-    style_normal = styles["Normal"]
-    style_heading = styles["Heading1"]
-    style_center = ParagraphStyle(name='Center', parent=styles['Normal'], alignment=TA_CENTER)
-    style_right = ParagraphStyle(name='Right', parent=styles['Normal'], alignment=TA_RIGHT)
-    
-    # Header
-    # Try to use logo if available in settings, otherwise text
-    settings = SiteSetting.query.first()
-    header_text = settings.park_name if settings else "Tiket Wahana"
-    
-    elements.append(Paragraph(f"<b>{header_text}</b>", style_heading))
-    elements.append(Spacer(1, 12))
-    elements.append(Paragraph("INVOICE / BUKTI PEMBAYARAN", style_heading))
-    elements.append(Spacer(1, 24))
-    
-    # Order Info
-    data_info = [
-        ["No. Invoice", f": {order.invoice_number}"],
-        ["Tanggal", f": {order.created_at.strftime('%d %B %Y %H:%M')}"],
-        ["Status", f": {order.payment_status.upper()}"],
-        ["Pelanggan", f": {order.customer_name}"],
-        ["Email", f": {order.customer_email}"],
-        ["Tipe Kunjungan", f": {order.visit_type.title()}"]
-    ]
-    
-    if order.visit_type == 'group':
-        group_info = details.get('group_details') or details.get('group')
-        # Ensure group_info is a dict
-        if isinstance(group_info, dict):
-            data_info.append(["Nama Group", f": {group_info.get('name', '-')}"])
-            data_info.append(["Jumlah Peserta", f": {group_info.get('size', '-')} Pax"])
-    
-    t_info = Table(data_info, colWidths=[2*inch, 4*inch])
-    t_info.setStyle(TableStyle([
-        ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
-        ('FONTSIZE', (0,0), (-1,-1), 10),
-        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-    ]))
-    elements.append(t_info)
-    elements.append(Spacer(1, 24))
-    
-    # Items Table
-    data_items = [["Deskripsi Item", "Qty", "Harga", "Total"]]
-    
-    # Tickets
-    for item in details.get('items', []):
-        data_items.append([
-            f"Tiket - {item['name']}",
-            str(item.get('qty', 0)),
-            f"Rp {item.get('price', 0):,}",
-            f"Rp {item.get('subtotal', 0):,}"
-        ])
-        
-    # Addons
-    for item in details.get('addons', []):
-        data_items.append([
-            f"Addon - {item['name']}",
-            "1", # Addons in checkout summary are usually counted as 1 per list entry
-            f"Rp {item.get('price', 0):,}",
-            f"Rp {item.get('price', 0):,}"
-        ])
-        
-    # Table Styling
-    t_items = Table(data_items, colWidths=[3.5*inch, 1*inch, 1.5*inch, 1.5*inch])
-    t_items.setStyle(TableStyle([
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-        ('GRID', (0,0), (-1,-1), 1, colors.black),
-        ('PADDING', (0,0), (-1,-1), 6),
-    ]))
-    elements.append(t_items)
-    elements.append(Spacer(1, 12))
-    
-    # Totals
-    data_total = []
-    data_total.append(["Subtotal", f"Rp {order.total_price + order.discount_amount:,}"])
-    if order.discount_amount > 0:
-        data_total.append(["Diskon", f"- Rp {order.discount_amount:,}"])
-    data_total.append(["TOTAL", f"Rp {order.total_price:,}"])
-    
-    t_total = Table(data_total, colWidths=[6*inch, 1.5*inch])
-    t_total.setStyle(TableStyle([
-        ('FONTNAME', (0,0), (-1,-1), 'Helvetica-Bold'),
-        ('ALIGN', (0,0), (-1,-1), 'RIGHT'),
-        ('LINEABOVE', (0,-1), (-1,-1), 1, colors.black),
-    ]))
-    elements.append(t_total)
-    
-    elements.append(Spacer(1, 36))
-    elements.append(Paragraph("Terima kasih atas kunjungan Anda!", style_center))
-    
-    doc.build(elements)
-    buffer.seek(0)
-    
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f"Invoice_{order.invoice_number}.pdf",
-        mimetype='application/pdf'
-    )
+    return _pdf_response('invoice', order, f"Invoice_{order.invoice_number}.pdf",
+                         lambda header: render_invoice(order, header))
 
 @main.route('/dashboard/users')
 def admin_users():
     if not session.get('logged_in') or session.get('user_role') != 'admin': return redirect(url_for('main.login'))
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    users, next_cursor = keyset_page(User.query, [User.id], request.args.get('cursor'), descending=False)
+    return _paged_response('admin/users.html', users, next_cursor, _user_json, users=users)
 
 @main.route('/dashboard/resellers')
 def admin_resellers():
     if not session.get('logged_in') or session.get('user_role') != 'admin': return redirect(url_for('main.login'))
-    users = User.query.filter_by(role='reseller').all()
-    return render_template('admin/users.html', users=users, active_role='reseller')
+    users, next_cursor = keyset_page(User.query.filter_by(role='reseller'), [User.id], request.args.get('cursor'), descending=False)
+    return _paged_response('admin/users.html', users, next_cursor, _user_json, users=users, active_role='reseller')
 
 @main.route('/dashboard/reseller/add', methods=['GET', 'POST'])
 def admin_add_reseller():
@@ -1549,7 +1563,11 @@ def admin_edit_reseller(id):
         flash('Data reseller diperbarui', 'success')
         return redirect(url_for('main.admin_resellers'))
         
-    return render_template('admin/reseller_form.html', user=user, now=datetime.utcnow())
+    # Mutasi deposit dipaginasi (saldo per baris sudah tersimpan di balance_after)
+    statement, next_cursor = keyset_page(DepositTransaction.query.filter_by(user_id=user.id),
+                                         [DepositTransaction.created_at, DepositTransaction.id], request.args.get('cursor'))
+    return _paged_response('admin/reseller_form.html', statement, next_cursor, _deposit_json,
+                           user=user, statement=statement, now=datetime.utcnow())
 
 @main.route('/dashboard/reseller/deposit/<int:id>', methods=['POST'])
 def admin_reseller_deposit(id):
@@ -1559,7 +1577,7 @@ def admin_reseller_deposit(id):
     amount = int(request.form.get('amount', 0))
     description = request.form.get('description', 'Top-up Deposit')
     
-    settings = SiteSetting.query.first()
+    settings = get_settings()
     min_deposit = settings.min_reseller_deposit if settings else 100000000
     
     if amount < min_deposit and amount > 0:
@@ -1567,21 +1585,14 @@ def admin_reseller_deposit(id):
         return redirect(url_for('main.admin_edit_reseller', id=id))
 
     if amount != 0:
-        user.deposit_balance = (user.deposit_balance or 0) + amount
+        # Update saldo + record transaction (dengan saldo setelahnya) dalam satu transaksi
+        post_deposit_transaction(user.id, amount, 'topup' if amount > 0 else 'adjustment', description=description)
         
         # Update expiration if top-up is positive
         if amount > 0:
             duration = settings.reseller_deposit_duration_days if settings else 365
             user.deposit_expires_at = datetime.utcnow() + timedelta(days=duration)
         
-        # Record transaction
-        transaction = DepositTransaction(
-            user_id=user.id,
-            amount=amount,
-            transaction_type='topup' if amount > 0 else 'adjustment',
-            description=description
-        )
-        db.session.add(transaction)
         db.session.commit()
         
         flash(f'Saldo deposit senilai Rp {abs(amount):,} berhasil {"ditambahkan" if amount > 0 else "dikurangi"}.', 'success')
@@ -1704,6 +1715,7 @@ def admin_settings():
         settings = SiteSetting(park_name="Wahana Waterpark")
         db.session.add(settings)
         db.session.commit()
+        invalidate_settings()
         
     if request.method == 'POST':
         settings.park_name = request.form.get('park_name')
@@ -1747,6 +1759,7 @@ def admin_settings():
                 settings.hero_image_url = filename
                 
         db.session.commit()
+        invalidate_settings()
         flash('Pengaturan berhasil disimpan!', 'success')
         return redirect(url_for('main.admin_settings'))
         
@@ -1761,6 +1774,7 @@ def admin_reseller_settings():
         settings = SiteSetting()
         db.session.add(settings)
         db.session.commit()
+        invalidate_settings()
         
     if request.method == 'POST':
         settings.min_reseller_deposit = int(request.form.get('min_reseller_deposit', 100000000))
@@ -1768,6 +1782,7 @@ def admin_reseller_settings():
         settings.reseller_deposit_duration_days = int(request.form.get('reseller_deposit_duration_days', 365))
         
         db.session.commit()
+        invalidate_settings()
         flash('Pengaturan reseller berhasil disimpan', 'success')
         return redirect(url_for('main.admin_reseller_settings'))
         
@@ -1810,6 +1825,7 @@ def add_special_date():
             flash('Tanggal khusus ditambahkan!', 'success')
             
         db.session.commit()
+        invalidate_calendar()
     except Exception as e:
         flash(f'Error: {str(e)}', 'error')
         
@@ -1822,6 +1838,7 @@ def delete_special_date(id):
     sdate = SpecialDate.query.get_or_404(id)
     db.session.delete(sdate)
     db.session.commit()
+    invalidate_calendar()
     flash('Tanggal khusus dihapus.', 'success')
     return redirect(url_for('main.admin_calendar'))
 
@@ -1853,12 +1870,14 @@ def update_email_settings():
     settings.smtp_password = request.form.get('smtp_password')
     
     # Postal
+    settings.postal_api_url = request.form.get('postal_api_url')
     settings.postal_server_key = request.form.get('postal_server_key')
     
     # Brevo
     settings.brevo_api_key = request.form.get('brevo_api_key')
     
     db.session.commit()
+    invalidate_settings()
     flash('Pengaturan email berhasil disimpan', 'success')
     return redirect(url_for('main.admin_email_settings'))
 
@@ -1883,6 +1902,7 @@ def update_payment_settings():
     settings.xendit_webhook_token = request.form.get('xendit_webhook_token')
         
     db.session.commit()
+    invalidate_settings()
     flash('Pengaturan batas waktu pembayaran berhasil disimpan', 'success')
     return redirect(url_for('main.admin_payments'))
 
@@ -1939,15 +1959,17 @@ def admin_checkins():
     query = Order.query.filter(Order.checkin_at.isnot(None))
     
     if date_filter:
-        query = query.filter(func.date(Order.checkin_at) == date_filter)
+        # checkin_at diisi dengan waktu lokal server (datetime.now), jadi tanpa offset WIB
+        query = filter_date_range(query, Order.checkin_at, date_filter, date_filter, utc_offset=timedelta(0))
         
     if gate_filter:
         query = query.filter(Order.checkin_gate == gate_filter)
         
-    checkins = query.order_by(Order.checkin_at.desc()).all()
+    checkins, next_cursor = keyset_page(query, [Order.checkin_at, Order.id], request.args.get('cursor'))
     gates = Gate.query.all()
     
-    return render_template('admin/checkins.html', checkins=checkins, gates=gates, filter_date=date_filter, filter_gate=gate_filter)
+    return _paged_response('admin/checkins.html', checkins, next_cursor, _scan_json,
+                           checkins=checkins, gates=gates, filter_date=date_filter, filter_gate=gate_filter)
 
 @main.route('/dashboard/wristbands')
 def admin_wristbands():
@@ -1958,11 +1980,12 @@ def admin_wristbands():
     query = Order.query.filter(Order.wristband_at.isnot(None))
     
     if date_filter:
-        query = query.filter(func.date(Order.wristband_at) == date_filter)
+        # wristband_at diisi dengan waktu lokal server (datetime.now), jadi tanpa offset WIB
+        query = filter_date_range(query, Order.wristband_at, date_filter, date_filter, utc_offset=timedelta(0))
         
-    wristbands = query.order_by(Order.wristband_at.desc()).all()
+    wristbands, next_cursor = keyset_page(query, [Order.wristband_at, Order.id], request.args.get('cursor'))
     
-    return render_template('admin/wristbands.html', wristbands=wristbands, filter_date=date_filter)
+    return _paged_response('admin/wristbands.html', wristbands, next_cursor, _scan_json, wristbands=wristbands, filter_date=date_filter)
 
 @main.route('/dashboard/reports')
 def admin_reports():
@@ -1983,88 +2006,14 @@ def admin_reports():
         start_date = default_start
         end_date = today
         
-    # Query Paid Orders in Range
-    # Adjust end_date to include the whole day
-    query = Order.query.filter(
-        Order.payment_status == 'paid',
-        func.date(Order.created_at) >= start_date,
-        func.date(Order.created_at) <= end_date
-    ).order_by(Order.created_at.desc())
-    
-    orders = query.all()
-    
-    # Process Daily Report
-    daily_data = {} # date -> {count: 0, total: 0}
-    
-    # Process Ticket Report
-    ticket_data = {} # name -> {qty: 0, total: 0}
-    
-    # Process Addon Report (Bonus)
-    addon_data = {} # name -> {qty: 0, total: 0}
-    
-    for order in orders:
-        date_key = order.created_at.strftime('%Y-%m-%d')
-        if date_key not in daily_data:
-            daily_data[date_key] = {'count': 0, 'total': 0}
-        
-        daily_data[date_key]['count'] += 1
-        daily_data[date_key]['total'] += order.total_price
-        
-        # Parse details
-        try:
-            details = json.loads(order.details)
-            
-            # Tickets
-            items = details.get('items', []) or details.get('tickets', [])
-            for item in items:
-                name = item.get('name', 'Unknown')
-                qty = item.get('qty', 0) or item.get('quantity', 0)
-                subtotal = item.get('subtotal', 0) or item.get('total', 0)
-                
-                if name not in ticket_data:
-                    ticket_data[name] = {'qty': 0, 'total': 0}
-                ticket_data[name]['qty'] += qty
-                ticket_data[name]['total'] += subtotal
-                
-            # Addons
-            addons = details.get('addons', [])
-            for item in addons:
-                name = item.get('name', 'Unknown')
-                qty = item.get('qty', 0) or item.get('quantity', 0)
-                price = item.get('price', 0)
-                # Addon items in details usually have price, need to calc total if not present
-                # In checkout logic: summary['addons'] has price (unit price). 
-                # But wait, checkout summary structure for addons is list of items, so qty is effectively 1 per entry?
-                # Let's check checkout logic.
-                # In checkout: summary['addons'].append({'name': ..., 'price': ...}) -> list of selected addons.
-                # So quantity is always 1 per entry in that list.
-                # But wait, if multiple addons are selected?
-                # The structure in checkout is a list of objects.
-                
-                if name not in addon_data:
-                    addon_data[name] = {'qty': 0, 'total': 0}
-                addon_data[name]['qty'] += 1 # Assuming 1 per entry
-                addon_data[name]['total'] += price
-                
-        except Exception as e:
-            print(f"Error parsing order {order.id}: {e}")
-            continue
-            
-    # Convert to Lists for Template
-    daily_report = [{'date': k, 'count': v['count'], 'total': v['total']} for k, v in daily_data.items()]
-    daily_report.sort(key=lambda x: x['date'], reverse=True)
-    
-    ticket_report = [{'name': k, 'qty': v['qty'], 'total': v['total']} for k, v in ticket_data.items()]
-    ticket_report.sort(key=lambda x: x['qty'], reverse=True)
-    
-    total_revenue = sum(o.total_price for o in orders)
-    total_orders = len(orders)
+    # Aggregates come from DailySalesRollup, maintained when orders become paid
+    report = sales_report(start_date, end_date)
     
     return render_template('admin/reports.html', 
-                           daily_report=daily_report,
-                           ticket_report=ticket_report,
-                           total_revenue=total_revenue,
-                           total_orders=total_orders,
+                           daily_report=report['daily_report'],
+                           ticket_report=report['ticket_report'],
+                           total_revenue=report['total_revenue'],
+                           total_orders=report['total_orders'],
                            start_date=start_date_str,
                            end_date=end_date_str)
 
@@ -2108,6 +2057,7 @@ def admin_add_ticket():
         
         db.session.add(Ticket(**data))
         db.session.commit()
+        invalidate_catalog()
         return redirect(url_for('main.admin_tickets'))
         
     return render_template('admin/ticket_form.html', ticket=None)
@@ -2149,6 +2099,7 @@ def admin_edit_ticket(id):
         # Category kept as is since checkbox is removed
         
         db.session.commit()
+        invalidate_catalog()
         return redirect(url_for('main.admin_tickets'))
         
     return render_template('admin/ticket_form.html', ticket=ticket)
@@ -2160,6 +2111,7 @@ def delete_ticket(id):
     ticket = Ticket.query.get_or_404(id)
     db.session.delete(ticket)
     db.session.commit()
+    invalidate_catalog()
     return redirect(url_for('main.admin_tickets'))
 
 @main.route('/addon/add', methods=['POST'])
@@ -2189,6 +2141,7 @@ def add_addon():
         category=category_str
     ))
     db.session.commit()
+    invalidate_catalog()
     return redirect(url_for('main.admin_addons'))
 
 @main.route('/addon/edit/<int:id>', methods=['POST'])
@@ -2210,6 +2163,7 @@ def edit_addon(id):
     addon.category = ",".join(categories) if categories else "personal"
     
     db.session.commit()
+    invalidate_catalog()
     return redirect(url_for('main.admin_addons'))
 
 @main.route('/addon/delete/<int:id>', methods=['POST'])
@@ -2218,6 +2172,7 @@ def delete_addon(id):
     addon = Addon.query.get_or_404(id)
     db.session.delete(addon)
     db.session.commit()
+    invalidate_catalog()
     return redirect(url_for('main.admin_addons'))
 
 
@@ -2261,6 +2216,7 @@ def update_settings():
             settings.hero_image_url = url_for('static', filename='uploads/' + filename)
     
     db.session.commit()
+    invalidate_settings()
     return redirect(url_for('main.admin_settings'))
 
 # --- OPERATOR DASHBOARD ---
@@ -2284,6 +2240,7 @@ def operator_scan():
     
     if not ticket_uuid:
         return jsonify({'status': 'error', 'message': 'Kode tiket tidak ditemukan'}), 400
+    ticket_uuid = ticket_uuid.strip().upper()
         
     # Try finding by UUID first (QR Scan)
     order = Order.query.filter_by(uuid=ticket_uuid).first()
@@ -2293,6 +2250,9 @@ def operator_scan():
         order = Order.query.filter_by(invoice_number=ticket_uuid).first()
     
     if not order:
+        # Manual entry: a wrong check character means the operator mistyped the code
+        if TICKET_CODE_PATTERN.match(ticket_uuid) and not is_valid_ticket_code(ticket_uuid):
+            return jsonify({'status': 'error', 'message': 'Kode tiket salah ketik, periksa kembali kode yang dimasukkan'}), 404
         return jsonify({'status': 'error', 'message': 'Tiket tidak ditemukan'}), 404
         
     # Validation Logic
@@ -2379,22 +2339,11 @@ def _serialize_order_simple(order):
         'customer_name': order.customer_name,
         'visit_date': order.visit_date,
         'visit_type': order.visit_type,
-        'total_pax': _count_pax(order.details),
+        'total_pax': pax_counts([order])[order.id],
         'wristband_at': order.wristband_at.strftime('%Y-%m-%d %H:%M:%S') if order.wristband_at else None,
         'checkin_at': order.checkin_at.strftime('%Y-%m-%d %H:%M:%S') if order.checkin_at else None
     }
 
-def _count_pax(details_json):
-    try:
-        data = json.loads(details_json)
-        items = data.get('items', [])
-        count = 0
-        for item in items:
-            count += item.get('qty', 0)
-        return count
-    except:
-        return 0
-
 @main.route('/reseller/history/<uuid>')
 def reseller_order_detail(uuid):
     if not session.get('logged_in') or session.get('user_role') != 'reseller':
@@ -2403,10 +2352,7 @@ def reseller_order_detail(uuid):
     user = User.query.get(session.get('user_id'))
     order = Order.query.filter_by(uuid=uuid, user_id=user.id).first_or_404()
     
-    try:
-        details = json.loads(order.details)
-    except:
-        details = {}
+    details = order.get_details()
         
     return render_template('reseller/order_detail.html', order=order, details=details)
 
@@ -2419,101 +2365,97 @@ def download_eticket(uuid):
         if order.user_id != session.get('user_id'):
             return "Unauthorized", 403
             
-    try:
-        details = json.loads(order.details)
-    except:
-        details = {}
-        
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
-    elements = []
-    
-    styles = getSampleStyleSheet()
-    style_normal = styles["Normal"]
-    style_heading = styles["Heading1"]
-    style_center = ParagraphStyle(name='Center', parent=styles['Normal'], alignment=TA_CENTER)
-    
-    # Header
-    settings = SiteSetting.query.first()
-    header_text = settings.park_name if settings else "Tiket Wahana"
-    
-    elements.append(Paragraph(f"<b>{header_text}</b>", style_center))
-    elements.append(Spacer(1, 12))
-    elements.append(Paragraph("E-TICKET", style_center))
-    elements.append(Spacer(1, 12))
-    
-    # QR Code
-    qr_filename = f"{order.uuid}.png"
-    # Ensure QR exists
-    generate_qr_file(order.uuid, qr_filename)
-    qr_path = os.path.join(current_app.root_path, 'static', 'qrcodes', qr_filename)
-    
-    try:
-        im = RLImage(qr_path, width=2*inch, height=2*inch)
-        elements.append(im)
-    except Exception as e:
-        print(f"Failed to load QR image: {e}")
-        elements.append(Paragraph(f"[QR CODE: {order.uuid}]", style_center))
-        
-    elements.append(Spacer(1, 6))
-    elements.append(Paragraph(f"CODE: {order.uuid}", style_center))
-    elements.append(Spacer(1, 24))
-    
-    # Info
-    visit_date_str = str(order.visit_date)
-    
-    data_info = [
-        ["No. Invoice", f": {order.invoice_number}"],
-        ["Tanggal Kunjungan", f": {visit_date_str}"],
-        ["Nama Pengunjung", f": {order.customer_name}"],
-        ["Status", f": {order.payment_status.upper()}"]
-    ]
-    
-    # Add Group Info if available
-    group_info = details.get('group') or details.get('group_details')
-    if isinstance(group_info, dict) and group_info.get('name'):
-        data_info.append(["Nama Group", f": {group_info.get('name')}"])
-        if group_info.get('size'):
-             data_info.append(["Jumlah Peserta", f": {group_info.get('size')} Pax"])
-    
-    t_info = Table(data_info, colWidths=[2*inch, 4*inch])
-    t_info.setStyle(TableStyle([
-        ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
-        ('FONTSIZE', (0,0), (-1,-1), 12),
-        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-    ]))
-    elements.append(t_info)
-    elements.append(Spacer(1, 24))
-    
-    # Items
-    data_items = [["Tiket / Item", "Qty"]]
-    for item in details.get('items', []):
-        data_items.append([item['name'], f"{item['qty']} Pax"])
-        
-    for item in details.get('addons', []):
-        data_items.append([f"Addon - {item['name']}", "1"])
-
-    t_items = Table(data_items, colWidths=[4*inch, 2*inch])
-    t_items.setStyle(TableStyle([
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('GRID', (0,0), (-1,-1), 1, colors.black),
-        ('PADDING', (0,0), (-1,-1), 6),
-        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-    ]))
-    elements.append(t_items)
-    
-    elements.append(Spacer(1, 36))
-    elements.append(Paragraph("Harap tunjukkan E-Ticket ini di loket masuk.", style_center))
-    
-    doc.build(elements)
-    buffer.seek(0)
-    
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f"Eticket_{order.uuid}.pdf",
-        mimetype='application/pdf'
-    )
+    return _pdf_response('eticket', order, f"Eticket_{order.uuid}.pdf",
+                         lambda header: render_eticket(order, header, qr_version=qr_version_for(order.uuid)))
+
+def _export_etickets(query, back_url):
+    """
+    E-tickets of the paid orders in `query` (narrowed by ?order=<uuid>... or ?start_date/end_date)
+    as one ZIP (streamed) or one multi-page PDF (?format=pdf). Large selections are built by the worker.
+    """
+    fmt = request.args.get('format', 'zip')
+    if fmt not in ['zip', 'pdf']:
+        return "Format tidak valid", 400
+
+    uuids = request.args.getlist('order')
+    if uuids:
+        query = query.filter(Order.uuid.in_(uuids))
+    query = filter_date_range(query, Order.created_at, request.args.get('start_date'), request.args.get('end_date'))
+    order_ids = [order_id for (order_id,) in query.filter(Order.payment_status == 'paid')
+                 .order_by(Order.created_at, Order.id).with_entities(Order.id)]
+
+    if not order_ids:
+        flash('Tidak ada pesanan lunas untuk diexport', 'error')
+        return redirect(back_url)
+
+    if len(order_ids) > EXPORT_SYNC_LIMIT:
+        job = enqueue_eticket_export(order_ids, fmt, session.get('user_id'))
+        db.session.commit()
+        return redirect(url_for('main.export_status', job_id=job.id))
+
+    download_name = f"Etickets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    if fmt == 'pdf':
+        buffer = BytesIO()
+        render_etickets(iter_orders(order_ids), header_text(), buffer)
+        buffer.seek(0)
+        return send_file(buffer, as_attachment=True, download_name=download_name, mimetype='application/pdf')
+
+    response = Response(stream_with_context(stream_eticket_zip(order_ids)), mimetype='application/zip')
+    response.headers["Content-Disposition"] = f"attachment; filename={download_name}"
+    return response
+
+# Job export yang hasilnya bisa di-download: kind -> prefix nama file download
+EXPORT_DOWNLOADS = {
+    'export_etickets': 'Etickets',
+    'export_report': 'Laporan',
+}
+EXPORT_MIMETYPES = {
+    'pdf': 'application/pdf',
+    'zip': 'application/zip',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+def _get_export_job(job_id):
+    """The export job if the logged-in user may see it (admins: all, resellers: their own), else None."""
+    if not session.get('logged_in'):
+        return None
+    job = Job.query.get(job_id)
+    if not job or job.kind not in EXPORT_DOWNLOADS:
+        return None
+    if session.get('user_role') != 'admin' and job.get_payload().get('user_id') != session.get('user_id'):
+        return None
+    return job
+
+@main.route('/exports/<int:job_id>')
+def export_status(job_id):
+    job = _get_export_job(job_id)
+    if not job:
+        return redirect(url_for('main.login')) if not session.get('logged_in') else ("Not Found", 404)
+
+    download_url = url_for('main.export_download', job_id=job.id) if job.status == 'done' else None
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'status': job.status,
+            'progress': job.progress or 0,
+            'total': job.total or len(job.get_payload().get('order_ids') or []),
+            'download_url': download_url,
+            'error': job.last_error if job.status == 'dead' else None
+        })
+    return render_template('export_status.html', job=job, download_url=download_url,
+                           base_template='admin_base.html' if session.get('user_role') == 'admin' else 'reseller_base.html')
+
+@main.route('/exports/<int:job_id>/download')
+def export_download(job_id):
+    job = _get_export_job(job_id)
+    if not job:
+        return redirect(url_for('main.login')) if not session.get('logged_in') else ("Not Found", 404)
+    path = os.path.join(export_dir(), job.result_path) if job.status == 'done' and job.result_path else None
+    if not path or not os.path.exists(path):
+        return "File export tidak tersedia (belum selesai atau sudah dihapus)", 404
+
+    fmt = path.rsplit('.', 1)[-1]
+    return send_file(path, as_attachment=True, download_name=f"{EXPORT_DOWNLOADS[job.kind]}_{job.id}.{fmt}",
+                     mimetype=EXPORT_MIMETYPES.get(fmt, 'application/octet-stream'))
 
 @main.route('/download/invoice/<uuid>')
 def download_invoice(uuid):
@@ -2523,108 +2465,5 @@ def download_invoice(uuid):
         if order.user_id != session.get('user_id'):
             return "Unauthorized", 403
             
-    try:
-        details = json.loads(order.details)
-    except:
-        details = {}
-        
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
-    elements = []
-    
-    styles = getSampleStyleSheet()
-    style_normal = styles["Normal"]
-    style_heading = styles["Heading1"]
-    style_center = ParagraphStyle(name='Center', parent=styles['Normal'], alignment=TA_CENTER)
-    
-    # Header
-    settings = SiteSetting.query.first()
-    header_text = settings.park_name if settings else "Tiket Wahana"
-    
-    elements.append(Paragraph(f"<b>{header_text}</b>", style_heading))
-    elements.append(Spacer(1, 12))
-    elements.append(Paragraph("INVOICE / BUKTI PEMBAYARAN", style_heading))
-    elements.append(Spacer(1, 24))
-    
-    # Order Info
-    data_info = [
-        ["No. Invoice", f": {order.invoice_number}"],
-        ["Tanggal", f": {order.created_at.strftime('%d %B %Y %H:%M')}"],
-        ["Status", f": {order.payment_status.upper()}"],
-        ["Pelanggan", f": {order.customer_name}"],
-        ["Email", f": {order.customer_email}"],
-        ["Tipe Kunjungan", f": {order.visit_type.title()}"]
-    ]
-    
-    if order.visit_type == 'group':
-        group_info = details.get('group_details') or details.get('group')
-        if isinstance(group_info, dict):
-            data_info.append(["Nama Group", f": {group_info.get('name', '-')}"])
-            data_info.append(["Jumlah Peserta", f": {group_info.get('size', '-')} Pax"])
-    
-    t_info = Table(data_info, colWidths=[2*inch, 4*inch])
-    t_info.setStyle(TableStyle([
-        ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
-        ('FONTSIZE', (0,0), (-1,-1), 10),
-        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-    ]))
-    elements.append(t_info)
-    elements.append(Spacer(1, 24))
-    
-    # Items Table
-    data_items = [["Deskripsi Item", "Qty", "Harga", "Total"]]
-    
-    for item in details.get('items', []):
-        data_items.append([
-            f"Tiket - {item['name']}",
-            str(item.get('qty', 0)),
-            f"Rp {item.get('price', 0):,}",
-            f"Rp {item.get('subtotal', 0):,}"
-        ])
-        
-    for item in details.get('addons', []):
-        data_items.append([
-            f"Addon - {item['name']}",
-            "1",
-            f"Rp {item.get('price', 0):,}",
-            f"Rp {item.get('price', 0):,}"
-        ])
-        
-    t_items = Table(data_items, colWidths=[3.5*inch, 1*inch, 1.5*inch, 1.5*inch])
-    t_items.setStyle(TableStyle([
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
-        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-        ('GRID', (0,0), (-1,-1), 1, colors.black),
-        ('PADDING', (0,0), (-1,-1), 6),
-    ]))
-    elements.append(t_items)
-    elements.append(Spacer(1, 12))
-    
-    # Totals
-    data_total = []
-    data_total.append(["Subtotal", f"Rp {order.total_price + order.discount_amount:,}"])
-    if order.discount_amount > 0:
-        data_total.append(["Diskon", f"- Rp {order.discount_amount:,}"])
-    data_total.append(["TOTAL", f"Rp {order.total_price:,}"])
-    
-    t_total = Table(data_total, colWidths=[6*inch, 1.5*inch])
-    t_total.setStyle(TableStyle([
-        ('FONTNAME', (0,0), (-1,-1), 'Helvetica-Bold'),
-        ('ALIGN', (0,0), (-1,-1), 'RIGHT'),
-        ('LINEABOVE', (0,-1), (-1,-1), 1, colors.black),
-    ]))
-    elements.append(t_total)
-    
-    elements.append(Spacer(1, 36))
-    elements.append(Paragraph("Terima kasih atas kunjungan Anda!", style_center))
-    
-    doc.build(elements)
-    buffer.seek(0)
-    
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f"Invoice_{order.invoice_number}.pdf",
-        mimetype='application/pdf'
-    )
\ No newline at end of file
+    return _pdf_response('invoice', order, f"Invoice_{order.invoice_number}.pdf",
+                         lambda header: render_invoice(order, header))
\ No newline at end of file
@@ -1,62 +1,215 @@
-import qrcode
-import io
 import base64
-import requests
-import smtplib
 import json
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
 import os
+import re
 import random
 import string
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, date, time, timedelta
 from flask import render_template, current_app, url_for
-from .models import SiteSetting, User
+from sqlalchemy import tuple_
+from .models import User
+from .cache import get_settings
+from .mailer import get_smtp_pool, get_brevo_client, get_postal_client
+from .qr import qr_png, TICKET_QR_VERSION
+
+# Jam operasional dihitung dalam WIB, sedangkan created_at disimpan sebagai UTC naive
+WIB_OFFSET = timedelta(hours=7)
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+def filter_date_range(query, column, start_date=None, end_date=None, utc_offset=WIB_OFFSET):
+    """
+    Filters `column` to the calendar days start_date..end_date (inclusive, 'YYYY-MM-DD' or date).
+    Days are converted to half-open [start, end) datetime bounds on the raw column, so SQLite
+    can use an index range scan instead of evaluating func.date() on every row.
+    `utc_offset` is the offset of the calendar days relative to the column's clock.
+    """
+    start = _to_date(start_date)
+    end = _to_date(end_date)
+    if start:
+        query = query.filter(column >= datetime.combine(start, time.min) - utc_offset)
+    if end:
+        query = query.filter(column < datetime.combine(end + timedelta(days=1), time.min) - utc_offset)
+    return query
+
+def _keyset_values(row, columns):
+    # Dicari per nama kolom: statement dari cache SQLAlchemy bisa memakai objek kolom
+    # (mis. dari subquery) yang berbeda dengan `columns` request ini
+    mapping = getattr(row, '_mapping', None)
+    if mapping is not None:
+        return tuple(mapping[column.key] for column in columns)
+    return tuple(getattr(row, column.key) for column in columns)
+
+def keyset_after(query, columns, cursor, descending=False):
+    """Filters `query` to rows after `cursor` (values of `columns`) in (columns) order."""
+    if cursor is None:
+        return query
+    key = tuple_(*columns)
+    return query.filter(key < tuple_(*cursor) if descending else key > tuple_(*cursor))
+
+def iter_keyset(query, columns, batch_size=1000, descending=False):
+    """
+    Yields all rows of `query` ordered by `columns` (unique together, e.g. created_at + id),
+    batch_size rows per SELECT. The selected rows must contain the key columns.
+    Unlike yield_per no SQLite cursor stays open between batches, so a long export or a
+    slow download does not keep the read lock that blocks every writer.
+    """
+    order = [column.desc() for column in columns] if descending else list(columns)
+    cursor = None
+    while True:
+        rows = keyset_after(query, columns, cursor, descending).order_by(*order).limit(batch_size).all()
+        yield from rows
+        if len(rows) < batch_size:
+            break
+        cursor = _keyset_values(rows[-1], columns)
+
+# --- KEYSET PAGINATION ---
+
+# Daftar admin dipaginasi dengan cursor (nilai kolom urutan baris terakhir),
+# bukan OFFSET: biaya satu halaman tetap sebanding ukuran halaman, sejauh
+# apapun pengguna menggulir.
+PAGE_SIZE = 50
+
+def encode_cursor(values):
+    """Opaque URL-safe token for a tuple of key values (datetimes, ints, strings)."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(token, columns):
+    """Key values from encode_cursor(), converted back using the column types. None if missing or invalid."""
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        # Cursor datang dari URL: hanya nilai skalar yang boleh jadi parameter query
+        if not all(value is None or isinstance(value, (str, int, float)) for value in values):
+            return None
+        return tuple(
+            datetime.fromisoformat(value) if value is not None and column.type.python_type is datetime else value
+            for value, column in zip(values, columns)
+        )
+    except (ValueError, TypeError):
+        return None
+
+def keyset_page(query, columns, cursor=None, page_size=PAGE_SIZE, descending=True):
+    """
+    One page of `query` ordered by `columns` (unique together, e.g. created_at + id), starting
+    after the encoded `cursor`. Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    order = [column.desc() for column in columns] if descending else list(columns)
+    after = decode_cursor(cursor, columns)
+    rows = keyset_after(query, columns, after, descending).order_by(*order).limit(page_size + 1).all()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(_keyset_values(rows[-1], columns))
+
+# QR tiket tidak pernah berubah untuk kode yang sama: PNG disimpan sekali di
+# static/qrcodes (dipakai bersama semua worker) dan yang sering diminta juga
+# disimpan di memori per proses.
+QR_MEMORY_CACHE_SIZE = 256
+_qr_memory_cache = OrderedDict()
+_qr_memory_lock = threading.Lock()
+
+def qr_version_for(data):
+    # Kode tiket selalu muat di versi 1; data lain (mis. UUID lama) memilih versi sendiri
+    return TICKET_QR_VERSION if TICKET_CODE_PATTERN.match(data or '') else None
+
+def _render_qr_png(data):
+    return qr_png(data, version=qr_version_for(data))
+
+def _qr_folder():
+    static_folder = os.path.join(current_app.root_path, 'static', 'qrcodes')
+    os.makedirs(static_folder, exist_ok=True)
+    return static_folder
+
+def write_atomic(file_path, content):
+    # Tulis ke file sementara lalu rename: worker lain tidak pernah membaca PNG setengah jadi
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, file_path)
+
+def _remember_qr(data, png):
+    with _qr_memory_lock:
+        _qr_memory_cache[data] = png
+        _qr_memory_cache.move_to_end(data)
+        while len(_qr_memory_cache) > QR_MEMORY_CACHE_SIZE:
+            _qr_memory_cache.popitem(last=False)
+
+def get_qr_png(data, filename=None):
+    """PNG bytes of the QR for `data`: memory cache, then static/qrcodes/<filename>, then a fresh render."""
+    with _qr_memory_lock:
+        png = _qr_memory_cache.get(data)
+        if png is not None:
+            _qr_memory_cache.move_to_end(data)
+            return png
+
+    file_path = os.path.join(_qr_folder(), filename or f"{data}.png")
+    try:
+        with open(file_path, 'rb') as f:
+            png = f.read()
+    except FileNotFoundError:
+        png = _render_qr_png(data)
+        write_atomic(file_path, png)
+
+    _remember_qr(data, png)
+    return png
 
 def generate_qr_code(data):
     """Generates a QR code and returns it as a base64 encoded string."""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    buffered = io.BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
+    img_str = base64.b64encode(get_qr_png(data)).decode()
     return f"data:image/png;base64,{img_str}"
 
 def generate_qr_file(data, filename):
-    """Generates a QR code and saves it to static/qrcodes."""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
-
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Ensure directory exists
-    static_folder = os.path.join(current_app.root_path, 'static', 'qrcodes')
-    if not os.path.exists(static_folder):
-        os.makedirs(static_folder)
-        
-    file_path = os.path.join(static_folder, filename)
-    img.save(file_path, format="PNG")
-    
+    """Ensures static/qrcodes/<filename> holds the QR for `data`; only renders it the first time."""
+    file_path = os.path.join(_qr_folder(), filename)
+    if not os.path.exists(file_path):
+        png = _render_qr_png(data)
+        write_atomic(file_path, png)
+        _remember_qr(data, png)
     return filename
 
+def prune_qr_files(keep_days=30):
+    """Deletes QR files of orders whose visit date is more than keep_days ago. Returns the number deleted."""
+    from .models import Order
+    cutoff = (datetime.now().date() - timedelta(days=keep_days)).strftime('%Y-%m-%d')
+    folder = _qr_folder()
+    deleted = 0
+    # visit_date disimpan sebagai string 'YYYY-MM-DD', jadi perbandingan string sudah urut tanggal
+    past_orders = Order.query.with_entities(Order.uuid)\
+        .filter(Order.visit_date != None, Order.visit_date != '', Order.visit_date < cutoff)\
+        .yield_per(1000)
+    for (code,) in past_orders:
+        try:
+            os.remove(os.path.join(folder, f"{code}.png"))
+            deleted += 1
+        except FileNotFoundError:
+            pass
+        with _qr_memory_lock:
+            _qr_memory_cache.pop(code, None)
+    return deleted
+
 def send_email(to_email, subject, html_content):
     """Sends an email using the configured provider in SiteSetting."""
-    settings = SiteSetting.query.first()
+    settings = get_settings()
     if not settings:
         print("No site settings found. Email not sent.")
         return False
@@ -69,14 +222,17 @@ def send_email(to_email, subject, html_content):
         if provider == 'smtp':
             return _send_smtp(settings, to_email, subject, html_content, sender_email, sender_name)
         elif provider == 'postal':
-            return _send_postal(settings, to_email, subject, html_content, sender_email, sender_name)
+            client = _postal_client(settings)
+            if not client:
+                return False
+            client.send(sender_email, sender_name, to_email, subject, html_content)
+            return True
         elif provider == 'brevo':
-            # Use DB key or ENV key
-            api_key = settings.brevo_api_key or os.getenv('BREVO_API_KEY')
-            if not api_key:
-                print("Brevo API Key not found in DB or ENV.")
+            client = _brevo_client(settings)
+            if not client:
                 return False
-            return _send_brevo(api_key, to_email, subject, html_content, sender_email, sender_name)
+            client.send(sender_email, sender_name, to_email, subject, html_content)
+            return True
         else:
             print(f"Unknown email provider: {provider}")
             return False
@@ -94,64 +250,82 @@ def _send_smtp(settings, to_email, subject, html_content, sender_email, sender_n
     msg.attach(part)
 
     try:
-        with smtplib.SMTP(settings.smtp_host, settings.smtp_port) as server:
-            server.set_debuglevel(1)  # Debugging enabled
-            server.starttls()
-            if settings.smtp_user and settings.smtp_password:
-                server.login(settings.smtp_user, settings.smtp_password)
-            server.sendmail(sender_email, to_email, msg.as_string())
+        # Koneksi dipakai ulang antar email (tanpa handshake TLS + login setiap kirim)
+        pool = get_smtp_pool(settings.smtp_host, settings.smtp_port, settings.smtp_user, settings.smtp_password)
+        pool.sendmail(sender_email, to_email, msg.as_string())
         print(f"Email sent successfully to {to_email}")
         return True
     except Exception as e:
         print(f"SMTP Error: {e}")
-        import traceback
-        traceback.print_exc()
         raise e
 
-def _send_postal(settings, to_email, subject, html_content, sender_email, sender_name):
-    # Postal API implementation (assuming generic Postal API structure)
-    # You might need to adjust endpoint if using a specific Postal instance
-    # For now, this is a placeholder or basic implementation
-    # Postal usually uses HTTP API
-    # TODO: Implement actual Postal API call if documentation available
-    # Assuming Postal sends via SMTP is easier, but if API is required:
-    pass 
-
-def _send_brevo(api_key, to_email, subject, html_content, sender_email, sender_name):
-    url = "https://api.brevo.com/v3/smtp/email"
-    headers = {
-        "accept": "application/json",
-        "api-key": api_key,
-        "content-type": "application/json"
-    }
-    payload = {
-        "sender": {"name": sender_name, "email": sender_email},
-        "to": [{"email": to_email}],
-        "subject": subject,
-        "htmlContent": html_content
-    }
-    
-    response = requests.post(url, json=payload, headers=headers)
-    if response.status_code in [200, 201, 202]:
-        return True
+def _postal_client(settings):
+    # Use DB values or ENV
+    base_url = settings.postal_api_url or os.getenv('POSTAL_API_URL')
+    server_key = settings.postal_server_key or os.getenv('POSTAL_SERVER_KEY')
+    if not base_url or not server_key:
+        print("Postal API URL or Server Key not found in DB or ENV.")
+        return None
+    return get_postal_client(base_url, server_key)
+
+def _brevo_client(settings):
+    # Use DB key or ENV key
+    api_key = settings.brevo_api_key or os.getenv('BREVO_API_KEY')
+    if not api_key:
+        print("Brevo API Key not found in DB or ENV.")
+        return None
+    return get_brevo_client(api_key, os.getenv('BREVO_API_URL'))
+
+def send_email_batch(messages):
+    """
+    Sends many emails at once: [(to_email, subject, html_content)].
+    Brevo gets them as bulk messageVersions requests, Postal as parallel requests over one
+    connection pool; SMTP sends one by one. Returns one result per message (True = accepted),
+    so the caller can retry only the failed ones. Messages without an address count as done.
+    """
+    results = [True] * len(messages)
+    pending = [i for i, message in enumerate(messages) if message[0]]
+    if not pending:
+        return results
+
+    settings = get_settings()
+    provider = (settings.email_provider if settings else None) or os.getenv('EMAIL_PROVIDER')
+    if provider == 'brevo':
+        client = _brevo_client(settings)
+    elif provider == 'postal':
+        client = _postal_client(settings)
     else:
-        print(f"Brevo Error: {response.text}")
-        raise Exception(f"Brevo API Error: {response.status_code}")
+        for i in pending:
+            results[i] = send_email(*messages[i])
+        return results
+
+    if not client:
+        for i in pending:
+            results[i] = False
+        return results
+    sender_email = settings.email_from_address or os.getenv('EMAIL_FROM_ADDRESS')
+    sender_name = settings.email_from_name or os.getenv('EMAIL_FROM_NAME')
+    try:
+        accepted = client.send_batch(sender_email, sender_name, [messages[i] for i in pending])
+    except Exception as e:
+        print(f"Failed to send batch email: {e}")
+        accepted = [False] * len(pending)
+    for i, ok in zip(pending, accepted):
+        results[i] = ok
+    print(f"Batch email sent to {sum(accepted)} of {len(pending)} recipients")
+    return results
 
 def send_invoice_email(order):
-    settings = SiteSetting.query.first()
+    settings = get_settings()
     subject = f"Invoice #{order.invoice_number} - {settings.park_name if settings else 'Tiket Wahana'}"
     
-    try:
-        details = json.loads(order.details)
-    except:
-        details = {}
+    details = order.get_details()
         
     html_content = render_template('email/invoice.html', order=order, details=details, settings=settings)
     return send_email(order.customer_email, subject, html_content)
 
 def send_eticket_email(order):
-    settings = SiteSetting.query.first()
+    settings = get_settings()
     subject = f"E-Ticket - {settings.park_name if settings else 'Tiket Wahana'}"
     
     # Generate QR for Ticket (UUID)
@@ -159,10 +333,7 @@ def send_eticket_email(order):
     generate_qr_file(order.uuid, filename)
     qr_url = url_for('static', filename=f'qrcodes/{filename}', _external=True)
     
-    try:
-        details = json.loads(order.details)
-    except:
-        details = {}
+    details = order.get_details()
     
     html_content = render_template('email/eticket.html', order=order, details=details, settings=settings, qr_code=qr_url)
     
@@ -186,17 +357,18 @@ def send_eticket_email(order):
 
     return send_email(target_email, subject, html_content)
 
-def send_expired_email(order):
-    settings = SiteSetting.query.first()
+def render_expired_email(order):
+    """(to_email, subject, html_content) of the expired-order email."""
+    settings = get_settings()
     subject = f"Pesanan Kedaluwarsa - {order.invoice_number}"
     
-    try:
-        details = json.loads(order.details)
-    except:
-        details = {}
+    details = order.get_details()
         
     html_content = render_template('email/expired.html', order=order, details=details, settings=settings)
-    return send_email(order.customer_email, subject, html_content)
+    return order.customer_email, subject, html_content
+
+def send_expired_email(order):
+    return send_email(*render_expired_email(order))
 
 def generate_random_password(length=8):
     """Generates a random Alphanumeric password."""
@@ -211,7 +383,7 @@ def send_reseller_welcome_email(app, user_id, password, url_root=None):
             print(f"User {user_id} not found for welcome email")
             return False
             
-        settings = SiteSetting.query.first()
+        settings = get_settings()
         subject = f"Selamat Datang Reseller - {settings.park_name if settings else 'Tiket Wahana'}"
         
         html_content = render_template('email/reseller_welcome.html', 
@@ -227,3 +399,57 @@ def send_reseller_welcome_email(app, user_id, password, url_root=None):
             return False
             
         return send_email(target_email, subject, html_content)
+
+# --- TICKET CODE ---
+# Format: TIX-YYYYMMDD-XXXXXC
+#   XXXXX = nomor urut harian yang diacak (Feistel, kunci SECRET_KEY) -> unik tanpa cek ke DB
+#   C     = check character (Luhn mod 32) untuk mendeteksi salah ketik di operator_scan
+# Alfabet Crockford base32 (tanpa I, L, O, U) supaya tidak tertukar saat diketik manual.
+
+TICKET_CODE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+TICKET_CODE_PATTERN = re.compile(r'^TIX-(\d{8})-([0-9A-Z]{6})$')
+_FEISTEL_HALF_BITS = 12
+_FEISTEL_ROUNDS = 4
+
+def _feistel_round(value, round_no, day_str):
+    key = current_app.config['SECRET_KEY'].encode()
+    digest = hashlib.blake2b(f"{day_str}:{round_no}:{value}".encode(), key=key[:64], digest_size=4).digest()
+    return int.from_bytes(digest, 'big') & ((1 << _FEISTEL_HALF_BITS) - 1)
+
+def _permute_sequence(sequence, day_str):
+    """Bijective scramble of a 24-bit daily sequence number."""
+    mask = (1 << _FEISTEL_HALF_BITS) - 1
+    left, right = sequence >> _FEISTEL_HALF_BITS, sequence & mask
+    for round_no in range(_FEISTEL_ROUNDS):
+        left, right = right, left ^ _feistel_round(right, round_no, day_str)
+    return (left << _FEISTEL_HALF_BITS) | right
+
+def _ticket_check_char(payload):
+    """Luhn mod N check character over the base32 payload."""
+    n = len(TICKET_CODE_ALPHABET)
+    factor = 2
+    total = 0
+    for ch in reversed(payload):
+        addend = factor * TICKET_CODE_ALPHABET.index(ch)
+        factor = 1 if factor == 2 else 2
+        total += addend // n + addend % n
+    return TICKET_CODE_ALPHABET[(n - total % n) % n]
+
+def generate_ticket_code(sequence, day_str):
+    """Generates a ticket code in format TIX-YYYYMMDD-XXXXXX from the day's invoice sequence."""
+    value = _permute_sequence(sequence, day_str)
+    body = ''
+    for _ in range(5):
+        body = TICKET_CODE_ALPHABET[value % 32] + body
+        value //= 32
+    return f"TIX-{day_str}-{body}{_ticket_check_char(day_str + body)}"
+
+def is_valid_ticket_code(code):
+    """False when a TIX code has a wrong check character (typo, or a legacy random code)."""
+    match = TICKET_CODE_PATTERN.match(code or '')
+    if not match:
+        return False
+    day_str, suffix = match.groups()
+    if any(ch not in TICKET_CODE_ALPHABET for ch in suffix):
+        return False
+    return _ticket_check_char(day_str + suffix[:5]) == suffix[5]
@@ -2,12 +2,12 @@ import xendit
 import os
 from xendit.apis import InvoiceApi
 from xendit.invoice.model.create_invoice_request import CreateInvoiceRequest
-from .models import SiteSetting
+from .cache import get_settings
 
 class XenditService:
     def __init__(self, secret_key=None):
         if not secret_key:
-            settings = SiteSetting.query.first()
+            settings = get_settings()
             if settings and settings.xendit_secret_key:
                 self.secret_key = settings.xendit_secret_key
             else:
@@ -0,0 +1,195 @@
+"""
+Benchmark for invoice / e-ticket PDF rendering (PDFs per second in one worker).
+
+"before" is the code the download routes ran before app/pdf.py: a new
+stylesheet and table styles per PDF, and for the e-ticket an uncached QR
+matrix drawn as a Drawing of one Rect per run of dark modules. "after" is
+app/pdf.py as the routes call it now. "repeat download" renders the same
+e-tickets again, when the QR matrix is already cached.
+
+Usage:
+    python scripts/bench_pdf.py [number_of_pdfs]
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from io import BytesIO
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import qrcode
+from qrcode.constants import ERROR_CORRECT_M
+from reportlab.graphics.shapes import Drawing, Rect
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from app.models import Order
+from app.pdf import get_styles, render_invoice, render_eticket
+from app.qr import TICKET_QR_VERSION, BORDER, _dark_runs
+
+def sample_order(i):
+    details = {
+        'items': [
+            {'name': 'Reguler (Dewasa)', 'qty': 2, 'price': 50000, 'subtotal': 100000},
+            {'name': 'Reguler (Anak)', 'qty': 3, 'price': 35000, 'subtotal': 105000},
+        ],
+        'addons': [{'name': 'Sewa Ban', 'price': 15000}, {'name': 'Loker', 'price': 10000}],
+        'group': None,
+    }
+    # Order transient (tidak disimpan ke database); get_details() cukup membaca JSON
+    return Order(
+        uuid=f"TIX-20260105-{i:06d}",
+        invoice_number=f"INV-20260105-{i:04d}",
+        visit_date='2026-01-10',
+        visit_type='personal',
+        total_price=230000,
+        discount_amount=0,
+        details=json.dumps(details),
+        customer_name='Budi Santoso',
+        customer_email='budi@example.com',
+        payment_status='paid',
+        created_at=datetime(2026, 1, 5, 9, 30),
+    )
+
+# --- Renderer lama (sebelum app/pdf.py), disalin dari route download ---
+
+def legacy_qr_drawing(data, size, version):
+    qr = qrcode.QRCode(version=version, error_correction=ERROR_CORRECT_M, border=BORDER)
+    qr.add_data(data)
+    qr.make(fit=version is None)
+    matrix = qr.get_matrix()
+    module = size / len(matrix)
+    drawing = Drawing(size, size)
+    drawing.hAlign = 'CENTER'
+    drawing.add(Rect(0, 0, size, size, fillColor=colors.white, strokeColor=None))
+    for x, y, length in _dark_runs(matrix):
+        drawing.add(Rect(x * module, size - (y + 1) * module, length * module, module,
+                         fillColor=colors.black, strokeColor=None))
+    return drawing
+
+def legacy_invoice(order, header_text):
+    details = order.get_details()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
+    styles = getSampleStyleSheet()
+    style_heading = styles["Heading1"]
+    style_center = ParagraphStyle(name='Center', parent=styles['Normal'], alignment=TA_CENTER)
+    elements = [Paragraph(f"<b>{header_text}</b>", style_heading), Spacer(1, 12),
+                Paragraph("INVOICE / BUKTI PEMBAYARAN", style_heading), Spacer(1, 24)]
+    data_info = [
+        ["No. Invoice", f": {order.invoice_number}"],
+        ["Tanggal", f": {order.created_at.strftime('%d %B %Y %H:%M')}"],
+        ["Status", f": {order.payment_status.upper()}"],
+        ["Pelanggan", f": {order.customer_name}"],
+        ["Email", f": {order.customer_email}"],
+        ["Tipe Kunjungan", f": {order.visit_type.title()}"]
+    ]
+    t_info = Table(data_info, colWidths=[2*inch, 4*inch])
+    t_info.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
+        ('FONTSIZE', (0,0), (-1,-1), 10),
+        ('VALIGN', (0,0), (-1,-1), 'TOP'),
+    ]))
+    elements += [t_info, Spacer(1, 24)]
+    data_items = [["Deskripsi Item", "Qty", "Harga", "Total"]]
+    for item in details.get('items', []):
+        data_items.append([f"Tiket - {item['name']}", str(item.get('qty', 0)),
+                           f"Rp {item.get('price', 0):,}", f"Rp {item.get('subtotal', 0):,}"])
+    for item in details.get('addons', []):
+        data_items.append([f"Addon - {item['name']}", "1", f"Rp {item.get('price', 0):,}", f"Rp {item.get('price', 0):,}"])
+    t_items = Table(data_items, colWidths=[3.5*inch, 1*inch, 1.5*inch, 1.5*inch])
+    t_items.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ('GRID', (0,0), (-1,-1), 1, colors.black),
+        ('PADDING', (0,0), (-1,-1), 6),
+    ]))
+    elements += [t_items, Spacer(1, 12)]
+    data_total = [["Subtotal", f"Rp {order.total_price + order.discount_amount:,}"]]
+    if order.discount_amount > 0:
+        data_total.append(["Diskon", f"- Rp {order.discount_amount:,}"])
+    data_total.append(["TOTAL", f"Rp {order.total_price:,}"])
+    t_total = Table(data_total, colWidths=[6*inch, 1.5*inch])
+    t_total.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (-1,-1), 'Helvetica-Bold'),
+        ('ALIGN', (0,0), (-1,-1), 'RIGHT'),
+        ('LINEABOVE', (0,-1), (-1,-1), 1, colors.black),
+    ]))
+    elements += [t_total, Spacer(1, 36), Paragraph("Terima kasih atas kunjungan Anda!", style_center)]
+    doc.build(elements)
+    return buffer.getvalue()
+
+def legacy_eticket(order, header_text):
+    details = order.get_details()
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=18)
+    styles = getSampleStyleSheet()
+    style_center = ParagraphStyle(name='Center', parent=styles['Normal'], alignment=TA_CENTER)
+    elements = [Paragraph(f"<b>{header_text}</b>", style_center), Spacer(1, 12),
+                Paragraph("E-TICKET", style_center), Spacer(1, 12),
+                legacy_qr_drawing(order.uuid, 2*inch, TICKET_QR_VERSION), Spacer(1, 6),
+                Paragraph(f"CODE: {order.uuid}", style_center), Spacer(1, 24)]
+    data_info = [
+        ["No. Invoice", f": {order.invoice_number}"],
+        ["Tanggal Kunjungan", f": {order.visit_date}"],
+        ["Nama Pengunjung", f": {order.customer_name}"],
+        ["Status", f": {order.payment_status.upper()}"]
+    ]
+    t_info = Table(data_info, colWidths=[2*inch, 4*inch])
+    t_info.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
+        ('FONTSIZE', (0,0), (-1,-1), 12),
+        ('VALIGN', (0,0), (-1,-1), 'TOP'),
+    ]))
+    elements += [t_info, Spacer(1, 24)]
+    data_items = [["Tiket / Item", "Qty"]]
+    for item in details.get('items', []):
+        data_items.append([item['name'], f"{item['qty']} Pax"])
+    for item in details.get('addons', []):
+        data_items.append([f"Addon - {item['name']}", "1"])
+    t_items = Table(data_items, colWidths=[4*inch, 2*inch])
+    t_items.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('GRID', (0,0), (-1,-1), 1, colors.black),
+        ('PADDING', (0,0), (-1,-1), 6),
+        ('BACKGROUND', (0,0), (-1,0), colors.lightgrey),
+    ]))
+    elements += [t_items, Spacer(1, 36), Paragraph("Harap tunjukkan E-Ticket ini di loket masuk.", style_center)]
+    doc.build(elements)
+    return buffer.getvalue()
+
+def bench(name, render, orders):
+    start = time.perf_counter()
+    for order in orders:
+        render(order)
+    elapsed = time.perf_counter() - start
+    rate = len(orders) / elapsed
+    print(f"{name:<36} {rate:>8.1f} PDF/s {elapsed / len(orders) * 1000:>8.2f} ms/PDF")
+    return rate
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # Set order berbeda per run supaya cache QR matrix tidak menguntungkan run berikutnya
+    runs = iter([[sample_order(r * count + i) for i in range(count)] for r in range(4)])
+    header = 'Wahana Waterpark'
+    print(f"{count} PDFs per run")
+
+    before = bench('invoice, before', lambda o: legacy_invoice(o, header), next(runs))
+    after = bench('invoice, after', lambda o: render_invoice(o, header, get_styles()), next(runs))
+    print(f"  -> {after / before:.2f}x")
+
+    before = bench('e-ticket, before', lambda o: legacy_eticket(o, header), next(runs))
+    orders = next(runs)
+    after = bench('e-ticket, after', lambda o: render_eticket(o, header, get_styles(), TICKET_QR_VERSION), orders)
+    print(f"  -> {after / before:.2f}x")
+    repeat = bench('e-ticket, repeat download', lambda o: render_eticket(o, header, get_styles(), TICKET_QR_VERSION), orders)
+    print(f"  -> {repeat / before:.2f}x (QR matrix cached per process)")
+
+if __name__ == '__main__':
+    main()
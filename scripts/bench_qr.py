@@ -0,0 +1,75 @@
+"""
+Micro-benchmark for ticket QR rendering.
+
+Compares the original renderer (qrcode + fit=True + PIL PNG) with the
+fixed-version encoder in app/qr.py (direct 1-bit PNG and SVG), reporting
+renders per second and output size per ticket code.
+
+Usage:
+    python scripts/bench_qr.py [number_of_codes]
+"""
+import base64
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import qrcode
+from app.qr import qr_png, qr_svg, qr_matrix, TICKET_QR_VERSION
+
+def legacy_png(data):
+    # Salinan generate_qr_code / generate_qr_file sebelum app/qr.py
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+def sample_codes(count):
+    alphabet = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+    codes = []
+    for i in range(count):
+        suffix = ''
+        n = i * 7919 + 12345
+        for _ in range(6):
+            suffix += alphabet[n % 32]
+            n //= 32
+        codes.append(f"TIX-20260105-{suffix}")
+    return codes
+
+def bench(name, fn, codes):
+    # Setiap renderer mulai dengan cache matrix kosong, supaya tidak memakai hasil run sebelumnya
+    qr_matrix.cache_clear()
+    start = time.perf_counter()
+    sizes = [len(fn(code)) for code in codes]
+    elapsed = time.perf_counter() - start
+    avg = sum(sizes) / len(sizes)
+    print(f"{name:<28} {len(codes) / elapsed:>10.0f} /s {avg:>10.0f} B {avg * 4 / 3:>12.0f} B base64")
+    return len(codes) / elapsed, avg
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    codes = sample_codes(count)
+    print(f"{count} ticket codes")
+    print(f"{'renderer':<28} {'renders':>13} {'bytes/code':>12} {'as data URI':>19}")
+    legacy_rate, legacy_size = bench('legacy (PIL, fit=True)', legacy_png, codes)
+    png_rate, png_size = bench('1-bit PNG (version 1)', lambda c: qr_png(c, version=TICKET_QR_VERSION), codes)
+    bench('SVG (version 1)', lambda c: qr_svg(c, version=TICKET_QR_VERSION).encode(), codes)
+    print(f"\nPNG: {png_rate / legacy_rate:.1f}x faster, {legacy_size / png_size:.1f}x smaller")
+
+    # Sanity check: the base64 data URI size the emails used to embed
+    sample = codes[0]
+    print(f"data URI for {sample}: legacy {len(base64.b64encode(legacy_png(sample)))} chars, "
+          f"new {len(base64.b64encode(qr_png(sample, version=TICKET_QR_VERSION)))} chars")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Checks that the hot dashboard queries are served by an index.
+
+Runs EXPLAIN QUERY PLAN for each query against the configured database and
+fails if SQLite has to scan the order / deposit_transaction table without an
+index. Existing databases get the new indexes first (same upgrade as app start).
+
+Usage:
+    python scripts/check_query_plans.py [path/to/wahana.db]
+"""
+import os
+import sys
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import or_
+from app import create_app, db
+from app.models import Order, User, DepositTransaction
+from app.utils import filter_date_range
+
+CHECKED_TABLES = ('order', 'deposit_transaction')
+
+def dashboard_queries():
+    now = datetime.utcnow()
+    today = date.today()
+    month_start = today.replace(day=1)
+    return {
+        'admin_transactions lazy cleanup': Order.query.filter(Order.payment_status == 'pending', Order.expires_at < now),
+        'admin_transactions list': Order.query.outerjoin(User).filter(or_(User.id == None, User.role != 'reseller')).order_by(Order.created_at.desc()),
+        'admin_reseller_transactions list': Order.query.join(User).filter(User.role == 'reseller').order_by(Order.created_at.desc()),
+        'dashboard recent orders': Order.query.order_by(Order.created_at.desc()).limit(5),
+        'reseller_dashboard': Order.query.filter_by(user_id=1).order_by(Order.created_at.desc()),
+        'reseller_deposit_history': DepositTransaction.query.filter_by(user_id=1).order_by(DepositTransaction.created_at.desc()),
+        'admin_checkins by gate': Order.query.filter(Order.checkin_at.isnot(None), Order.checkin_gate == 'Gate 1').order_by(Order.checkin_at.desc()),
+        'admin_checkins': Order.query.filter(Order.checkin_at.isnot(None)).order_by(Order.checkin_at.desc()),
+        'admin_wristbands': Order.query.filter(Order.wristband_at.isnot(None)).order_by(Order.wristband_at.desc()),
+        'admin_reports': filter_date_range(Order.query.filter(Order.payment_status == 'paid'), Order.created_at, month_start, today).order_by(Order.created_at.desc()),
+        'export_transactions date range': filter_date_range(Order.query, Order.created_at, month_start, today).order_by(Order.created_at.desc()),
+        'admin_transactions date range': filter_date_range(Order.query.outerjoin(User).filter(or_(User.id == None, User.role != 'reseller')), Order.created_at, month_start, today).order_by(Order.created_at.desc()),
+        'admin_transactions deposits': filter_date_range(DepositTransaction.query.filter(DepositTransaction.transaction_type != 'purchase'), DepositTransaction.created_at, month_start, today).order_by(DepositTransaction.created_at.desc()),
+        'dashboard today orders': filter_date_range(Order.query, Order.created_at, today, today),
+        'admin_checkins by date': filter_date_range(Order.query.filter(Order.checkin_at.isnot(None)), Order.checkin_at, today, today).order_by(Order.checkin_at.desc()),
+        'admin_wristbands by date': filter_date_range(Order.query.filter(Order.wristband_at.isnot(None)), Order.wristband_at, today, today).order_by(Order.wristband_at.desc()),
+    }
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    return value
+
+def explain(query):
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = compiled.construct_params()
+    args = tuple(_plain(params[name]) for name in compiled.positiontup)
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", args).fetchall()
+    return [row[-1] for row in rows]
+
+def unindexed_steps(plan):
+    bad = []
+    for step in plan:
+        if not step.startswith('SCAN '):
+            continue
+        table = step.split()[1].strip('"')
+        if table in CHECKED_TABLES and 'INDEX' not in step:
+            bad.append(step)
+    return bad
+
+def main():
+    test_config = None
+    if len(sys.argv) > 1:
+        test_config = {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.abspath(sys.argv[1])}"}
+    app = create_app(test_config)
+
+    failures = 0
+    with app.app_context():
+        for name, query in dashboard_queries().items():
+            plan = explain(query)
+            bad = unindexed_steps(plan)
+            print(f"[{'FAIL' if bad else 'OK'}] {name}")
+            for step in plan:
+                print(f"       {step}")
+            failures += bool(bad)
+
+    if failures:
+        print(f"{failures} query(s) scan a table without an index")
+        sys.exit(1)
+    print("All dashboard queries use an index")
+
+if __name__ == '__main__':
+    main()
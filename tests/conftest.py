@@ -0,0 +1,41 @@
+import os
+import pytest
+from werkzeug.security import generate_password_hash
+from app import create_app, db
+from app.models import User
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'WTF_CSRF_ENABLED': False,
+        'TESTING': True,
+    })
+    # Cache versi, pdf_cache dan export tidak boleh menyentuh folder instance yang asli
+    app.instance_path = str(tmp_path / 'instance')
+    os.makedirs(app.instance_path)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def login(app, client):
+    """login(role) creates a user with that role (password 'x') and logs the test client in."""
+    def _login(role='admin', username=None):
+        username = username or role
+        with app.app_context():
+            user = User.query.filter_by(username=username).first()
+            if not user:
+                user = User(username=username, password=generate_password_hash('x'), name=username,
+                            role=role, email=f'{username}@example.com')
+                db.session.add(user)
+                db.session.commit()
+            user_id = user.id
+        client.post('/login', data={'username': username, 'password': 'x'})
+        return user_id
+    return _login
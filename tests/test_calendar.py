@@ -0,0 +1,47 @@
+from datetime import date
+from app import db
+from app.models import SpecialDate, Ticket
+from app.cache import invalidate_calendar, invalidate_catalog, get_price_table
+
+def test_calendar_revalidates_so_closed_dates_show_up_at_once(app, client):
+    first = client.get('/api/calendar?month=2030-03')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert first.get_json()['days']['2030-03-12']['type'] != 'closed'
+
+    etag = first.headers['ETag']
+    assert client.get('/api/calendar?month=2030-03', headers={'If-None-Match': etag}).status_code == 304
+
+    with app.app_context():
+        db.session.add(SpecialDate(date=date(2030, 3, 12), type='closed', description='Perawatan'))
+        db.session.commit()
+        invalidate_calendar()
+
+    changed = client.get('/api/calendar?month=2030-03', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.get_json()['days']['2030-03-12']['type'] == 'closed'
+
+def test_closed_dates_keep_the_base_price(app, client):
+    with app.app_context():
+        db.session.add(Ticket(name='Reguler', slug='reguler', price_adult=50000, price_child=35000, price_umum=45000,
+                              price_adult_weekend=65000, price_adult_highseason=80000,
+                              price_reseller_adult=40000, is_active=True))
+        db.session.add(SpecialDate(date=date(2030, 3, 12), type='closed'))
+        db.session.commit()
+        invalidate_calendar()
+        invalidate_catalog()
+
+        ticket = Ticket.query.filter_by(slug='reguler').one()
+        catalog = get_price_table()
+        for date_type in ('regular', 'weekend', 'high_season', 'closed'):
+            for variant in ('adult', 'child', 'umum'):
+                for role in ('public', 'reseller'):
+                    assert catalog.ticket_price('reguler', date_type, variant, role) == ticket.get_price(date_type, variant, role=role)
+
+    checked = client.get('/api/check-date?date=2030-03-12').get_json()
+    assert checked['type'] == 'closed'
+    assert checked['prices'] == {'reguler_adult': 50000, 'reguler_child': 35000}
+
+    day = client.get('/api/calendar?month=2030-03').get_json()['days']['2030-03-12']
+    assert day['type'] == 'closed'
+    assert day['prices']['reguler_adult'] == 50000
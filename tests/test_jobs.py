@@ -0,0 +1,53 @@
+import json
+from datetime import datetime, timedelta
+from app import db
+from app.models import Job, Order, SiteSetting
+from app import utils
+from app import jobs
+from app.jobs import HANDLERS, STALE_AFTER, claim_jobs, recover_stale_jobs, update_job_progress
+from app.cache import invalidate_settings
+
+def test_expired_batch_requeues_only_failed_orders(app, monkeypatch):
+    with app.app_context():
+        SiteSetting.query.first().email_provider = 'smtp'
+        orders = [Order(uuid=f'TIX-TEST-{i}', invoice_number=f'INV-TEST-{i}', customer_email=f'c{i}@example.com',
+                        payment_status='expired', total_price=10000, visit_date='2026-10-20', details='{}') for i in range(5)]
+        db.session.add_all(orders)
+        db.session.commit()
+        invalidate_settings()
+        order_ids = [order.id for order in orders]
+
+        sent = []
+        def fake_send(to_email, subject, html_content):
+            sent.append(to_email)
+            return to_email != 'c2@example.com'
+        monkeypatch.setattr(utils, 'send_email', fake_send)
+
+        assert HANDLERS['email_batch']({'template': 'expired', 'order_ids': order_ids, 'base_url': 'http://localhost/'}) is True
+        assert len(sent) == 5
+
+        retries = Job.query.filter_by(kind='email').all()
+        assert [json.loads(job.payload)['order_id'] for job in retries] == [order_ids[2]]
+
+def test_job_reporting_progress_is_not_recovered_as_stale(app):
+    with app.app_context():
+        busy = jobs.enqueue('export_report', {})
+        silent = jobs.enqueue('export_report', {})
+        db.session.commit()
+        assert sorted(claim_jobs(2)) == sorted([busy.id, silent.id])
+
+        # Keduanya sudah berjalan lebih lama dari STALE_AFTER
+        long_ago = datetime.utcnow() - STALE_AFTER - timedelta(minutes=5)
+        Job.query.update({Job.locked_at: long_ago})
+        db.session.commit()
+
+        jobs._current.job_id = busy.id
+        try:
+            update_job_progress(100, total=1000)
+        finally:
+            jobs._current.job_id = None
+
+        assert recover_stale_jobs() == 1
+        assert db.session.get(Job, busy.id).status == 'running'
+        assert db.session.get(Job, busy.id).attempts == 1
+        assert db.session.get(Job, silent.id).status == 'pending'
@@ -0,0 +1,36 @@
+from app import db
+from app.models import User, DepositTransaction
+from app.ledger import complete_deposit_transaction, reconcile_deposits
+
+def _pending_topup(app, amount=500000):
+    with app.app_context():
+        user = User(username='reseller1', password='x', name='Reseller', role='reseller', email='r1@example.com', deposit_balance=0)
+        db.session.add(user)
+        db.session.commit()
+        tx = DepositTransaction(user_id=user.id, amount=amount, transaction_type='topup', status='pending', external_id='DEP-TEST-1')
+        db.session.add(tx)
+        db.session.commit()
+        return user.id, tx.id
+
+def test_repeated_webhook_credits_topup_once(app, client):
+    user_id, tx_id = _pending_topup(app)
+    for _ in range(2):
+        response = client.post('/webhook/xendit', json={'external_id': 'DEP-TEST-1', 'status': 'PAID'})
+        assert response.status_code == 200
+
+    with app.app_context():
+        assert db.session.get(User, user_id).deposit_balance == 500000
+        assert db.session.get(DepositTransaction, tx_id).balance_after == 500000
+        assert reconcile_deposits() == []
+
+def test_stale_pending_read_does_not_credit_twice(app):
+    user_id, tx_id = _pending_topup(app)
+    with app.app_context():
+        # Dua request membaca top-up saat masih pending, lalu keduanya mencoba menyelesaikannya
+        stale = db.session.get(DepositTransaction, tx_id)
+        assert stale.status == 'pending'
+        with db.engine.begin() as conn:
+            conn.execute(DepositTransaction.__table__.update().where(DepositTransaction.id == tx_id).values(status='completed'))
+        assert complete_deposit_transaction(stale) is None
+        db.session.commit()
+        assert db.session.get(User, user_id).deposit_balance == 0
@@ -0,0 +1,189 @@
+import json
+import smtplib
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app.mailer import SMTPConnectionPool, BrevoClient, PostalClient
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """Minimal in-process SMTP server: counts connections, logins and accepted messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, reject=()):
+        self.reject = set(reject) # penerima yang ditolak dengan 550
+        self.connections = 0
+        self.logins = 0
+        self.messages = []
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), FakeSMTPHandler)
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 fake ESMTP')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-fake')
+                self.reply('250 AUTH PLAIN')
+            elif verb == 'AUTH':
+                with server.lock:
+                    server.logins += 1
+                self.reply('235 ok')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 ok')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip().strip('<>')
+                if address in server.reject:
+                    self.reply('550 no such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 ok')
+            elif verb == 'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with server.lock:
+                    server.messages.extend(recipients)
+                self.reply('250 queued')
+            elif verb in ('NOOP', 'RSET'):
+                self.reply('250 ok')
+            elif verb == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('502 not implemented')
+
+@pytest.fixture
+def smtp_server():
+    servers = []
+    def _start(**kwargs):
+        server = FakeSMTPServer(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    yield _start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def _pool(server):
+    host, port = server.server_address
+    return SMTPConnectionPool(host, port, user='user', password='secret', starttls=False, max_size=1)
+
+def test_pool_reuses_one_connection_and_login(smtp_server):
+    server = smtp_server()
+    pool = _pool(server)
+    for i in range(20):
+        pool.sendmail('noreply@example.com', f'customer{i}@example.com', f'Subject: test {i}\r\n\r\nhello')
+    pool.close()
+
+    assert len(server.messages) == 20
+    assert server.connections == 1
+    assert server.logins == 1
+    assert pool.connects == 1
+
+def test_rejected_recipient_keeps_connection_and_is_not_resent(smtp_server):
+    server = smtp_server(reject={'bad@example.com'})
+    pool = _pool(server)
+    pool.sendmail('noreply@example.com', 'first@example.com', 'Subject: a\r\n\r\nhello')
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        pool.sendmail('noreply@example.com', 'bad@example.com', 'Subject: b\r\n\r\nhello')
+    pool.sendmail('noreply@example.com', 'second@example.com', 'Subject: c\r\n\r\nhello')
+    pool.close()
+
+    assert server.messages == ['first@example.com', 'second@example.com']
+    assert server.connections == 1
+    assert server.logins == 1
+
+# --- HTTP API STUB ---
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.server.lock:
+            self.server.requests.append((self.path, payload))
+        status, body = self.server.respond(payload)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def api_server():
+    """api_server(respond) starts a local HTTP API; respond(payload) returns (status, json_body)."""
+    servers = []
+    def _start(respond):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubAPIHandler)
+        server.daemon_threads = True
+        server.respond = respond
+        server.requests = []
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}"
+    yield _start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_postal_batch_returns_per_message_results(api_server):
+    def respond(payload):
+        # Postal menjawab HTTP 200 juga untuk error
+        if payload['to'] == ['bad@example.com']:
+            return 200, {'status': 'error', 'data': {'message': 'Invalid recipient'}}
+        return 200, {'status': 'success', 'data': {'message_id': payload['to'][0]}}
+    server, url = api_server(respond)
+    client = PostalClient(url, 'key')
+    messages = [(f'c{i}@example.com', 'Subject', '<p>hi</p>') for i in range(5)]
+    messages.insert(2, ('bad@example.com', 'Subject', '<p>hi</p>'))
+
+    assert client.send_batch('noreply@example.com', 'Wahana', messages) == [True, True, False, True, True, True]
+    assert len(server.requests) == 6
+
+def _messages(count, start=0):
+    return [(f'c{i}@example.com', f'Pesanan {i}', f'<p>{i}</p>') for i in range(start, start + count)]
+
+def test_brevo_batch_of_100_is_one_request(api_server):
+    server, url = api_server(lambda payload: (201, {'messageIds': ['<id>'] * len(payload['messageVersions'])}))
+    client = BrevoClient('key', base_url=url)
+
+    assert client.send_batch('noreply@example.com', 'Wahana', _messages(100)) == [True] * 100
+    assert len(server.requests) == 1
+    path, payload = server.requests[0]
+    assert path == '/smtp/email'
+    assert [version['to'][0]['email'] for version in payload['messageVersions']] == [m[0] for m in _messages(100)]
+
+@pytest.mark.parametrize('status', [400, 500])
+def test_brevo_rejected_request_fails_only_its_chunk(api_server, status):
+    def respond(payload):
+        if payload['messageVersions'][0]['to'][0]['email'] == 'c100@example.com':
+            return status, {'code': 'invalid_parameter', 'message': 'rejected'}
+        return 201, {}
+    server, url = api_server(respond)
+    client = BrevoClient('key', base_url=url)
+
+    results = client.send_batch('noreply@example.com', 'Wahana', _messages(250))
+    assert results == [True] * 100 + [False] * 100 + [True] * 50
+    assert len(server.requests) == 3
@@ -0,0 +1,40 @@
+from sqlalchemy import inspect, text
+from app import db
+from app.migrations import add_missing_columns
+
+def _recreate_job_table_without(columns):
+    """Simulates an older database: the job table without some of its current columns."""
+    db.session.remove()
+    with db.engine.begin() as conn:
+        conn.execute(text('DROP TABLE job'))
+        keep = ', '.join(f'"{c.name}" {c.type.compile(dialect=db.engine.dialect)}'
+                         for c in db.metadata.tables['job'].columns if c.name not in columns)
+        conn.execute(text(f'CREATE TABLE job ({keep})'))
+        conn.execute(text("INSERT INTO job (id, kind, status) VALUES (1, 'email', 'done')"))
+
+def test_added_columns_get_scalar_defaults(app):
+    with app.app_context():
+        column = db.metadata.tables['job'].c.attempts
+        assert column.default is not None and column.default.is_scalar
+        _recreate_job_table_without({'attempts', 'progress'})
+
+        add_missing_columns()
+
+        names = {c['name'] for c in inspect(db.engine).get_columns('job')}
+        assert {'attempts', 'progress'} <= names
+        with db.engine.connect() as conn:
+            attempts = conn.execute(text('SELECT attempts FROM job WHERE id = 1')).scalar()
+        assert attempts == column.default.arg
+
+def test_not_null_column_without_default_is_skipped(app):
+    with app.app_context():
+        assert db.metadata.tables['job'].c.kind.nullable is False
+        _recreate_job_table_without({'progress'})
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE job DROP COLUMN kind'))
+
+        add_missing_columns()
+
+        names = {c['name'] for c in inspect(db.engine).get_columns('job')}
+        assert 'progress' in names
+        assert 'kind' not in names
@@ -0,0 +1,48 @@
+import base64
+import json
+from app import db
+from app.models import User, DepositTransaction
+from app.ledger import post_deposit_transaction
+
+def _reseller_with_deposits(app, count):
+    with app.app_context():
+        user = User(username='reseller1', password='x', name='Reseller', role='reseller', email='r1@example.com', deposit_balance=0)
+        db.session.add(user)
+        db.session.commit()
+        for i in range(count):
+            post_deposit_transaction(user.id, 1000, 'topup', description=f'Top-up {i}')
+        db.session.commit()
+        return user.id
+
+def test_reseller_statement_pages_past_first_page(app, client, login):
+    login('admin')
+    reseller_id = _reseller_with_deposits(app, 60)
+
+    response = client.get(f'/dashboard/reseller/edit/{reseller_id}')
+    assert response.status_code == 200
+    assert f'/dashboard/reseller/edit/{reseller_id}?cursor='.encode() in response.data
+
+    seen = []
+    url = f'/dashboard/reseller/edit/{reseller_id}?format=json'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        data = response.get_json()
+        seen.extend(item['id'] for item in data['items'])
+        url = data['next_url']
+        if url:
+            assert url.startswith(f'/dashboard/reseller/edit/{reseller_id}?')
+
+    with app.app_context():
+        expected = [tx.id for tx in DepositTransaction.query.filter_by(user_id=reseller_id)
+                    .order_by(DepositTransaction.created_at.desc(), DepositTransaction.id.desc())]
+    assert seen == expected
+    assert len(seen) == 60
+
+def test_crafted_cursor_is_ignored(app, client, login):
+    login('admin')
+    for values in ([{'a': 1}], [[1, 2]], {'id': 1}, 'abc'):
+        token = base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+        response = client.get(f'/dashboard/users?cursor={token}')
+        assert response.status_code == 200
+    assert client.get('/dashboard/users?cursor=not-base64!').status_code == 200
@@ -0,0 +1,81 @@
+import os
+import re
+import time
+from io import BytesIO
+from types import SimpleNamespace
+import pytest
+from reportlab import rl_config
+from app.pdf import render_etickets, cached_pdf, pdf_cache_dir, prune_pdf_cache, parse_pdf, page_tree, PdfPageWriter
+
+def _order(i):
+    return SimpleNamespace(
+        uuid=f'TIX-20261018-{i:06d}', invoice_number=f'INV-20261018-{i:04d}', visit_date='2026-10-20',
+        customer_name=f'Pengunjung {i}', payment_status='paid',
+        get_details=lambda: {'items': [{'name': 'Tiket Dewasa', 'qty': 2}], 'addons': []}
+    )
+
+def test_bulk_etickets_are_rendered_in_chunks(app):
+    events = []
+    def orders():
+        for i in range(25):
+            events.append(('order', i))
+            yield _order(i)
+
+    buffer = BytesIO()
+    with app.app_context():
+        render_etickets(orders(), 'Wahana Test', buffer, on_page=lambda page: events.append(('page', page)), chunk_size=10)
+
+    # Chunk berikutnya baru dibaca setelah halaman chunk sebelumnya ditulis
+    expected = []
+    for start, end in [(0, 10), (10, 20), (20, 25)]:
+        expected += [('order', i) for i in range(start, end)]
+        expected += [('page', i + 1) for i in range(start, end)]
+    assert events == expected
+
+    _assert_valid_pdf(buffer.getvalue(), pages=25)
+
+def _assert_valid_pdf(data, pages):
+    """Re-parses a merged PDF: one page tree with `pages` pages and no dangling references."""
+    objects, trailer = parse_pdf(data)
+    page_numbers, nodes = page_tree(objects, trailer)
+    assert len(page_numbers) == pages
+    assert len(nodes) == 1
+    (root,) = nodes
+    assert b'/Count %d ' % pages in objects[root]
+    for num in page_numbers:
+        assert b'/Parent %d 0 R' % root in objects[num]
+    for num, body in objects.items():
+        head = re.split(rb'>>\s*stream\r?\n', body, maxsplit=1)[0]
+        for ref in re.findall(rb'(\d+) 0 R', head):
+            assert int(ref) in objects, f"object {num} references missing object {ref}"
+    assert len(re.findall(rb'/Type /Catalog\b', data)) == 1
+
+@pytest.mark.parametrize('use_a85', [1, 0])
+def test_merged_chunks_reparse_with_binary_and_ascii_streams(app, monkeypatch, use_a85):
+    # Dengan useA85=0 isi stream biner; merger tidak boleh bergantung pada encoding stream
+    monkeypatch.setattr(rl_config, 'useA85', use_a85)
+    buffer = BytesIO()
+    with app.app_context():
+        render_etickets((_order(i) for i in range(7)), 'Wahana Test', buffer, chunk_size=3)
+    _assert_valid_pdf(buffer.getvalue(), pages=7)
+
+def test_unsupported_pdf_is_rejected():
+    with pytest.raises(ValueError):
+        PdfPageWriter(BytesIO()).add_document(b'%PDF-1.5\n1 0 obj\n<< >>\nendobj\nstartxref\n9\n%%EOF\n')
+
+def test_prune_pdf_cache_keeps_recently_used_files(app):
+    with app.app_context():
+        order = _order(1)
+        old_version = os.path.join(pdf_cache_dir(), f'eticket-{order.uuid}-0000000000000000.pdf')
+        with open(old_version, 'wb') as f:
+            f.write(b'%PDF-old')
+        path, _ = cached_pdf('eticket', order, 'Wahana Test', lambda: b'%PDF-new')
+        month_ago = time.time() - 31 * 86400
+        os.utime(old_version, (month_ago, month_ago))
+        os.utime(path, (month_ago, month_ago))
+
+        # Dipakai lagi: mtime diperbarui sehingga tidak ikut terhapus
+        assert cached_pdf('eticket', order, 'Wahana Test', lambda: b'%PDF-new')[0] == path
+        assert prune_pdf_cache(keep_days=30) == 1
+        assert not os.path.exists(old_version)
+        assert os.path.exists(path)
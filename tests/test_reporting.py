@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+from datetime import date, datetime
+from sqlalchemy import event
+from app import db
+from app.models import Order, DailySalesRollup
+from app.reporting import set_payment_status, record_paid_order, rebuild_rollups, sales_report, pax_counts
+
+DAY = date(2026, 10, 18)
+
+def _order(i, status='pending', created_at=datetime(2026, 10, 18, 3, 0)):
+    order = Order(uuid=f'TIX-TEST-{i}', invoice_number=f'INV-TEST-{i}', payment_status=status,
+                  total_price=150000 + i, created_at=created_at, details='{}')
+    order.add_line_items(
+        [{'name': 'Dewasa', 'qty': 2, 'price': 50000}, {'name': 'Anak', 'qty': 1, 'price': 50000}],
+        [{'name': 'Loker', 'price': 10000}]
+    )
+    db.session.add(order)
+    db.session.flush()
+    return order
+
+def _legacy_order(status='pending'):
+    # Order lama: item hanya di details JSON
+    order = Order(uuid='TIX-LEGACY', invoice_number='INV-LEGACY', payment_status=status, total_price=70000,
+                  created_at=datetime(2026, 10, 19, 1, 0),
+                  details='{"items": [{"name": "Dewasa", "qty": 1, "subtotal": 50000}], "addons": [{"name": "Loker", "price": 10000}]}')
+    db.session.add(order)
+    db.session.flush()
+    return order
+
+@contextmanager
+def _count_queries():
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+def _rollup():
+    return {(r.date, r.item_type, r.name): (r.qty, r.revenue, r.order_count)
+            for r in DailySalesRollup.query.all() if r.qty or r.revenue or r.order_count}
+
+def test_paid_adds_to_rollup_and_leaving_paid_subtracts(app):
+    with app.app_context():
+        first, second = _order(1), _order(2)
+        set_payment_status(first, 'paid')
+        set_payment_status(second, 'paid')
+        db.session.commit()
+
+        report = sales_report(DAY, DAY)
+        assert report['total_orders'] == 2
+        assert report['total_revenue'] == 300003
+        assert {row['name']: row['qty'] for row in report['ticket_report']} == {'Dewasa': 4, 'Anak': 2}
+        assert report['addon_report'] == [{'name': 'Loker', 'qty': 2, 'total': 20000}]
+
+        set_payment_status(first, 'cancelled')
+        set_payment_status(second, 'expired')
+        db.session.commit()
+        assert _rollup() == {}
+        assert sales_report(DAY, DAY)['total_orders'] == 0
+
+def test_same_status_twice_counts_once(app):
+    with app.app_context():
+        order = _order(1)
+        set_payment_status(order, 'paid')
+        set_payment_status(order, 'paid')
+        db.session.commit()
+        assert _rollup()[(DAY, 'order', '')] == (0, 150001, 1)
+
+        set_payment_status(order, 'expired')
+        set_payment_status(order, 'expired')
+        db.session.commit()
+        assert _rollup() == {}
+
+def test_rebuild_matches_incremental_rollup(app):
+    with app.app_context():
+        orders = [_order(i, created_at=datetime(2026, 10, 18 + i % 2, 20, 0)) for i in range(6)]
+        for order in orders[:4]:
+            set_payment_status(order, 'paid')
+        set_payment_status(orders[1], 'expired')
+        direct = _order(99, status='paid')
+        record_paid_order(direct)
+        legacy = _legacy_order()
+        set_payment_status(legacy, 'paid')
+        db.session.commit()
+
+        incremental = _rollup()
+        assert rebuild_rollups() == 5
+        assert _rollup() == incremental
+
+def test_rebuild_and_pax_counts_do_not_query_per_order(app):
+    with app.app_context():
+        orders = [_order(i, status='paid') for i in range(30)] + [_legacy_order(status='paid')]
+        db.session.commit()
+        db.session.expire_all()
+
+        with _count_queries() as statements:
+            assert rebuild_rollups() == 31
+        # orders + item + addon (selectin); tidak bertambah per order
+        assert len([s for s in statements if s.lstrip().upper().startswith('SELECT')]) == 3
+
+        orders = Order.query.order_by(Order.id).all()
+        with _count_queries() as statements:
+            counts = pax_counts(orders)
+        assert len(statements) == 1
+        assert counts == {**{o.id: 3 for o in orders[:-1]}, orders[-1].id: 1}